@@ -32,6 +32,9 @@ if not sys.warnoptions:
 from frescobaldi import toplevel
 toplevel.install()              # Add the path to frescobaldi to sys.path
 
+import multiprocessing
+multiprocessing.freeze_support()    # Run worker processes in a frozen app
+
 import checks                   # check whether Frescobaldi really can run
 
 import os
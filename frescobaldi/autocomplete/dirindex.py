@@ -0,0 +1,189 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Keeps an index of the LilyPond files and subdirectories in directories.
+
+This is used to complete filenames after \\include. A directory is listed
+only once; its entry is kept up to date by watching the directory. Use
+prefetch() to list directories in a background thread before they are
+needed. At most MAX_DIRECTORIES are kept, the least recently used ones are
+removed (and not watched anymore).
+
+"""
+
+
+import collections
+import os
+
+import background
+
+
+MAX_DIRECTORIES = 200
+
+_entries = collections.OrderedDict()    # directory -> (files, subdirectories)
+_scanning = set()   # directories being listed in the background
+_changed = set()    # directories that changed while being listed
+
+
+def listdir(path):
+    """Returns two tuples (files, directories) for the directory path.
+
+    Only LilyPond files are returned, and the directory names have an
+    os.sep appended. Hidden files and backup files are skipped.
+
+    """
+    files = []
+    dirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                name = entry.name
+                if entry.is_dir():
+                    if not name.startswith('.'):
+                        dirs.append(name + os.sep)
+                elif name[0] not in '.~':
+                    ext = os.path.splitext(name)[1]
+                    if ext.lower() in ('.ly', '.lyi', '.ily'):
+                        files.append(name)
+    except (OSError, UnicodeDecodeError):
+        # this only happens when there are filenames in the wrong encoding,
+        # but never ever bug the user about this while typing :)
+        pass
+    return tuple(files), tuple(dirs)
+
+
+def names(path, directories=False):
+    """Returns a tuple of the LilyPond files in the directory path.
+
+    If directories is True, the names of subdirectories (ending with
+    os.sep) are also returned. The directory is only listed if it is not
+    yet in the index.
+
+    """
+    try:
+        files, dirs = _entries[path]
+    except KeyError:
+        files, dirs = _store(path, listdir(path))
+    else:
+        _entries.move_to_end(path)
+    return files + dirs if directories else files
+
+
+def prefetch(paths):
+    """Lists the directories that are not yet in the index in the background."""
+    paths = set(paths) - _scanning - set(_entries)
+    if paths:
+        _scanning.update(paths)
+        # watch before listing, so changes during the listing are noticed
+        for path in paths:
+            _watch(path)
+        Scanner(paths).start()
+
+
+def invalidate(path):
+    """Removes the directory from the index, it is listed again when needed."""
+    _entries.pop(path, None)
+
+
+def _store(path, entry):
+    """Stores the entry for the path and starts watching the directory.
+
+    If there are too many entries, the least recently used ones are removed.
+
+    """
+    _entries[path] = entry
+    _entries.move_to_end(path)
+    _watch(path)
+    while len(_entries) > MAX_DIRECTORIES:
+        old = next(iter(_entries))
+        del _entries[old]
+        if old not in _scanning:
+            _watcher.removePath(old)
+    return entry
+
+
+def _watch(path):
+    """Starts watching the directory path if it exists."""
+    if os.path.isdir(path):
+        _watcher.addPath(path)
+
+
+def _directoryChanged(path):
+    """Called when a watched directory changes; lists it again."""
+    invalidate(path)
+    if path in _scanning:
+        # the running listing may be stale, list again when it has finished
+        _changed.add(path)
+    else:
+        prefetch([path])
+
+
+_watcher = background.Watcher(_directoryChanged)
+
+
+class Scanner(background.Thread):
+    """Lists directories in a background thread and stores them in the index."""
+    def __init__(self, paths):
+        super().__init__()
+        self._paths = list(paths)
+        self._entries = {}
+        self.finished.connect(self._finished)
+
+    def run(self):
+        for path in self._paths:
+            self._entries[path] = listdir(path)
+
+    def _finished(self):
+        """Called in the main thread when listing has finished."""
+        changed = []
+        for path, entry in self._entries.items():
+            _scanning.discard(path)
+            if path in _changed:
+                _changed.discard(path)
+                changed.append(path)
+            else:
+                _store(path, entry)
+        prefetch(changed)
+
+
+if __name__ == '__main__':
+    """Compare listing a tree with 10,000 files with querying the index."""
+    import tempfile
+    import time
+    from PyQt6.QtCore import QCoreApplication
+    a = QCoreApplication([])
+    with tempfile.TemporaryDirectory() as root:
+        dirs = [root] + [os.path.join(root, f"dir{i}") for i in range(100)]
+        for d in dirs[1:]:
+            os.mkdir(d)
+        for i in range(10000):
+            open(os.path.join(dirs[i % len(dirs)], f"file{i}.ily"), 'w').close()
+        t0 = time.perf_counter()
+        for d in dirs:
+            listdir(d)
+        t1 = time.perf_counter()
+        for d in dirs:
+            names(d, True)
+        t2 = time.perf_counter()
+        for d in dirs:
+            names(d, True)
+        t3 = time.perf_counter()
+        print('{0} dirs, listing: {1:.4f}s, first query: {2:.4f}s, cached query: {3:.6f}s'.format(
+            len(dirs), t1 - t0, t2 - t1, t3 - t2))
@@ -26,40 +26,100 @@ import itertools
 import os
 import platform
 
+import app
 import listmodel
 import plugin
+import symbolindex
 import ly.words
 import ly.data
 
 from . import completiondata
+from . import dirindex
 from . import harvest
 from . import util
 
 
+# changed when a file that is included by a document changes
+_include_revision = 0
+
+
 def doc(document):
     """Returns the DocumentDataSource for the specified Document."""
     return DocumentDataSource.instance(document)
 
 
+def document_revision(source):
+    """Returns the revision of the document, for the document-wide harvests."""
+    return source.document().revision()
+
+
+def revision(source, cursor):
+    """Returns a value that changes when the cached completions may change.
+
+    This is the revision of the document and of the include files. The
+    cursor is not used, the key functions check the names at the cursor
+    when the revision changed.
+
+    """
+    return source.document().revision(), _include_revision
+
+
+def words_key(source):
+    """Returns a value that changes when words are added or removed."""
+    return harvest.index(source.document()).changes
+
+
+def identifiers_key(source, cursor):
+    """Returns the identifiers known at the cursor, to see if they changed."""
+    return frozenset(itertools.chain(
+        harvest.include_identifiers(cursor),
+        harvest.names(cursor)))
+
+
+def markup_key(source, cursor):
+    """Returns the markup commands and words, to see if they changed."""
+    return frozenset(itertools.chain(
+        harvest.markup_commands(cursor),
+        harvest.include_markup_commands(cursor))), words_key(source)
+
+
+def _include_file_changed(filename):
+    """Called when a file changed that is included by a document."""
+    global _include_revision
+    _include_revision += 1
+
+
+symbolindex.fileChanged.connect(_include_file_changed)
+
+
+def _settings_changed():
+    """Called when the settings change; the include path could be changed."""
+    for source in DocumentDataSource.instances():
+        source.invalidate()
+
+
+app.settingsChanged.connect(_settings_changed)
+
+
 class DocumentDataSource(plugin.DocumentPlugin):
-    @util.keep
+    def invalidate(self):
+        """Forgets all cached completions for our document."""
+        util.invalidate(self)
+
+    @util.keep(document_revision, words_key)
     def words(self):
         """Returns the list of words in comments, markup etc."""
-        return listmodel.ListModel(
-            sorted(set(harvest.words(self.document()))))
+        return listmodel.ListModel(sorted(harvest.words(self.document())))
 
-    @util.keep
+    @util.keep(document_revision, words_key)
     def schemewords(self):
         """Scheme names, including those harvested from document."""
         schemewords = set(itertools.chain(
             ly.data.all_scheme_words(),
-            (str(t)
-                for t in harvest.schemewords(self.document())
-                if len(t) > 2),
-            ))
+            (w for w in harvest.schemewords(self.document()) if len(w) > 2)))
         return listmodel.ListModel(sorted(schemewords))
 
-    @util.keep
+    @util.keep(revision, markup_key)
     def markup(self, cursor):
         """Completes markup commands and normal text from the document."""
         return listmodel.ListModel(
@@ -67,9 +127,9 @@ class DocumentDataSource(plugin.DocumentPlugin):
             + [ '\\' + w for w in sorted(set(itertools.chain(
                 harvest.markup_commands(cursor),
                 harvest.include_markup_commands(cursor))))]
-            + sorted(set(harvest.words(self.document()))))
+            + sorted(harvest.words(self.document())))
 
-    @util.keep
+    @util.keep(revision, identifiers_key)
     def scorecommands(self, cursor):
         """Stuff inside \\score { }. """
         return listmodel.ListModel(sorted(set(itertools.chain(
@@ -77,7 +137,7 @@ class DocumentDataSource(plugin.DocumentPlugin):
             harvest.include_identifiers(cursor),
             harvest.names(cursor)))), display = util.command)
 
-    @util.keep
+    @util.keep(revision, identifiers_key)
     def bookpartcommands(self, cursor):
         """Stuff inside \\bookpart { }. """
         return listmodel.ListModel(sorted(set(itertools.chain(
@@ -85,7 +145,7 @@ class DocumentDataSource(plugin.DocumentPlugin):
             harvest.include_identifiers(cursor),
             harvest.names(cursor)))), display = util.command)
 
-    @util.keep
+    @util.keep(revision, identifiers_key)
     def bookcommands(self, cursor):
         """Stuff inside \\book { }. """
         return listmodel.ListModel(sorted(set(itertools.chain(
@@ -94,7 +154,7 @@ class DocumentDataSource(plugin.DocumentPlugin):
             harvest.names(cursor)))), display = util.command)
 
 
-    @util.keep
+    @util.keep(revision, identifiers_key)
     def musiccommands(self, cursor):
         return listmodel.ListModel(sorted(set(itertools.chain(
             ly.words.lilypond_keywords,
@@ -107,7 +167,7 @@ class DocumentDataSource(plugin.DocumentPlugin):
             harvest.include_identifiers(cursor),
             harvest.names(cursor)))), display = util.command)
 
-    @util.keep
+    @util.keep(revision, identifiers_key)
     def lyriccommands(self, cursor):
         return listmodel.ListModel(sorted(set(itertools.chain(
             ('set stanza = ', 'set', 'override', 'markup', 'notemode', 'repeat'),
@@ -132,9 +192,9 @@ class DocumentDataSource(plugin.DocumentPlugin):
             if directory:
                 basedir = os.path.join(basedir, directory)
                 names.extend(sorted(os.path.join(directory, f)
-                    for f in get_filenames(basedir, True)))
+                    for f in dirindex.names(basedir, True)))
             else:
-                names.extend(sorted(get_filenames(basedir, True)))
+                names.extend(sorted(dirindex.names(basedir, True)))
 
         # names in specified include paths
         import documentinfo
@@ -143,7 +203,7 @@ class DocumentDataSource(plugin.DocumentPlugin):
             # store dir relative to specified include path root
             reldir = directory if directory else ""
             # look for files in the current relative directory
-            for f in sorted(get_filenames(os.path.join(basedir, reldir), True)):
+            for f in sorted(dirindex.names(os.path.join(basedir, reldir), True)):
                 names.append(os.path.join(reldir, f))
 
         # names from LilyPond itself
@@ -151,7 +211,7 @@ class DocumentDataSource(plugin.DocumentPlugin):
         if datadir:
             basedir = os.path.join(datadir, 'ly')
             # get the filenames but avoid the -init files here
-            names.extend(sorted(f for f in get_filenames(basedir)
+            names.extend(sorted(f for f in dirindex.names(basedir)
                 if not f.endswith('init.ly')
                 and f.islower()))
 
@@ -162,20 +222,17 @@ class DocumentDataSource(plugin.DocumentPlugin):
         return listmodel.ListModel(names)
 
 
-def get_filenames(path, directories = False):
-    try:
-        for root, dirs, files in os.walk(path):
-            for f in files:
-                if f and f[0] not in '.~':
-                    name, ext = os.path.splitext(f)
-                    if ext.lower() in ('.ly', '.lyi', '.ily'):
-                        yield f
-            if directories:
-                for f in dirs:
-                    if f and not f.startswith('.'):
-                        yield f + os.sep
-            return
-    except UnicodeDecodeError:
-        # this only happens when there are filenames in the wrong encoding,
-        # but never ever bug the user about this while typing :)
-        pass
+def prefetch_includenames(document):
+    """Lists the directories includenames() uses in the background."""
+    import documentinfo
+    paths = list(documentinfo.info(document).includepath())
+    path = document.url().toLocalFile()
+    if path:
+        paths.append(os.path.dirname(path))
+    dirindex.prefetch(paths)
+
+
+app.documentLoaded.connect(prefetch_includenames)
+# documents that were loaded before this module was imported
+for d in app.documents:
+    prefetch_includenames(d)
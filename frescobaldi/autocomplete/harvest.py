@@ -22,11 +22,15 @@ Harvest strings from document for autocompletion purposes.
 """
 
 
-import itertools
+import collections
 import re
+import weakref
 
+import cursortools
 import documentinfo
-import fileinfo
+import highlighter
+import plugin
+import symbolindex
 import tokeniter
 import ly.lex.lilypond
 import ly.lex.scheme
@@ -50,25 +54,19 @@ def markup_commands(cursor):
 
 def schemewords(document):
     """Harvests all schemewords from the document."""
-    for t in tokeniter.all_tokens(document):
-        if type(t) is ly.lex.scheme.Word:
-            yield t
+    return index(document).schemewords()
 
 
 def include_identifiers(cursor):
     """Harvests identifier definitions from included files."""
     dinfo = documentinfo.info(cursor.document())
-    files = fileinfo.includefiles(get_docinfo(cursor), dinfo.includepath())
-    return itertools.chain.from_iterable(fileinfo.docinfo(f).definitions()
-                                         for f in files)
+    return symbolindex.index(get_docinfo(cursor), dinfo.includepath()).definitions.keys()
 
 
 def include_markup_commands(cursor):
     """Harvest markup command definitions from included files."""
     dinfo = documentinfo.info(cursor.document())
-    files = fileinfo.includefiles(get_docinfo(cursor), dinfo.includepath())
-    return itertools.chain.from_iterable(fileinfo.docinfo(f).markup_definitions()
-                                         for f in files)
+    return symbolindex.index(get_docinfo(cursor), dinfo.includepath()).markup.keys()
 
 
 _words = re.compile(r'\w{5,}|\w{2,}(?:[:-]\w+)+').finditer
@@ -78,8 +76,79 @@ _word_types = (
 
 def words(document):
     """Harvests words from strings, lyrics, markup and comments."""
-    for t in tokeniter.all_tokens(document):
+    return index(document).words()
+
+
+def block_words(tokens):
+    """Returns two sets (words, schemewords) harvested from a block's tokens."""
+    words = set()
+    schemewords = set()
+    for t in tokens:
         if isinstance(t, _word_types):
-            for m in _words(t):
-                yield m.group()
+            words.update(m.group() for m in _words(t))
+        elif type(t) is ly.lex.scheme.Word:
+            schemewords.add(str(t))
+    return words, schemewords
+
+
+def index(document):
+    """Returns the WordIndex for the document."""
+    return WordIndex.instance(document)
+
+
+class WordIndex(plugin.DocumentPlugin):
+    """Keeps the words and scheme words of a document up to date.
+
+    The words are harvested per block, every time the highlighter tokenizes
+    a block, and counted, so a word disappears when the last block
+    containing it is changed or removed. The changes attribute is
+    incremented every time a word is added or disappears.
+
+    """
+    def __init__(self, document):
+        self._words = collections.Counter()
+        self._schemewords = collections.Counter()
+        self._blocks = {}   # weak reference to block user data -> (words, schemewords)
+        self.changes = 0
+        highlighter.highlighter(document).tokensChanged.connect(self.update)
+        for block in cursortools.all_blocks(document):
+            self.update(cursortools.data(block), tokeniter.tokens(block))
+
+    def words(self):
+        """Returns the words in the document."""
+        return self._words.keys()
+
+    def schemewords(self):
+        """Returns the scheme words in the document."""
+        return self._schemewords.keys()
+
+    def update(self, data, tokens):
+        """Called when the block with the user data got new tokens."""
+        entry = block_words(tokens)
+        ref = weakref.ref(data, self._remove)
+        old = self._blocks.pop(ref, None) or (set(), set())
+        self._blocks[ref] = entry
+        for counter, words, old_words in zip(
+                (self._words, self._schemewords), entry, old):
+            self._count(counter, words - old_words, 1)
+            self._count(counter, old_words - words, -1)
+
+    def _remove(self, ref):
+        """Called when the user data of a removed block is deleted."""
+        entry = self._blocks.pop(ref, None)
+        if entry:
+            for counter, words in zip((self._words, self._schemewords), entry):
+                self._count(counter, words, -1)
+
+    def _count(self, counter, words, add):
+        """Adds 1 or -1 to the count of the words, tracking changes."""
+        for word in words:
+            count = counter[word] + add
+            if count:
+                counter[word] = count
+                if count == 1 and add == 1:
+                    self.changes += 1
+            else:
+                del counter[word]
+                self.changes += 1
 
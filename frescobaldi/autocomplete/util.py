@@ -23,30 +23,53 @@ Utility functions used in the autocomplete package.
 
 
 import functools
-import time
 import weakref
 
 
-def keep(f):
-    """Returns a decorator that remembers its return value for some time."""
-    _delay = 5.0 # sec
-    _cache = weakref.WeakKeyDictionary()
-    @functools.wraps(f)
-    def decorator(self, *args):
-        try:
-            result = _cache[self]
-        except KeyError:
-            pass
-        else:
-            t, ret = result
-            if (time.time() - t) < _delay:
-                return ret
-        ret = f(self, *args)
-        _cache[self] = (time.time(), ret)
-        return ret
+_caches = []
+
+
+def keep(revision, key=None):
+    """Returns a decorator that caches the return value of a method.
+
+    The value is kept as long as revision(self, *args) returns the same
+    value. If the revision changed and a key function is given, the value is
+    still kept if key(self, *args) returns the same value as before, so the
+    method is only called again when the data it uses really changed.
+
+    Use invalidate() to forget the values cached for an object.
+
+    """
+    def decorator(f):
+        cache = weakref.WeakKeyDictionary()
+        _caches.append(cache)
+        @functools.wraps(f)
+        def wrapper(self, *args):
+            rev = revision(self, *args)
+            try:
+                cached_rev, cached_key, ret = cache[self]
+            except KeyError:
+                k = key(self, *args) if key else None
+            else:
+                if rev == cached_rev:
+                    return ret
+                k = key(self, *args) if key else None
+                if key and k == cached_key:
+                    cache[self] = (rev, k, ret)
+                    return ret
+            ret = f(self, *args)
+            cache[self] = (rev, k, ret)
+            return ret
+        return wrapper
     return decorator
 
 
+def invalidate(obj):
+    """Forgets all values cached with keep() for the object."""
+    for cache in _caches:
+        cache.pop(obj, None)
+
+
 # helper functions for displaying data from models
 def command(item):
     """Prepends '\\' to item."""
@@ -0,0 +1,135 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Helpers for the caches and indices that are kept up to date in the background.
+
+Watcher watches files and directories using one QFileSystemWatcher that is
+shared by all Watchers, and Thread is a QThread that keeps a reference to
+itself while running, so it can be started and forgotten.
+
+"""
+
+
+from PyQt6.QtCore import QFileSystemWatcher, QThread
+
+
+# the shared QFileSystemWatcher instance
+_watcher = None
+
+# path -> set of the Watchers watching it
+_paths = {}
+
+
+def _qwatcher():
+    """Returns the shared QFileSystemWatcher, creating it if needed."""
+    global _watcher
+    if _watcher is None:
+        _watcher = QFileSystemWatcher()
+        _watcher.fileChanged.connect(_changed)
+        _watcher.directoryChanged.connect(_changed)
+    return _watcher
+
+
+def _changed(path):
+    """Called when a watched file or directory changed."""
+    if path not in _watcher.files() and path not in _watcher.directories():
+        # the path was removed or replaced and is not watched anymore
+        watchers = _paths.pop(path, ())
+        for w in watchers:
+            w._paths.discard(path)
+    else:
+        watchers = _paths.get(path, ())
+    for w in list(watchers):
+        w._changed(path)
+
+
+class Watcher:
+    """Watches files and directories using the shared QFileSystemWatcher.
+
+    The changed function is called with the path when a watched file or
+    directory changes. A path is removed from the QFileSystemWatcher when
+    no Watcher watches it anymore.
+
+    A file that is removed or replaced is not watched anymore after its
+    change has been reported.
+
+    """
+    def __init__(self, changed):
+        self._changed = changed
+        self._paths = set()
+
+    def __contains__(self, path):
+        return path in self._paths
+
+    def paths(self):
+        """Returns the set of the watched paths."""
+        return set(self._paths)
+
+    def addPath(self, path):
+        """Starts watching the path, returns True if it is watched."""
+        if path not in self._paths:
+            try:
+                watchers = _paths[path]
+            except KeyError:
+                if not _qwatcher().addPath(path):
+                    return False
+                watchers = _paths[path] = set()
+            watchers.add(self)
+            self._paths.add(path)
+        return True
+
+    def addPaths(self, paths):
+        """Starts watching the paths."""
+        for path in paths:
+            self.addPath(path)
+
+    def removePath(self, path):
+        """Stops watching the path."""
+        if path in self._paths:
+            self._paths.discard(path)
+            watchers = _paths[path]
+            watchers.discard(self)
+            if not watchers:
+                del _paths[path]
+                _watcher.removePath(path)
+
+    def removePaths(self, paths):
+        """Stops watching the paths."""
+        for path in list(paths):
+            self.removePath(path)
+
+
+class Thread(QThread):
+    """A QThread that keeps a reference to itself while running.
+
+    Subclasses implement run(). Connect to the finished() signal to use
+    the results.
+
+    """
+    _running = set()    # keep references to running threads
+
+    def __init__(self):
+        super().__init__()
+        self.finished.connect(lambda: self._running.discard(self))
+
+    def start(self):
+        """Reimplemented to keep a reference while running."""
+        self._running.add(self)
+        super().start()
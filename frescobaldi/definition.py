@@ -27,8 +27,11 @@ from PyQt6.QtGui import QTextCursor
 
 import app
 import documentinfo
+import fileinfo
+import lydocument
 import ly.music.items
 import browseriface
+import symbolindex
 
 
 def refnode(cursor):
@@ -43,13 +46,34 @@ def refnode(cursor):
 
 
 def target(node):
-    """Return the target node (where the node is defined)."""
-    value = node.value()
-    if value:
-        target = value.parent()
-        if isinstance(target, ly.music.items.Document):
-            target = value # happens with #(define-markup-command ...)
-        return target
+    """Return the target node (where the node is defined).
+
+    The definitions before the node in its own document are searched first,
+    then the definitions in the files included before the node, using the
+    symbol index.
+
+    """
+    root = node
+    for root in node.ancestors():
+        pass
+    lydoc = node.document
+    if isinstance(lydoc, lydocument.Document):
+        # an open document
+        dinfo = documentinfo.info(lydoc.document).lydocinfo()
+    else:
+        # an included file
+        dinfo = fileinfo.docinfo(lydoc.filename)
+    dinfo = dinfo.range(0, node.position)
+    name = node.name()
+    definitions, markup = symbolindex.symbols(dinfo)
+    symbol = definitions.get(name) or markup.get(name)
+    if not symbol:
+        include_path = getattr(root, 'include_path', ())
+        symbol = symbolindex.index(dinfo, include_path).lookup(name)
+        if not symbol:
+            return
+        root = fileinfo.music(symbol.filename)
+    return symbolindex.toplevel_item(root, symbol.position)
 
 
 def goto_definition(mainwindow, cursor=None):
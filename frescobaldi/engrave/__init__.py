@@ -32,6 +32,7 @@ import app
 import actioncollection
 import actioncollectionmanager
 import documentinfo
+import includegraph
 import job.attributes
 import job.lilypond
 import plugin
@@ -60,6 +61,7 @@ class Engraver(plugin.MainWindowPlugin):
         ac.engrave_publish.triggered.connect(self.engravePublish)
         ac.engrave_debug.triggered.connect(self.engraveLayoutControl)
         ac.engrave_custom.triggered.connect(self.engraveCustom)
+        ac.engrave_dependents.triggered.connect(self.engraveDependents)
         ac.engrave_abort.triggered.connect(self.engraveAbort)
         ac.engrave_autocompile.toggled.connect(self.engraveAutoCompileToggled)
         ac.engrave_open_lilypond_datadir.triggered.connect(self.openLilyPondDatadir)
@@ -106,6 +108,7 @@ class Engraver(plugin.MainWindowPlugin):
         ac.engrave_preview.setEnabled(not visible)
         ac.engrave_publish.setEnabled(not visible)
         ac.engrave_debug.setEnabled(not visible)
+        ac.engrave_dependents.setEnabled(bool(self.dependentFiles()))
         ac.engrave_abort.setEnabled(running)
         ac.engrave_runner.setIcon(icons.get('process-stop' if visible else 'lilypond-run'))
         ac.engrave_runner.setToolTip(_("Abort engraving job") if visible else
@@ -168,6 +171,29 @@ class Engraver(plugin.MainWindowPlugin):
             self.saveDocumentIfDesired()
             self.runJob(dlg.getJob(doc), doc)
 
+    def dependentFiles(self):
+        """Return the master files that include the current document."""
+        doc = self.mainwindow().currentDocument()
+        filename = doc and doc.url().toLocalFile()
+        if filename:
+            return includegraph.masters(os.path.realpath(filename))
+        return set()
+
+    def engraveDependents(self):
+        """Engraves all master files that include the current document.
+
+        The files are known from the include graph, which is updated every
+        time the includes of a document are looked up.
+
+        """
+        self.saveDocumentIfDesired()
+        for filename in sorted(self.dependentFiles()):
+            try:
+                doc = app.openUrl(QUrl.fromLocalFile(filename))
+            except OSError:
+                continue
+            self.engrave('preview', doc, False)
+
     def engrave(self, mode='preview', document=None, may_save=True):
         """Starts an engraving job.
 
@@ -378,6 +404,7 @@ class Actions(actioncollection.ActionCollection):
         self.engrave_publish = QAction(parent)
         self.engrave_debug = QAction(parent)
         self.engrave_custom = QAction(parent)
+        self.engrave_dependents = QAction(parent)
         self.engrave_abort = QAction(parent)
         self.engrave_autocompile = QAction(parent)
         self.engrave_autocompile.setCheckable(True)
@@ -393,6 +420,7 @@ class Actions(actioncollection.ActionCollection):
         self.engrave_publish.setIcon(icons.get('lilypond-run'))
         self.engrave_debug.setIcon(icons.get('lilypond-run'))
         self.engrave_custom.setIcon(icons.get('lilypond-run'))
+        self.engrave_dependents.setIcon(icons.get('lilypond-run'))
         self.engrave_abort.setIcon(icons.get('process-stop'))
 
 
@@ -403,6 +431,9 @@ class Actions(actioncollection.ActionCollection):
         self.engrave_publish.setText(_("Engrave (&publish)"))
         self.engrave_debug.setText(_("Engrave (&layout control)"))
         self.engrave_custom.setText(_("Engrave (&custom)..."))
+        self.engrave_dependents.setText(_("Engrave &Dependent Documents"))
+        self.engrave_dependents.setToolTip(_(
+            "Engrave the documents that include the current document"))
         self.engrave_abort.setText(_("Abort Engraving &Job"))
         self.engrave_autocompile.setText(_("Automatic E&ngrave"))
         self.engrave_open_lilypond_datadir.setText(_("Open LilyPond &Data Directory"))
@@ -22,6 +22,7 @@ Caches information about files, and checks the mtime upon request.
 """
 
 
+import collections
 import os
 import weakref
 
@@ -31,28 +32,60 @@ class FileCache:
 
     Has __setitem__, __getitem__, __delitem__, clear etc. methods like a dict.
 
+    If maxsize is given, the least recently used entries are removed when
+    the total size of the values exceeds it. The size of a value is computed
+    by the size function, by default every value counts as 1.
+
+    Instead of checking the mtime on every lookup, the files can be watched
+    by calling watch(); then entries are invalidated when the watcher
+    reports a changed file. The mtime is still checked for files the watcher
+    could not watch (e.g. when the system limit of watches is reached).
+
+    The hits and misses attributes count the lookups.
+
     """
-    def __init__(self):
-        self._cache = {}
+    def __init__(self, maxsize=0, size=None):
+        self._cache = collections.OrderedDict()
+        self._watcher = None
+        self.maxsize = maxsize
+        self.size = size or (lambda value: 1)
+        self.currentsize = 0
+        self.hits = 0
+        self.misses = 0
 
     def __getitem__(self, filename):
-        mtime, value = self._cache[filename]
         try:
-            if mtime == os.path.getmtime(filename):
-                return value
-        except OSError:
-            pass
-        del self._cache[filename]
+            mtime, value, size = self._cache[filename]
+        except KeyError:
+            self.misses += 1
+            raise
+        if self._valid(filename, mtime):
+            self._cache.move_to_end(filename)
+            self.hits += 1
+            return value
+        self._remove(filename)
+        self.misses += 1
         raise KeyError
 
     def __setitem__(self, filename, value):
         try:
-            self._cache[filename] = (os.path.getmtime(filename), value)
+            mtime = os.path.getmtime(filename)
         except OSError:
-            pass
+            return
+        if filename in self._cache:
+            self._remove(filename)
+        size = self.size(value)
+        self._cache[filename] = (mtime, value, size)
+        self.currentsize += size
+        self._watch(filename)
+        if self.maxsize:
+            while self.currentsize > self.maxsize and len(self._cache) > 1:
+                self._remove(next(iter(self._cache)))
 
     def __delitem__(self, filename):
-        del self._cache[filename]
+        if filename not in self._cache:
+            raise KeyError(filename)
+        self._remove(filename)
 
     def __contains__(self, filename):
         try:
@@ -61,24 +94,67 @@ class FileCache:
         except KeyError:
             return False
 
+    def __len__(self):
+        return len(self._cache)
+
+    def _valid(self, filename, mtime):
+        """Returns True if the file did not change since it was cached."""
+        if self._watcher and filename in self._watcher:
+            return True
+        try:
+            return mtime == os.path.getmtime(filename)
+        except OSError:
+            return False
+
+    def _remove(self, filename):
+        """Removes the entry for the filename."""
+        mtime, value, size = self._cache.pop(filename)
+        self.currentsize -= size
+        if self._watcher:
+            self._watcher.removePath(filename)
+
+    def _watch(self, filename):
+        """Adds the file to the watcher, if set and if the watcher accepts it."""
+        if self._watcher:
+            self._watcher.addPath(filename)
+
+    def watch(self):
+        """Watches the files (see background.Watcher) to invalidate changed files.
+
+        The mtime is then not checked anymore on every lookup.
+
+        """
+        import background
+        self._watcher = background.Watcher(self.invalidate)
+        for filename in self._cache:
+            self._watch(filename)
+
+    def invalidate(self, filename):
+        """Forgets the cached value for the file, if any."""
+        if filename in self._cache:
+            self._remove(filename)
+
     def filename(self, value):
         """Returns the filename of the cached value (if available)."""
         for filename in self.filenames():
-            mtime, obj = self._cache[filename]
+            mtime, obj, size = self._cache[filename]
             if obj == value:
                 return filename
 
     def filenames(self):
         """Yields filenames that are still valid in the cache."""
         for filename in list(self._cache):
-            try:
-                self[filename]
+            mtime, value, size = self._cache[filename]
+            if self._valid(filename, mtime):
                 yield filename
-            except KeyError:
-                pass
+            else:
+                self._remove(filename)
 
     def clear(self):
+        if self._watcher:
+            self._watcher.removePaths(self._watcher.paths())
         self._cache.clear()
+        self.currentsize = 0
 
 
 class WeakFileCache(FileCache):
@@ -89,22 +165,26 @@ class WeakFileCache(FileCache):
 
     """
     def __getitem__(self, filename):
-        mtime, valueref = self._cache[filename]
+        try:
+            mtime, valueref, size = self._cache[filename]
+        except KeyError:
+            self.misses += 1
+            raise
         value = valueref()
-        if value is not None:
-            try:
-                if mtime == os.path.getmtime(filename):
-                    return value
-            except OSError:
-                pass
-        del self._cache[filename]
+        if value is not None and self._valid(filename, mtime):
+            self._cache.move_to_end(filename)
+            self.hits += 1
+            return value
+        self._remove(filename)
+        self.misses += 1
         raise KeyError
 
     def __setitem__(self, filename, value):
-        valueref = weakref.ref(value)
-        try:
-            self._cache[filename] = (os.path.getmtime(filename), valueref)
-        except OSError:
-            pass
-
+        super().__setitem__(filename, weakref.ref(value))
 
+    def filename(self, value):
+        """Returns the filename of the cached value (if available)."""
+        for filename in self.filenames():
+            mtime, ref, size = self._cache[filename]
+            if ref() == value:
+                return filename
@@ -30,12 +30,17 @@ import atexit
 import ly.document
 import lydocinfo
 import ly.lex
+import app
 import filecache
+import includegraph
 import util
 import variables
 
 
-_document_cache = filecache.FileCache()
+# the cached documents may together contain this many characters of text
+MAX_CACHED_TEXT = 8 * 1024 * 1024
+
+_document_cache = filecache.FileCache(MAX_CACHED_TEXT, lambda c: c.size)
 _suffix_chars_re = re.compile(r'[^-\w]', re.UNICODE)
 
 
@@ -52,6 +57,7 @@ class _CachedDocument:
     variables = None
     docinfo = None
     music = None
+    size = 0
 
 
 def _cached(filename):
@@ -62,13 +68,32 @@ def _cached(filename):
     except KeyError:
         with open(filename, 'rb') as f:
             text = util.decode(f.read())
-        c = _document_cache[filename] = _CachedDocument()
+        c = _CachedDocument()
+        c.size = len(text)
         c.variables = v = variables.variables(text)
         c.document = ly.document.Document(text, v.get("mode"))
         c.filename = c.document.filename = filename
+        _document_cache[filename] = c
     return c
 
 
+def cache_stats():
+    """Return a dictionary with statistics about the document cache."""
+    return {
+        'hits': _document_cache.hits,
+        'misses': _document_cache.misses,
+        'documents': len(_document_cache),
+        'size': _document_cache.currentsize,
+        'maxsize': _document_cache.maxsize,
+    }
+
+
+@app.oninit
+def _watch():
+    """Invalidate cached documents on change instead of checking their mtime."""
+    _document_cache.watch()
+
+
 def document(filename):
     """Return a (cached) ly.document.Document for the filename."""
     return _cached(filename).document
@@ -107,6 +132,15 @@ def textmode(text, guess=True):
 def includefiles(dinfo, include_path=()):
     """Returns a set of filenames that are included by the DocInfo's document.
 
+    See include_order().
+
+    """
+    return set(include_order(dinfo, include_path))
+
+
+def include_order(dinfo, include_path=(), missing=None):
+    """Returns a list of filenames that are included by the DocInfo's document.
+
     The specified include path is used to find files. The own filename
     is NOT added to the set. Included files are checked recursively,
     relative to our file, relative to the including file, and if that
@@ -115,32 +149,62 @@ def includefiles(dinfo, include_path=()):
     If the document has no local filename, only the include_path is
     searched for files.
 
+    The files are in the order their contents are included, every file
+    after the files it includes itself.
+
+    The include arguments of an included file are stored in the includegraph,
+    and only read again when the file has changed on disk.
+
+    If missing is a set, the paths where an included file that was not found
+    has been looked for are added to it.
+
     """
     filename = dinfo.document.filename
     basedir = os.path.dirname(filename) if filename else None
     files = set()
+    order = []
 
-    def tryarg(directory, arg):
-        path = os.path.realpath(os.path.join(directory, arg))
-        if path not in files and os.path.isfile(path):
-            files.add(path)
+    def visit(path):
+        files.add(path)
+        mtime = os.path.getmtime(path)
+        args = includegraph.lookup(path, mtime)
+        if args is None:
             args = docinfo(path).include_args()
-            find(args, os.path.dirname(path))
+        includes = find(args, os.path.dirname(path))
+        includegraph.update(path, args, includes, mtime)
+        order.append(path)
+
+    def tryarg(directory, arg, found):
+        path = os.path.realpath(os.path.join(directory, arg))
+        if path in files:
+            found.add(path)
+        elif os.path.isfile(path):
+            found.add(path)
+            visit(path)
             return True
 
     def find(incl_args, directory):
+        found = set()
         for arg in incl_args:
             # new, recursive, relative include
-            if not (directory and tryarg(directory, arg)):
+            if not (directory and tryarg(directory, arg, found)):
                 # old include (relative to master file)
-                if not (basedir and tryarg(basedir, arg)):
+                if not (basedir and tryarg(basedir, arg, found)):
                     # if path is given, also search there:
                     for p in include_path:
-                        if tryarg(p, arg):
+                        if tryarg(p, arg, found):
                             break
-
-    find(dinfo.include_args(), basedir)
-    return files
+                    else:
+                        if missing is not None:
+                            missing.update(os.path.realpath(os.path.join(d, arg))
+                                for d in (directory, basedir, *include_path) if d)
+        return found
+
+    args = dinfo.include_args()
+    includes = find(args, basedir)
+    if filename:
+        includegraph.update(os.path.realpath(filename), args, includes)
+    return order
 
 
 def basenames(dinfo, includefiles=(), filename=None, replace_suffix=True):
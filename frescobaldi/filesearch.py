@@ -0,0 +1,240 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Searches and replaces in files, in a pool of worker processes.
+
+The functions in this module only use the standard library, they are run
+in other processes (see search_files() and replace_files()). This module
+is also the main module of those processes, so they do not import the
+application. A search result is a Match tuple; positions count newlines as
+one character, like the text in a QTextDocument.
+
+"""
+
+
+import bisect
+import codecs
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+
+
+# the maximum length of the line text stored with a match
+MAX_LINE_LENGTH = 200
+
+Match = collections.namedtuple('Match', 'start end line column text')
+
+_executor = None
+
+
+class _Process(multiprocessing.context.SpawnProcess):
+    """A spawned process that runs this module as its main module.
+
+    A spawned process normally imports the main module of the parent again,
+    which would import PyQt6 and the whole application.
+
+    """
+    def start(self):
+        """Reimplemented to start the process with this module as main module."""
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = sys.modules[__name__]
+        try:
+            super().start()
+        finally:
+            sys.modules['__main__'] = main
+
+
+class _Context(multiprocessing.context.SpawnContext):
+    """A spawn context using our _Process."""
+    Process = _Process
+
+
+def executor():
+    """Return the (global) ProcessPoolExecutor, creating it if needed.
+
+    New processes are spawned, so they do not inherit the state (and
+    threads) of the application, and they only import this module.
+
+    """
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ProcessPoolExecutor(mp_context=_Context())
+    return _executor
+
+
+def shutdown():
+    """Stop the worker processes, cancelling the pending tasks."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def compile_search(search, regex=False, case=True):
+    """Return a compiled regular expression for the search text.
+
+    Raises re.error if the regular expression is invalid.
+
+    """
+    flags = re.MULTILINE | re.DOTALL
+    if not case:
+        flags |= re.IGNORECASE
+    if not regex:
+        search = re.escape(search)
+    return re.compile(search, flags)
+
+
+def decode(filename):
+    """Read a text file, return (text, encoding).
+
+    The newlines are not converted.
+
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    utf8 = 'utf-8-sig' if data.startswith(codecs.BOM_UTF8) else 'utf-8'
+    for encoding in (utf8, 'latin1'):
+        try:
+            return data.decode(encoding), encoding
+        except UnicodeError:
+            pass
+
+
+def read(filename):
+    """Read a text file, return its text with the newlines converted to "\\n"."""
+    return decode(filename)[0].replace('\r\n', '\n')
+
+
+def write(filename, text, encoding):
+    """Atomically replace the file with the text.
+
+    The text is written to a temporary file in the same directory, which
+    then replaces the file. The newlines are not converted.
+
+    """
+    directory = os.path.dirname(filename)
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding, newline='') as f:
+            f.write(text)
+        try:
+            os.chmod(temp, os.stat(filename).st_mode & 0o7777)
+        except OSError:
+            pass
+        os.replace(temp, filename)
+    except Exception:
+        os.remove(temp)
+        raise
+
+
+def find(pattern, text):
+    """Return a list of the Matches of the compiled pattern in text."""
+    result = []
+    line, linestart = 0, 0
+    for m in pattern.finditer(text):
+        start, end = m.span()
+        line += text.count('\n', linestart, start)
+        linestart = text.rfind('\n', 0, start) + 1
+        lineend = text.find('\n', start)
+        if lineend == -1:
+            lineend = len(text)
+        linetext = text[linestart:min(lineend, linestart + MAX_LINE_LENGTH)]
+        result.append(Match(start, end, line, start - linestart, linetext))
+    return result
+
+
+def search_files(pattern, files):
+    """Search the compiled pattern in the files.
+
+    files is a list of (name, text) tuples. If text is None, the file name
+    is read. Returns a list of (name, matches, error) tuples, where matches
+    is a list of Match tuples and error an error message or None.
+
+    """
+    result = []
+    for name, text in files:
+        try:
+            if text is None:
+                text = read(name)
+        except OSError as e:
+            result.append((name, [], e.strerror))
+        else:
+            result.append((name, find(pattern, text), None))
+    return result
+
+
+def replace_raw(pattern, replacement, raw, regex=False):
+    """Return (text, count): the raw text with all matches replaced.
+
+    If regex is True, backreferences in the replacement are expanded.
+    The pattern is searched in the text with its newlines converted to
+    "\\n", while the text between the matches is kept as it is, so the
+    lines that are not changed keep their newlines. Newlines in
+    the replacement get the newline used most in the text.
+
+    """
+    text = raw.replace('\r\n', '\n')
+    # the positions in text of the newlines that are "\r\n" in raw
+    crlf = [m.start() - i for i, m in enumerate(re.finditer('\r\n', raw))]
+    newline = '\r\n' if len(crlf) * 2 > text.count('\n') else '\n'
+    result = []
+    last = 0
+    count = 0
+    for m in pattern.finditer(text):
+        start = m.start() + bisect.bisect_left(crlf, m.start())
+        end = m.end() + bisect.bisect_left(crlf, m.end())
+        result.append(raw[last:start])
+        new = m.expand(replacement) if regex else replacement
+        result.append(new.replace('\n', newline))
+        last = end
+        count += 1
+    result.append(raw[last:])
+    return ''.join(result), count
+
+
+def replace_files(pattern, replacement, filenames, regex=False):
+    """Replace the compiled pattern in the files, rewriting them.
+
+    Lines without a match keep their newlines (see replace_raw()).
+    Returns a list of (filename, count, error) tuples.
+
+    """
+    result = []
+    for filename in filenames:
+        try:
+            text, encoding = decode(filename)
+            text, count = replace_raw(pattern, replacement, text, regex)
+            if count:
+                write(filename, text, encoding)
+        except (OSError, re.error) as e:
+            result.append((filename, 0, getattr(e, 'strerror', None) or str(e)))
+        else:
+            result.append((filename, count, None))
+    return result
+
+
+def chunks(files, size=32):
+    """Yield lists of at most size items of the list of files."""
+    for i in range(0, len(files), size):
+        yield files[i:i+size]
@@ -38,6 +38,7 @@ import document
 import textformats
 import metainfo
 import plugin
+import signals
 import variables
 import documentinfo
 
@@ -95,7 +96,12 @@ class Highlighter(plugin.Plugin, QSyntaxHighlighter):
     The Highlighter automatically re-reads the highlighting settings if they
     are changed.
 
+    The tokensChanged signal is emitted with the block's QTextBlockUserData
+    and the new tokens every time a block is tokenized.
+
     """
+    tokensChanged = signals.Signal()    # (QTextBlockUserData, tokens)
+
     def __init__(self, doc):
         QSyntaxHighlighter.__init__(self, doc)
         self._fridge = ly.lex.Fridge()
@@ -145,7 +151,9 @@ class Highlighter(plugin.Plugin, QSyntaxHighlighter):
 
         # collect and save the tokens
         tokens = tuple(state.tokens(text))
-        cursortools.data(self.currentBlock()).tokens = tokens
+        data = cursortools.data(self.currentBlock())
+        data.tokens = tokens
+        self.tokensChanged(data, tokens)
 
         # if blank thus far, keep the highlighter coming back
         # because the parsing state is not yet known; else save the state
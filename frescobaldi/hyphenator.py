@@ -5,8 +5,10 @@ This is a Pure Python module to hyphenate text.
 It is inspired by Ruby's Text::Hyphen, but currently reads standard *.dic files,
 that must be installed separately.
 
-In the future it's maybe nice if dictionaries could be distributed together with
-this module, in a slightly prepared form, like in Ruby's Text::Hyphen.
+If the cache_dir module attribute is set, a dictionary is compiled to a binary
+file in that directory in a background thread the first time it is used. Later,
+the compiled file is memory-mapped, so the patterns need not be parsed again
+(see CompiledDictionary).
 
 Wilbert Berendsen, March 2008
 info@wilbertberendsen.nl
@@ -17,7 +19,15 @@ License: LGPL. More info: http://python-hyphenator.googlecode.com/
 
 
 import codecs
+import collections
+import json
+import mmap
+import os
 import re
+import struct
+import tempfile
+import threading
+import zlib
 
 
 __all__ = ["Hyphenator"]
@@ -25,6 +35,13 @@ __all__ = ["Hyphenator"]
 # cache of per-file HyphenationDictionary objects
 _hdcache = {}
 
+# directory to store compiled dictionaries in (None: do not compile)
+cache_dir = None
+
+# the compiled files that are being written in a background thread
+_compiling = set()
+_compiling_lock = threading.Lock()
+
 # precompile some regular expressions
 parse = re.compile(r'(\d?)(\D?)').findall
 
@@ -87,6 +104,24 @@ class DataInt(int):
         return obj
 
 
+class WordCache(collections.OrderedDict):
+    """A dict that keeps at most maxsize words, forgetting the least recently used."""
+    def __init__(self, maxsize=10000):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, word):
+        value = super().__getitem__(word)
+        self.move_to_end(word)
+        return value
+
+    def __setitem__(self, word, value):
+        super().__setitem__(word, value)
+        self.move_to_end(word)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
 class HyphenationDictionary:
     """Reads a hyph_*.dic file and stores the hyphenation patterns.
 
@@ -131,7 +166,7 @@ class HyphenationDictionary:
                     while not values[end-1]:
                         end -= 1
                     self.patterns[''.join(tag)] = start, values[start:end]
-        self.cache = {}
+        self.cache = WordCache()
         self.maxlen = max(map(len, self.patterns))
 
     def positions(self, word):
@@ -173,6 +208,229 @@ class HyphenationDictionary:
         return positions
 
 
+# header of a compiled dictionary: magic, mtime and size of the *.dic file,
+# maxlen, the number of hash table slots and the offset of the alternatives
+_header = struct.Struct('<8sdqIII4x')
+_magic = b'HYPHDIC1'
+_keylen = struct.Struct('<H')
+_PREFIX = 255   # start value of an entry that is only a prefix of a pattern
+
+
+def compile_dictionary(hd, filename, mtime=0, size=0):
+    """Writes the HyphenationDictionary hd to a binary file.
+
+    The file contains a hash table with every pattern and every prefix of a
+    pattern, so a lookup can stop as soon as a text is not found. The slots
+    of the table contain the offset of an entry: the length and UTF-8 bytes of
+    the key, the start offset, the number of values (with 128 added if they
+    have alternatives), the values and the indices of their alternatives.
+
+    The alternatives are stored as a JSON list at the end of the file.
+    The mtime and size of the *.dic file are stored to check whether the
+    compiled file is still up-to-date.
+
+    """
+    alternatives = {}
+    entries = {}
+    for key, (start, values) in hd.patterns.items():
+        data = [start, len(values)]
+        data.extend(values)
+        alts = [v.data for v in values if getattr(v, 'data', None)]
+        if alts:
+            data[1] |= 128
+            indices = [alternatives.setdefault(v.data, len(alternatives) + 1)
+                       if getattr(v, 'data', None) else 0 for v in values]
+        entries[key] = (bytes(data), indices if alts else ())
+        for i in range(1, len(key)):
+            entries.setdefault(key[:i], None)
+
+    slots = 1 << (len(entries) * 2).bit_length()
+    table = [0] * slots
+    records = []
+    offset = _header.size + slots * 4
+    for key, entry in entries.items():
+        key = key.encode('utf-8')
+        h = zlib.crc32(key) & (slots - 1)
+        while table[h]:
+            h = (h + 1) & (slots - 1)
+        table[h] = offset
+        record = [_keylen.pack(len(key)), key]
+        if entry is None:
+            record.append(bytes((_PREFIX,)))
+        else:
+            data, indices = entry
+            record.append(data)
+            record.append(struct.pack(f'<{len(indices)}H', *indices))
+        record = b''.join(record)
+        records.append(record)
+        offset += len(record)
+    alts = json.dumps(sorted(alternatives, key=alternatives.get)).encode('utf-8')
+
+    directory = os.path.dirname(filename)
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_header.pack(_magic, mtime, size, hd.maxlen, slots, offset))
+            f.write(struct.pack(f'<{slots}I', *table))
+            f.writelines(records)
+            f.write(alts)
+        os.replace(temp, filename)
+    except Exception:
+        os.remove(temp)
+        raise
+
+
+class CompiledDictionary:
+    """A hyphenation dictionary written by compile_dictionary(), memory-mapped.
+
+    Has the same positions() method as HyphenationDictionary. If mtime and
+    size are given, raises ValueError if they differ from those stored in
+    the file, i.e. when the *.dic file has changed. Also raises ValueError
+    if the file is truncated or corrupt.
+
+    """
+    def __init__(self, filename, mtime=None, size=None):
+        with open(filename, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._slots = None
+        try:
+            self._read(mtime, size)
+        except ValueError:
+            self.close()
+            raise
+        except (TypeError, struct.error) as e:
+            self.close()
+            raise ValueError("compiled dictionary is corrupt") from e
+        self.cache = WordCache()
+
+    def _read(self, mtime, size):
+        """Reads and checks the header, the hash table and the alternatives."""
+        if len(self._map) < _header.size:
+            raise ValueError("compiled dictionary is truncated")
+        magic, dic_mtime, dic_size, self.maxlen, slots, alts = _header.unpack_from(self._map)
+        if magic != _magic or (mtime, size) not in ((None, None), (dic_mtime, dic_size)):
+            raise ValueError("dictionary not compiled or out of date")
+        if (not slots or slots & (slots - 1)
+                or not _header.size + slots * 4 <= alts <= len(self._map)):
+            raise ValueError("compiled dictionary is truncated or corrupt")
+        self._slots = memoryview(self._map)[_header.size:_header.size + slots * 4].cast('I')
+        if struct.pack('=I', 1) != struct.pack('<I', 1):
+            # the slots are little-endian
+            self._slots = struct.unpack(f'<{slots}I', self._slots.tobytes())
+        self._alternatives = [tuple(a) for a in json.loads(self._map[alts:].decode('utf-8'))]
+
+    def close(self):
+        """Closes the memory-mapped file."""
+        if isinstance(self._slots, memoryview):
+            self._slots.release()
+        self._map.close()
+
+    def lookup(self, text):
+        """Returns (start, values) for the pattern text.
+
+        Returns () if text is only the beginning of a pattern, and None if
+        no pattern starts with text.
+
+        """
+        key = text.encode('utf-8')
+        data = self._map
+        slots = self._slots
+        mask = len(slots) - 1
+        head = _keylen.pack(len(key)) + key
+        h = zlib.crc32(key) & mask
+        while True:
+            offset = slots[h]
+            if not offset:
+                return None
+            end = offset + len(head)
+            if data[offset:end] == head:
+                break
+            h = (h + 1) & mask
+        start = data[end]
+        if start == _PREFIX:
+            return ()
+        count = data[end + 1]
+        values = tuple(data[end + 2:end + 2 + (count & 127)])
+        if count & 128:
+            alts = self._alternatives
+            indices = struct.unpack_from(f'<{len(values)}H', data, end + 2 + len(values))
+            values = tuple(DataInt(v, alts[i - 1]) if i else v
+                           for v, i in zip(values, indices))
+        return start, values
+
+    def positions(self, word):
+        """Returns a list of positions where the word can be hyphenated.
+
+        See HyphenationDictionary.positions().
+
+        """
+        word = word.lower()
+        try:
+            return self.cache[word]
+        except KeyError:
+            pass
+        prepWord = '.' + word + '.'
+        res = [0] * (len(prepWord) + 1)
+        for i in range(len(prepWord) - 1):
+            for j in range(i + 1, min(i + self.maxlen, len(prepWord)) + 1):
+                p = self.lookup(prepWord[i:j])
+                if p is None:
+                    break
+                elif p:
+                    offset, values = p
+                    s = slice(i + offset, i + offset + len(values))
+                    res[s] = map(max, values, res[s])
+
+        positions = [DataInt(i - 1, ref=r) for i, r in enumerate(res) if r % 2]
+        self.cache[word] = positions
+        return positions
+
+
+def compiled_filename(filename):
+    """Returns the name of the compiled file for the *.dic file in cache_dir."""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    checksum = zlib.crc32(os.path.abspath(filename).encode('utf-8'))
+    return os.path.join(cache_dir, f"{name}-{checksum:08x}.bin")
+
+
+def load(filename):
+    """Returns a dictionary for the hyph_*.dic file.
+
+    If cache_dir is set, the compiled dictionary is used if it is up-to-date.
+    Otherwise the *.dic file is read and returned, and it is compiled in a
+    background thread for the next time.
+
+    """
+    if not cache_dir:
+        return HyphenationDictionary(filename)
+    stat = os.stat(filename)
+    compiled = compiled_filename(filename)
+    try:
+        return CompiledDictionary(compiled, stat.st_mtime, stat.st_size)
+    except (OSError, ValueError):
+        pass
+    hd = HyphenationDictionary(filename)
+    with _compiling_lock:
+        if compiled in _compiling:
+            return hd
+        _compiling.add(compiled)
+    threading.Thread(target=_compile,
+        args=(hd, compiled, stat.st_mtime, stat.st_size)).start()
+    return hd
+
+
+def _compile(hd, filename, mtime, size):
+    """Compiles the dictionary in the background, see load()."""
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        compile_dictionary(hd, filename, mtime, size)
+    except OSError:
+        pass
+    finally:
+        with _compiling_lock:
+            _compiling.discard(filename)
+
+
 class Hyphenator:
     """Reads a hyph_*.dic file and stores the hyphenation patterns.
 
@@ -192,7 +450,7 @@ class Hyphenator:
         self.left  = left
         self.right = right
         if not cache or filename not in _hdcache:
-            _hdcache[filename] = HyphenationDictionary(filename)
+            _hdcache[filename] = load(filename)
         self.hd = _hdcache[filename]
 
     def positions(self, word):
@@ -252,11 +510,71 @@ class Hyphenator:
                 l.insert(p, hyphen)
         return ''.join(l)
 
+    def inserted_words(self, words, hyphen='-'):
+        """Returns a dict mapping each of the words to inserted(word, hyphen).
+
+        Every different word is hyphenated only once, which saves a lot of
+        time for a song text, where many words are repeated.
+
+        """
+        return {word: self.inserted(word, hyphen) for word in set(words)}
+
     __call__ = iterate
 
 
+def benchmark(filenames, words):
+    """Prints the time needed to read, compile, load and use the dictionaries."""
+    import random
+    import time
+    global cache_dir
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for filename in filenames:
+            stat = os.stat(filename)
+            t0 = time.perf_counter()
+            hd = HyphenationDictionary(filename)
+            compile_dictionary(hd, compiled_filename(filename), stat.st_mtime, stat.st_size)
+            t1 = time.perf_counter()
+            cd = load(filename)     # memory-maps
+            t2 = time.perf_counter()
+            cd.positions(words[0])
+            t3 = time.perf_counter()
+            for d in hd, cd:
+                d.cache.clear()
+                start = time.perf_counter()
+                for word in words:
+                    d.positions(word)
+                print("{0}: {1}: {2:.1f} us/word".format(os.path.basename(filename),
+                    type(d).__name__, (time.perf_counter() - start) / len(words) * 1e6))
+            print("{0}: parse and compile: {1:.3f}s, load compiled: {2:.4f}s, "
+                  "first word: {3:.4f}s".format(os.path.basename(filename), t1 - t0, t2 - t1, t3 - t2))
+            # a song text: few different words, many times repeated
+            lyrics = [words[int(random.paretovariate(1)) % 500] for i in range(20000)]
+            h = Hyphenator(filename)
+            h.hd = cd
+            for batch in False, True:
+                cd.cache.clear()
+                start = time.perf_counter()
+                if batch:
+                    h.inserted_words(lyrics, ' -- ')
+                else:
+                    [h.inserted(word, ' -- ') for word in lyrics]
+                print("{0}: {1} lyric words ({2} different), {3}: {4:.3f}s".format(
+                    os.path.basename(filename), len(lyrics), len(set(lyrics)),
+                    "batch" if batch else "per word", time.perf_counter() - start))
+            cd.close()
+
+
 if __name__ == "__main__":
     import sys
+    if sys.argv[1] == '--benchmark':
+        import random
+        directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hyphdicts')
+        files = sys.argv[2:] or [os.path.join(directory, f)
+            for f in ('hyph_de_DE.dic', 'hyph_nl_NL.dic')]
+        words = [''.join(random.choice('abcdefghiklmnoprstuvwz') for i in range(random.randint(4, 14)))
+                 for j in range(5000)]
+        benchmark(files, words)
+        sys.exit(0)
     dict_file = sys.argv[1]
     word = sys.argv[2]
     if not isinstance(word, str):
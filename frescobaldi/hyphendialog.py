@@ -27,7 +27,7 @@ import glob
 import locale
 import os
 
-from PyQt6.QtCore import QSettings, Qt
+from PyQt6.QtCore import QSettings, QStandardPaths, Qt
 from PyQt6.QtWidgets import QDialog, QDialogButtonBox, QLabel, QListWidget, QVBoxLayout
 
 import app
@@ -45,6 +45,11 @@ except ImportError:
     hyphdicts = None
 
 
+# store compiled hyphenation dictionaries with the application data
+hyphenator.cache_dir = os.path.join(QStandardPaths.writableLocation(
+    QStandardPaths.StandardLocation.AppLocalDataLocation), "hyphdicts")
+
+
 # paths to check for hyphen dicts
 default_paths = [
     "share/hyphen",
@@ -0,0 +1,187 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Keeps a graph of the files that include each other.
+
+For every file the files it directly includes are stored, together with the
+reverse relation: the files that include it. fileinfo.includefiles() records
+the edges it finds. It also stores the include arguments of a file, and reuses
+them as long as the file did not change on disk, so a file is only read again
+when it is modified. The arguments are always resolved again, because a file
+they refer to may have been created or removed in the meantime.
+
+The graph is saved in the application's data directory when Frescobaldi
+quits and read back in the next session, so it is known which master files
+depend on an include file before they have been opened.
+
+"""
+
+
+import collections
+import json
+import os
+
+from PyQt6.QtCore import QStandardPaths
+
+import app
+
+
+class Node:
+    """The stored include information of one file.
+
+    mtime:      the modification time of the file when it was read, or None
+                if the text did not come from disk (e.g. a modified document)
+    args:       the arguments of the include commands in the file
+    includes:   the files the file directly includes
+
+    """
+    __slots__ = ('mtime', 'args', 'includes')
+
+    def __init__(self, mtime, args, includes):
+        self.mtime = mtime
+        self.args = args
+        self.includes = includes
+
+
+_nodes = {}                                 # filename -> Node
+_included_by = collections.defaultdict(set) # filename -> including files
+_loaded = False
+_changed = False
+
+
+def filename():
+    """Return the file the graph is saved in."""
+    return os.path.join(QStandardPaths.writableLocation(
+        QStandardPaths.StandardLocation.AppLocalDataLocation), "includegraph.json")
+
+
+def _load():
+    """Read the graph from disk if that was not yet done."""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    try:
+        with open(filename(), encoding="utf-8") as f:
+            data = json.load(f)
+        for name, (mtime, args, includes) in data.items():
+            if name not in _nodes and os.path.exists(name):
+                _set(name, Node(mtime, tuple(args), frozenset(includes)))
+    except (OSError, ValueError, TypeError):
+        pass
+
+
+def save():
+    """Write the graph to disk if it changed."""
+    global _changed
+    if not _changed:
+        return
+    data = {name: [node.mtime, node.args, sorted(node.includes)]
+            for name, node in _nodes.items()}
+    path = filename()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding="utf-8") as f:
+            json.dump(data, f)
+    except OSError:
+        pass
+    else:
+        _changed = False
+
+app.aboutToQuit.connect(save)
+
+
+def _set(name, node):
+    """Store the node for the file, updating the reverse edges."""
+    old = _nodes.get(name)
+    if old:
+        for f in old.includes - node.includes:
+            _included_by[f].discard(name)
+            if not _included_by[f]:
+                del _included_by[f]
+        new = node.includes - old.includes
+    else:
+        new = node.includes
+    for f in new:
+        _included_by[f].add(name)
+    _nodes[name] = node
+
+
+def update(name, args, includes, mtime=None):
+    """Store the include arguments and the files the named file directly includes.
+
+    mtime is the modification time of the file the arguments were read from.
+
+    """
+    global _changed
+    _load()
+    args = tuple(args)
+    includes = frozenset(includes)
+    old = _nodes.get(name)
+    if (old and old.includes == includes and old.mtime == mtime
+            and old.args == args):
+        return
+    _set(name, Node(mtime, args, includes))
+    _changed = True
+
+
+def lookup(name, mtime):
+    """Return the stored include arguments of the named file, if still valid.
+
+    Returns None if the file is unknown or if mtime, its current modification
+    time, differs from the time the arguments were read.
+
+    """
+    _load()
+    node = _nodes.get(name)
+    if node and node.mtime is not None and node.mtime == mtime:
+        return node.args
+
+
+def includes(name):
+    """Return the files the named file directly includes."""
+    _load()
+    node = _nodes.get(name)
+    return node.includes if node else frozenset()
+
+
+def dependents(name):
+    """Return the set of files that include the named file, directly or not."""
+    _load()
+    result = set()
+    todo = [name]
+    while todo:
+        for f in _included_by.get(todo.pop(), ()):
+            if f not in result:
+                result.add(f)
+                todo.append(f)
+    result.discard(name)
+    return result
+
+
+def masters(name):
+    """Return the dependents of the named file that are not included themselves.
+
+    These are the files that need to be engraved again when the named file
+    changes.
+
+    """
+    return {f for f in dependents(name)
+            if not _included_by.get(f) and os.path.isfile(f)}
@@ -0,0 +1,148 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Caches the textedit links extracted from PDF documents.
+
+The links of every page are stored keyed by a digest of the page's links
+(see pdfcontent.link_digests()), in memory and in a small sidecar file in
+the application's cache directory. So when LilyPond rewrites a PDF, only
+the links of the pages that really changed are extracted again.
+
+The links of a document are returned as a list of (filename, line, column,
+pageNum, area) tuples, where area is the four-tuple of the original link
+area.
+
+"""
+
+
+import collections
+import json
+import os
+
+from PyQt6.QtCore import QStandardPaths
+
+import pdfcontent
+
+
+# number of page link tables to keep in memory and on disk
+MAX_MEMORY = 2000
+MAX_DISK = 5000
+
+_cache = collections.OrderedDict()
+
+
+def cachedir():
+    """Return the directory the sidecar files are stored in."""
+    return os.path.join(QStandardPaths.writableLocation(
+        QStandardPaths.StandardLocation.CacheLocation), "pointandclick")
+
+
+def get(key):
+    """Return the list of links of a page stored for the key, or None."""
+    try:
+        links = _cache[key]
+    except KeyError:
+        links = _load(key)
+        if links is None:
+            return
+        _remember(key, links)
+    else:
+        _cache.move_to_end(key)
+    return links
+
+
+def put(key, links):
+    """Store the list of links of a page for the key."""
+    _remember(key, links)
+    _save(key, links)
+
+
+def links(filename, extract, pagecount):
+    """Return the list of links for the PDF file with pagecount pages.
+
+    extract(pages) is called with a list of the page numbers whose links are
+    not cached, and must return the links on those pages. If the pages of
+    the file can't be read, extract(None) is called to get all the links.
+
+    """
+    keys = pdfcontent.link_digests(filename)
+    if not keys or len(keys) != pagecount:
+        return extract(None)
+    pages = {}
+    for num, key in enumerate(keys):
+        links = get(key)
+        if links is not None:
+            pages[num] = links
+    missing = [num for num in range(pagecount) if num not in pages]
+    if missing:
+        for num in missing:
+            pages[num] = []
+        for filename, line, column, num, area in extract(missing):
+            pages[num].append((filename, line, column, area))
+        for num in missing:
+            _remember(keys[num], pages[num])
+        _save_pages((keys[num], pages[num]) for num in missing)
+    return [(filename, line, column, num, area)
+            for num in range(pagecount)
+            for filename, line, column, area in pages[num]]
+
+
+def _remember(key, links):
+    """Store the links in memory, forgetting the oldest when needed."""
+    _cache[key] = links
+    _cache.move_to_end(key)
+    while len(_cache) > MAX_MEMORY:
+        _cache.popitem(False)
+
+
+def _load(key):
+    """Read the links of a page from the sidecar file, or return None."""
+    try:
+        with open(os.path.join(cachedir(), key + ".json"), encoding="utf-8") as f:
+            return [(filename, line, column, tuple(area))
+                for filename, line, column, area in json.load(f)]
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def _save(key, links):
+    """Write the links of a page to a sidecar file."""
+    _save_pages([(key, links)])
+
+
+def _save_pages(pages):
+    """Write the (key, links) tuples to sidecar files.
+
+    The oldest files are removed when there are too many.
+
+    """
+    directory = cachedir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        for key, links in pages:
+            with open(os.path.join(directory, key + ".json"), 'w', encoding="utf-8") as f:
+                json.dump(links, f)
+        files = [os.path.join(directory, name) for name in os.listdir(directory)]
+        if len(files) > MAX_DISK:
+            files.sort(key=os.path.getmtime)
+            for name in files[:-MAX_DISK]:
+                os.remove(name)
+    except OSError:
+        pass
@@ -90,9 +90,10 @@ class Lyrics(plugin.MainWindowPlugin):
             import hyphendialog
             h = hyphendialog.HyphenDialog(self.mainwindow()).hyphenator()
             if h:
+                hyphenated = h.inserted_words((word for start, end, word in found), ' -- ')
                 with c.document as d:
                     for start, end, word in found:
-                        hyph_word = h.inserted(word, ' -- ')
+                        hyph_word = hyphenated[word]
                         if word != hyph_word:
                             d[start:end] = hyph_word
 
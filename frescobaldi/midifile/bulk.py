@@ -0,0 +1,230 @@
+# Python midifile package -- parse, load and play MIDI files.
+# Copyright (c) 2011 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+midifile.bulk -- decodes complete MIDI tracks into compact arrays.
+
+Instead of yielding an object for every event like parser.parse_midi_events,
+parse_track() decodes a track in one loop into a Track: a set of parallel
+arrays holding the absolute time, status, two data bytes and an index in the
+list of meta and sysex payloads for every event.
+
+Event objects can still be created from a Track, using an EventFactory.
+song.load() uses this module to read MIDI files.
+
+"""
+
+
+import array
+import itertools
+
+from . import event
+from . import parser
+
+
+class Track:
+    """The events of a MIDI track, stored in parallel arrays.
+
+    times:  the absolute MIDI time of every event
+    status: the status byte (including the channel for channel events)
+    data1:  the first data byte, or the type for meta events
+    data2:  the second data byte, or 0 if the event has none
+    meta:   the index in payloads for meta and sysex events, otherwise -1
+    payloads: a list with the bytes of the meta and sysex events
+
+    For pitch bend events, data1 and data2 are the LSB and MSB.
+
+    """
+    __slots__ = ('times', 'status', 'data1', 'data2', 'meta', 'payloads')
+
+    def __init__(self):
+        self.times = array.array('Q')
+        self.status = array.array('B')
+        self.data1 = array.array('B')
+        self.data2 = array.array('B')
+        self.meta = array.array('l')
+        self.payloads = []
+
+    def __len__(self):
+        return len(self.times)
+
+    def event(self, index, factory=None):
+        """Return the event at index, created using the EventFactory."""
+        if factory is None:
+            factory = event.EventFactory()
+        status = self.status[index]
+        ev_type = status >> 4
+        channel = status & 0x0F
+        data1 = self.data1[index]
+        if ev_type <= 0x0A:
+            return factory.note_event(ev_type, channel, data1, self.data2[index])
+        elif ev_type == 0x0F:
+            data = self.payloads[self.meta[index]]
+            if status == 0xFF:
+                return factory.meta_event(data1, data)
+            return factory.sysex_event(status, data)
+        elif ev_type == 0x0E:
+            return factory.pitchbend_event(channel, data1 + self.data2[index] * 128)
+        elif ev_type == 0x0D:
+            return factory.channelaftertouch_event(channel, data1)
+        elif ev_type == 0x0B:
+            return factory.controller_event(channel, data1, self.data2[index])
+        return factory.programchange_event(channel, data1)
+
+    def events(self, factory=None):
+        """Yield two-tuples (time, event) for all events."""
+        if factory is None:
+            factory = event.EventFactory()
+        for index, time in enumerate(self.times):
+            yield time, self.event(index, factory)
+
+    def events_grouped(self, factory=None):
+        """Yield two-tuples (time, event_list) like parser.time_events_grouped()."""
+        for time, evs in itertools.groupby(self.events(factory), lambda e: e[0]):
+            yield time, [ev for t, ev in evs]
+
+
+def parse_track(s, time=0):
+    """Decodes the bytes string s (a track) into a Track.
+
+    The time is accumulated from the given starting time (defaulting to 0).
+    Raises ValueError or IndexError on invalid MIDI data.
+
+    """
+    track = Track()
+    add_time = track.times.append
+    add_status = track.status.append
+    add_data1 = track.data1.append
+    add_data2 = track.data2.append
+    add_meta = track.meta.append
+    payloads = track.payloads
+
+    running_status = 0
+    pos = 0
+    end = len(s)
+    while pos < end:
+        # variable-length delta time
+        i = s[pos]
+        pos += 1
+        delta = i & 0x7F
+        while i & 0x80:
+            i = s[pos]
+            pos += 1
+            delta = delta * 128 + (i & 0x7F)
+        time += delta
+
+        status = s[pos]
+        if status & 0x80:
+            running_status = status
+            pos += 1
+        elif not running_status:
+            raise ValueError("invalid running status")
+        else:
+            status = running_status
+
+        ev_type = status >> 4
+        meta = -1
+        if ev_type == 0x0C or ev_type == 0x0D:
+            # program change, channel aftertouch
+            data1 = s[pos]
+            data2 = 0
+            pos += 1
+        elif ev_type < 0x0F:
+            # note on, off, aftertouch, controller, pitch bend
+            data1 = s[pos]
+            data2 = s[pos+1]
+            pos += 2
+        else:
+            running_status = 0
+            if status == 0xFF:
+                # meta event
+                data1 = s[pos]
+                pos += 1
+            else:
+                # some sort of sysex
+                data1 = 0
+            data2 = 0
+            i = s[pos]
+            pos += 1
+            size = i & 0x7F
+            while i & 0x80:
+                i = s[pos]
+                pos += 1
+                size = size * 128 + (i & 0x7F)
+            meta = len(payloads)
+            payloads.append(s[pos:pos+size])
+            pos += size
+
+        add_time(time)
+        add_status(status)
+        add_data1(data1)
+        add_data2(data2)
+        add_meta(meta)
+    return track
+
+
+def meta_events(tracks, meta_type):
+    """Returns a list of (time, data) tuples for the meta events of meta_type.
+
+    The events of all tracks are sorted on time; events at the same time keep
+    the order of the tracks. This is much faster than creating all events.
+
+    """
+    events = []
+    for track in tracks:
+        events.extend((time, track.payloads[meta])
+            for time, status, data1, meta in zip(
+                track.times, track.status, track.data1, track.meta)
+            if status == 0xFF and data1 == meta_type)
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+def parse(s):
+    """Parses MIDI file data from the bytes string s.
+
+    Returns a three tuple (format_type, time_division, tracks), where every
+    track is a Track instance.
+
+    """
+    fmt, division, tracks = parser.parse_midi_data(s)
+    return fmt, division, [parse_track(t) for t in tracks]
+
+
+if __name__ == '__main__':
+    """Compare the speed of the bulk parser with parser.parse_midi_events."""
+    import sys
+    from time import perf_counter
+    # use the imported module, song does not know the Track class of __main__
+    from . import bulk, song
+    for f in sys.argv[1:]:
+        with open(f, 'rb') as midifile:
+            s = midifile.read()
+        fmt, div, tracks = parser.parse_midi_data(s)
+        t0 = perf_counter()
+        count = sum(len(list(parser.parse_midi_events(t))) for t in tracks)
+        t1 = perf_counter()
+        bulk_tracks = [bulk.parse_track(t) for t in tracks]
+        t2 = perf_counter()
+        song.Song(div, tracks)
+        t3 = perf_counter()
+        song.Song(div, bulk_tracks)
+        t4 = perf_counter()
+        print('{0}: {1} events, parser: {2:.3f}s, bulk: {3:.3f}s, '
+              'song: {4:.3f}s, song from bulk: {5:.3f}s'.format(
+            f, count, t1 - t0, t2 - t1, t3 - t2, t4 - t3))
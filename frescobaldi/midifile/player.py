@@ -21,6 +21,7 @@ A MIDI Player.
 """
 
 
+import bisect
 import collections
 import time
 import threading
@@ -35,13 +36,37 @@ class Player:
     You can override: timer_midi_time(), timer_start() and timer_stop()
     to use another timing source than the Python threading.Timer instances.
 
+    Events are scheduled against absolute target times, so delays do not
+    accumulate. When the timer fires, all events that are due are handled
+    at once, and their MIDI events are sent to the output in one batch.
+    How late the timer fires is recorded in a Lateness instance, see
+    lateness().
+
+    The internal events list only contains the MIDI events of the song.
+    The time and beat events are generated while playing; the time of the
+    next time event and the index of the next beat in the song's beats list
+    are kept alongside the position in the events list.
+
     """
+    # events due within this many msec are handled together
+    batch_window = 1
+
     def __init__(self):
         self._song = None
         self._events = []
+        self._times = []            # the times of the events, for bisecting
+        self._time_interval = 0     # interval of time events
+        self._time_end = -1         # time of the last time event
+        self._beats = []            # the song's beats
+        self._beat_times = []       # the times of the beats
+        self._measures = []         # (measnum, beat) for every beat
         self._position = 0
+        self._next_time_event = 0
+        self._next_beat = 0
         self._offset = 0
         self._sync_time = 0
+        self._batch = None
+        self._lateness = Lateness()
         self._playing = False
         self._tempo_factor = 1.0
         self._output = None
@@ -80,8 +105,18 @@ class Player:
         if playing:
             self.timer_stop_playing()
         self._song = song
-        self._events = make_event_list(song, time, beat)
+        self._events = make_event_list(song)
+        self._times = [t for t, e in self._events]
+        self._time_interval = time or 0
+        self._time_end = song.length if time else -1
+        # only the last beat at a certain time counts
+        beats = dict((b[0], b) for b in song.beats) if beat else {}
+        self._beats = [beats[t] for t in sorted(beats)]
+        self._beat_times = [b[0] for b in self._beats]
+        self._measures = [b[1:3] for b in self._beats]
         self._position = 0
+        self._next_time_event = 0
+        self._next_beat = 0
         self._offset = 0
         if playing:
             self.timer_start_playing()
@@ -96,21 +131,42 @@ class Player:
             self.stop()
         self._song = None
         self._events = []
+        self._times = []
+        self._time_end = -1
+        self._beats = []
+        self._beat_times = []
+        self._measures = []
         self._position = 0
+        self._next_time_event = 0
+        self._next_beat = 0
         self._offset = 0
 
     def total_time(self):
         """Returns the length in msec of the current song."""
-        if self._events:
-            return self._events[-1][0]
-        return 0
+        time = self._times[-1] if self._times else 0
+        if self._time_end >= 0:
+            time = max(time, self._time_end - self._time_end % self._time_interval)
+        if self._beat_times:
+            time = max(time, self._beat_times[-1])
+        return time
+
+    def next_time(self):
+        """(Private) Returns the time of the next event, or None if there is none."""
+        position = self._position
+        times = []
+        if position < len(self._times):
+            times.append(self._times[position])
+        if self._next_time_event <= self._time_end:
+            times.append(self._next_time_event)
+        if self._next_beat < len(self._beat_times):
+            times.append(self._beat_times[self._next_beat])
+        return min(times) if times else None
 
     def current_time(self):
         """Returns the current time position."""
-        if self._position >= len(self._events):
+        time = self.next_time()
+        if time is None:
             time = self.total_time()
-        else:
-            time = self._events[self._position][0]
         if self._playing:
             return time - self.timer_offset()
         return time - self._offset
@@ -128,6 +184,14 @@ class Player:
         """Returns True if the player is playing, else False."""
         return self._playing
 
+    def lateness(self):
+        """Returns the Lateness instance with the timing statistics.
+
+        The statistics are reset every time playback starts.
+
+        """
+        return self._lateness
+
     def set_tempo_factor(self, factor):
         """Sets the tempo factor as a floating point value (1.0 is normal)."""
         self._tempo_factor = float(factor)
@@ -138,60 +202,66 @@ class Player:
 
     def seek(self, time):
         """Goes to the specified time (in msec)."""
-        pos = 0
-        offset = 0
-        if time:
-            # bisect our way in the events list.
-            end = len(self._events)
-            while pos < end:
-                mid = (pos + end) // 2
-                if time > self._events[mid][0]:
-                    pos = mid + 1
-                else:
-                    end = mid
-            if pos < len(self._events):
-                offset = self._events[pos][0] - time
-        self.set_position(pos, offset)
+        self.set_position(time)
 
     def seek_measure(self, measnum, beat=1):
         """Goes to the specified measure and beat (beat defaults to 1).
 
-        Returns whether the measure position could be found (True or False).
+        If the beat is beyond the last beat of the measure, goes to that
+        last beat. Returns whether the measure position could be found
+        (True or False).
 
         """
-        result = False
-        for i, (t, e) in enumerate(self._events):
-            if e.beat:
-                if e.beat[0] == measnum:
-                    position = i
-                    result = True
-                    if e.beat[1] >= beat:
-                        break
-                if e.beat[0] > measnum:
-                    break
-        if result:
-            self.set_position(position)
-            return True
-        return False
+        measures = self._measures
+        i = bisect.bisect_left(measures, (measnum, beat))
+        if i == len(measures) or measures[i][0] != measnum:
+            i -= 1
+            if i < 0 or measures[i][0] != measnum:
+                return False
+        self.set_position(self._beat_times[i])
+        return True
+
+    def seek_time_events(self, time):
+        """(Private) Sets the next time and beat events to the specified time.
+
+        Returns the position in the events list of the first event at or
+        after the specified time. This method is called by set_position(),
+        when the timer is stopped.
 
-    def set_position(self, position, offset=0):
-        """(Private) Goes to the specified position in the internal events list.
+        """
+        interval = self._time_interval
+        if interval:
+            self._next_time_event = -(-time // interval) * interval
+        self._next_beat = bisect.bisect_left(self._beat_times, time)
+        return bisect.bisect_left(self._times, time)
+
+    def set_position(self, time):
+        """(Private) Goes to the specified time (in msec).
 
-        This method is called by seek() and seek_measure().
+        The timer is stopped before the position in the internal events list
+        and the next time and beat events are changed, so next_event() never
+        sees them half updated. This method is called by seek() and
+        seek_measure().
 
         """
-        old, self._position = self._position, position
+        if self._playing:
+            self.timer_stop()
+        old, self._position = self._position, self.seek_time_events(time)
+        offset = 0
+        if time:
+            next_time = self.next_time()
+            if next_time is not None:
+                offset = next_time - time
         if old != self._position:
             self.position_event(old, self._position)
         if self._playing:
-            self.timer_stop()
             self.timer_schedule(offset, False)
         else:
             self._offset = offset
 
     def has_events(self):
         """Returns True if there are events left to play."""
-        return bool(self._events) and self._position < len(self._events)
+        return self.next_time() is not None
 
     def next_event(self):
         """(Private) Handles the current event and advances to the next.
@@ -199,16 +269,31 @@ class Player:
         Returns the time in ms (not adjusted by tempo factor!) before
         next_event should be called again.
 
+        The time and beat events at the current time are generated here and
+        handled together with the MIDI events at that time.
+
         If there is no event to handle anymore, returns 0.
         If this event was the last, calls finish() and returns 0.
 
         """
-        if self.has_events():
-            time, event = self._events[self._position]
-            self.handle_event(time, event)
+        time = self.next_time()
+        if time is None:
+            return 0
+        event = Event()
+        if self._position < len(self._times) and self._times[self._position] == time:
+            music = self._events[self._position][1]
+            event.midi, event.user = music.midi, music.user
             self._position += 1
-            if self._position < len(self._events):
-                return self._events[self._position][0] - time
+        if self._next_time_event == time <= self._time_end:
+            event.time = True
+            self._next_time_event += self._time_interval
+        if self._next_beat < len(self._beat_times) and self._beat_times[self._next_beat] == time:
+            event.beat = self._beats[self._next_beat][1:]
+            self._next_beat += 1
+        self.handle_event(time, event)
+        next_time = self.next_time()
+        if next_time is not None:
+            return next_time - time
         return 0
 
     def handle_event(self, time, event):
@@ -226,9 +311,16 @@ class Player:
         """(Private) Plays the specified MIDI events.
 
         The format depends on the way MIDI events are stored in the Song.
+        While the timer is handling the events that are due, the MIDI events
+        are collected and sent afterwards in one batch.
 
         """
-        if self._output:
+        if self._batch is not None:
+            if isinstance(midi, dict):
+                # dict mapping track to events?
+                midi = sum(map(midi.get, sorted(midi)), [])
+            self._batch.extend(midi)
+        elif self._output:
             try:
                 self._output.midi_event(midi)
             except BaseException as e:
@@ -281,11 +373,11 @@ class Player:
     def timer_midi_time(self):
         """Should return a continuing time value in msec, used while playing.
 
-        The default implementation returns the time in msec from the Python
-        time module.
+        The default implementation returns the time in msec from the
+        monotonic clock of the Python time module.
 
         """
-        return int(time.time() * 1000)
+        return time.monotonic() * 1000
 
     def timer_schedule(self, delay, sync=True):
         """Schedules the upcoming event.
@@ -324,6 +416,7 @@ class Player:
     def timer_start_playing(self):
         """Starts playing by starting the timer for the first upcoming event."""
         reset = self.current_time() == 0
+        self._lateness.reset()
         self._playing = True
         self.start_event()
         if reset and self._output:
@@ -336,11 +429,27 @@ class Player:
     def timer_timeout(self):
         """Called when the timer times out.
 
-        Handles an event and schedules the next.
+        Handles the event and all following events that are already due
+        (within batch_window msec), sends their MIDI events in one batch and
+        schedules the next event.
         If the end of a song is reached, calls finish_event()
 
         """
-        offset = self.next_event()
+        now = self.timer_midi_time()
+        self._lateness.add(now - self._sync_time)
+        self._batch = []
+        try:
+            offset = self.next_event()
+            while offset:
+                msec = offset / self._tempo_factor
+                if self._sync_time + msec - now > self.batch_window:
+                    break
+                self._sync_time += msec
+                offset = self.next_event()
+        finally:
+            batch, self._batch = self._batch, None
+        if batch:
+            self.midi_event(batch)
         if offset:
             self.timer_schedule(offset)
         else:
@@ -355,6 +464,48 @@ class Player:
         self.stop_event()
 
 
+class Lateness:
+    """Collects statistics about how late the player handles events.
+
+    Every time the timer fires, add() is called with the number of msec
+    the timer fired after the event's target time (negative if early).
+
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forgets all measurements."""
+        self.count = 0
+        self.last = 0
+        self.maximum = 0
+        self._sum = 0
+        self._sum_squares = 0
+
+    def add(self, msec):
+        """Records a measurement."""
+        self.count += 1
+        self.last = msec
+        self.maximum = max(self.maximum, msec)
+        self._sum += msec
+        self._sum_squares += msec * msec
+
+    def mean(self):
+        """Returns the average lateness in msec."""
+        return self._sum / self.count if self.count else 0
+
+    def jitter(self):
+        """Returns the standard deviation of the lateness in msec."""
+        if not self.count:
+            return 0
+        mean = self.mean()
+        return max(0, self._sum_squares / self.count - mean * mean) ** 0.5
+
+    def __repr__(self):
+        return '<Lateness count={0} mean={1:.2f} jitter={2:.2f} max={3:.2f}>'.format(
+            self.count, self.mean(), self.jitter(), self.maximum)
+
+
 class Event:
     """Any event (MIDI, Time and/or Beat).
 
@@ -395,6 +546,9 @@ def make_event_list(song, time=None, beat=None):
     If beat is True, beat events are generated as well.
     MIDI events are always created.
 
+    The Player itself only uses the MIDI events and generates the time and
+    beat events while playing.
+
     """
     d = collections.defaultdict(Event)
 
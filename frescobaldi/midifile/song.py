@@ -21,8 +21,10 @@ midifile.song -- structures MIDI file data as a song.
 """
 
 
+import bisect
 import collections
 
+from . import bulk
 from . import event
 from . import parser
 
@@ -31,15 +33,27 @@ def load(filename):
     """Convenience function to instantiate a Song from a filename.
 
     If the filename is a type 2 MIDI file, just returns the first track.
+    The tracks are decoded using the bulk parser.
 
     """
     with open(filename, 'rb') as midifile:
-        fmt, div, tracks = parser.parse_midi_data(midifile.read())
+        fmt, div, tracks = bulk.parse(midifile.read())
     if fmt == 2:
         tracks = tracks[:1]
     return Song(div, tracks)
 
 
+def time_events_grouped(track):
+    """Yields two-tuples (time, event_list) for the track.
+
+    The track is either a bytes string or a bulk.Track instance.
+
+    """
+    if isinstance(track, bulk.Track):
+        return track.events_grouped()
+    return parser.time_events_grouped(parser.parse_midi_events(track))
+
+
 def events_dict(tracks):
     """Returns all events from the track grouped per and mapped to time-step.
 
@@ -48,8 +62,7 @@ def events_dict(tracks):
     """
     d = collections.defaultdict(dict)
     for n, track in enumerate(tracks):
-        for time, evs in parser.time_events_grouped(
-                parser.parse_midi_events(track)):
+        for time, evs in time_events_grouped(track):
             d[time][n] = evs
     return d
 
@@ -62,8 +75,7 @@ def events_dict_together(tracks):
     """
     d = collections.defaultdict(list)
     for track in tracks:
-        for time, evs in parser.time_events_grouped(
-                parser.parse_midi_events(track)):
+        for time, evs in time_events_grouped(track):
             d[time].extend(evs)
     return d
 
@@ -116,40 +128,61 @@ def iter_events_dict(evs):
 
 class TempoMap:
     """Converts midi time to real time in microseconds."""
-    def __init__(self, d, division):
-        """Initialize our tempo map based on events d and division."""
-        # are the events one list (single-track) or a dict (per-track)?
+    def __init__(self, d, division, tempos=None):
+        """Initialize our tempo map based on events d and division.
+
+        If given, tempos is a sorted list of (midi_time, tempo) tuples, and
+        then the events are not searched for tempo changes.
+
+        """
         self.division = smpte_division(division)
         self.times = times = []
-        events = events_iter(d)
-        if events:
-            for midi_time, evs in sorted(d.items()):
-                for e in events(evs):
-                    if is_tempo(e):
-                        times.append((midi_time, get_tempo(e)))
-                        break
+        if tempos is not None:
+            for midi_time, tempo in tempos:
+                if not times or times[-1][0] != midi_time:
+                    times.append((midi_time, tempo))
+        else:
+            # are the events one list (single-track) or a dict (per-track)?
+            events = events_iter(d)
+            if events:
+                for midi_time, evs in sorted(d.items()):
+                    for e in events(evs):
+                        if is_tempo(e):
+                            times.append((midi_time, get_tempo(e)))
+                            break
         if not times or times[0][0] != 0:
             times.insert(0, (0, 500000))
+        # the MIDI times of the tempo changes, and the accumulated
+        # real time (not yet divided by the division) at each change
+        self._midi_times = [t for t, tempo in times]
+        self._real_times = real_times = [0]
+        for (t1, tempo), (t2, _) in zip(times, times[1:]):
+            real_times.append(real_times[-1] + (t2 - t1) * tempo)
 
     def real_time(self, midi_time):
         """Returns the real time in microseconds for the given MIDI time."""
-        real_time = 0
-        times = self.times
-        for i in range(1, len(times)):
-            if times[i][0] >= midi_time:
-                real_time += (midi_time - times[i-1][0]) * times[i-1][1]
-                break
-            real_time += (times[i][0] - times[i-1][0]) * times[i-1][1]
-        else:
-            real_time += (midi_time - times[-1][0]) * times[-1][1]
-        return real_time // self.division
+        i = max(0, bisect.bisect_left(self._midi_times, midi_time) - 1)
+        start, tempo = self.times[i]
+        return (self._real_times[i] + (midi_time - start) * tempo) // self.division
 
     def msec(self, midi_time):
         """Returns the real time in milliseconds."""
         return self.real_time(midi_time) // 1000
 
+    def midi_time(self, real_time):
+        """Returns the MIDI time for the given real time in microseconds.
+
+        The time is rounded to the nearest tick, so converting the result of
+        real_time() back gives the MIDI time again.
+
+        """
+        real_time *= self.division
+        i = max(0, bisect.bisect_right(self._real_times, real_time) - 1)
+        start, tempo = self.times[i]
+        return start + (real_time - self._real_times[i] + tempo // 2) // tempo
+
 
-def beats(d, division):
+def beats(d, division, time_sigs=None):
     """Yields tuples for every beat in the events dictionary d.
 
     Each tuple is:
@@ -158,16 +191,22 @@ def beats(d, division):
     With this you can easily add measure numbers and find measure positions
     in the MIDI.
 
+    If given, time_sigs is a sorted list of (midi_time, time_signature)
+    tuples, and then the events are not searched for time signatures.
+
     """
     events = events_iter(d)
     if not events:
         return
-    time_sigs = []
     times = sorted(d)
-    for midi_time in times:
-        for e in events(d[midi_time]):
-            if is_time_signature(e):
-                time_sigs.append((midi_time, get_time_signature(e)))
+    if time_sigs is None:
+        time_sigs = []
+        for midi_time in times:
+            for e in events(d[midi_time]):
+                if is_time_signature(e):
+                    time_sigs.append((midi_time, get_time_signature(e)))
+    else:
+        time_sigs = list(time_sigs)
     if not time_sigs or time_sigs[0][0] != 0:
         # default time signature at start
         time_sigs.insert(0, (0, (4, 4, 24, 8)))
@@ -206,16 +245,28 @@ class Song:
 
     """
     def __init__(self, division, tracks):
-        """Initialize the Song with the given division and track chunks."""
+        """Initialize the Song with the given division and tracks.
+
+        The tracks can be bytes strings (track chunks) or bulk.Track instances.
+
+        """
         self.division = division
         self.ntracks = len(tracks)
         self.events = events_dict(tracks)
-        self.tempo_map = t = TempoMap(self.events, division)
+        if all(isinstance(track, bulk.Track) for track in tracks):
+            # find the tempo changes and time signatures without the events
+            tempos = [(midi_time, int.from_bytes(data[:3], 'big'))
+                      for midi_time, data in bulk.meta_events(tracks, 0x51)]
+            time_sigs = [(midi_time, tuple(data))
+                         for midi_time, data in bulk.meta_events(tracks, 0x58)]
+        else:
+            tempos = time_sigs = None
+        self.tempo_map = t = TempoMap(self.events, division, tempos)
         self.length = t.msec(max(self.events))
 
         self.beats = b = []
         measnum = 0
-        for midi_time, beat, num, den in beats(self.events, division):
+        for midi_time, beat, num, den in beats(self.events, division, time_sigs):
             if beat == 1:
                 measnum += 1
             b.append((t.msec(midi_time), measnum, beat, num, den))
@@ -141,7 +141,7 @@ def _decode_name(s):
 if available():
     time = portmidi.time
 else:
-    from time import time as time_
+    from time import monotonic as time_
     def time():
         """Returns a time value in msec."""
         return int(time_() * 1000)
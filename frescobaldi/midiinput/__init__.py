@@ -24,7 +24,7 @@ from PyQt6.QtCore import QObject, QThread, pyqtSignal
 import app
 import midihub
 import midifile.event
-import midifile.parser
+import midifile.player
 import documentinfo
 
 from . import elements
@@ -40,6 +40,10 @@ LY_REG_EXPR = re.compile(
 # Event codes from the MIDI specification
 NOTE_OFF_EVENT = 8
 NOTE_ON_EVENT = 9
+POLY_AFTERTOUCH_EVENT = 10
+
+# maximum number of events to read from PortMIDI at once
+READ_BATCH_SIZE = 64
 
 
 class MidiIn:
@@ -48,6 +52,7 @@ class MidiIn:
         self._portmidiinput = None
         self._listener = None
         self._chord = None
+        self._latency = None
 
     def __del__(self):
         if isinstance(self._listener, Listener):
@@ -88,9 +93,14 @@ class MidiIn:
         self._listener.stop()
         if not self._listener.isFinished():
             self._listener.wait()
+        self._latency = self._listener.latency()
         self._activenotes = 0
         self.close()
 
+    def latency(self):
+        """Returns the Lateness instance of the last capture, or None."""
+        return self._latency
+
     def analyzeEvent(self, event):
         if isinstance(event, midifile.event.NoteEvent):
             self.processNoteEvent(event.type, event.channel, event.note, event.value)
@@ -150,33 +160,61 @@ class MidiIn:
 
 
 class Listener(QThread):
+    """Reads the MIDI input in a background thread.
+
+    All pending events are read at once; while notes are coming in the input
+    is polled every msec, backing off to the polling time when idle. The
+    latency of every note event (the msec between its PortMIDI timestamp and
+    the moment it is read) is collected in a Lateness instance.
+
+    """
     receivedNoteEvent = pyqtSignal(midifile.event.NoteEvent)
 
     def __init__(self, portmidiinput, pollingtime):
         super().__init__()
         self._portmidiinput = portmidiinput
         self._pollingtime = pollingtime
+        self._latency = midifile.player.Lateness()
+
+    def latency(self):
+        """Returns the Lateness instance with the input latency statistics."""
+        return self._latency
 
     def run(self):
         self._capturing = True
+        self._latency.reset()
+        sleep = 0
+        while self._capturing:
+            if self._portmidiinput.poll():
+                self.readEvents()
+                sleep = 0
+            else:
+                sleep = min(sleep + 1, self._pollingtime)
+                time.sleep(sleep / 1000.)
+
+    def readEvents(self):
+        """Reads and handles all pending events."""
         while self._capturing:
-            while not self._portmidiinput.poll():
-                time.sleep(self._pollingtime / 1000.)
-                if not self._capturing:
-                    break
-            if not self._capturing:
+            events = self._portmidiinput.read(READ_BATCH_SIZE)
+            now = midihub.time()
+            for data, timestamp in events:
+                event = decode(*data[:3])
+                if event:
+                    self._latency.add(now - timestamp)
+                    self.receivedNoteEvent.emit(event)
+            if len(events) < READ_BATCH_SIZE:
                 break
-            data = self._portmidiinput.read(1)
-
-            # midifile.parser.parse_midi_events is a generator which expects a long "byte string" from a file,
-            # so we feed it one. But since it's just one event, we only need the first "generated" element.
-            # First byte is time, which is unnecessary in our case, so we feed a dummy byte 77
-            # and strip output by just using [1]. 77 is chosen randomly ;)
-            s = bytearray([77, data[0][0][0], data[0][0][1], data[0][0][2], data[0][0][3]])
-            event = next(midifile.parser.parse_midi_events(s))[1]
-
-            if isinstance(event, midifile.event.NoteEvent):
-                self.receivedNoteEvent.emit(event)
 
     def stop(self):
         self._capturing = False
+
+
+def decode(status, data1, data2):
+    """Returns a NoteEvent for a note off, note on or aftertouch message.
+
+    For other messages, None is returned.
+
+    """
+    ev_type = status >> 4
+    if NOTE_OFF_EVENT <= ev_type <= POLY_AFTERTOUCH_EVENT:
+        return midifile.event.NoteEvent(ev_type, status & 0x0F, data1, data2)
@@ -141,6 +141,19 @@ class Widget(QWidget):
         while self._capture.actions():    # remove all old actions
             self._capture.removeAction(self._capture.actions()[0])
         self._capture.setDefaultAction(ac.capture_start)
+        self.updateLatencyInfo()
+
+    def updateLatencyInfo(self):
+        """Shows the input latency of the last capture in the tooltip."""
+        latency = self._midiin.latency()
+        if latency and latency.count:
+            self._capture.setToolTip(_(
+                "Latency of the last capture:\n"
+                "average latency: {mean:.1f} ms\n"
+                "jitter: {jitter:.1f} ms\n"
+                "maximum latency: {maximum:.1f} ms").format(
+                mean=latency.mean(), jitter=latency.jitter(),
+                maximum=latency.maximum))
 
     def switchaccidental(self):
         if self.accidentals() == 'flats':
@@ -19,13 +19,23 @@
 
 """
 Handles MIDI files.
+
+The MIDI files are parsed in a background thread as soon as a job finishes,
+and the Song objects are cached by filename and mtime. When LilyPond rewrote
+a file with identical contents, the cached Song is reused.
 """
 
 
+import collections
+import hashlib
 import os
+import struct
+import threading
 
 from PyQt6.QtCore import Qt
 
+import background
+import filecache
 import icons
 import plugin
 import signals
@@ -35,16 +45,86 @@ import listmodel
 import midifile.song
 
 
+# number of parsed MIDI files to keep
+MAX_SONGS = 32
+
+_cache = filecache.FileCache(MAX_SONGS)     # filename -> Song
+_digests = collections.OrderedDict()        # filename -> (digest, Song)
+_lock = threading.Lock()
+
+# the exceptions load() raises for unreadable or invalid MIDI files
+LOAD_ERRORS = (OSError, ValueError, IndexError, struct.error)
+
+# emitted with the filename and the exception when a MIDI file could not
+# be parsed in the background
+loadFailed = signals.Signal()
+
+
+def load(filename):
+    """Returns the Song for the MIDI file, parsing it only if it changed.
+
+    This function may be called from any thread. The lock is not held while
+    parsing, so two threads may parse the same file at the same time.
+    Raises one of the LOAD_ERRORS if the file can't be read or parsed.
+
+    """
+    with _lock:
+        try:
+            return _cache[filename]
+        except KeyError:
+            pass
+        old_digest, song = _digests.get(filename, (None, None))
+    with open(filename, 'rb') as f:
+        digest = hashlib.md5(f.read(), usedforsecurity=False).digest()
+    if digest != old_digest:
+        song = midifile.song.load(filename)
+    with _lock:
+        _digests[filename] = digest, song
+        _digests.move_to_end(filename)
+        while len(_digests) > MAX_SONGS:
+            _digests.popitem(False)
+        _cache[filename] = song
+    return song
+
+
+class Loader(background.Thread):
+    """Parses MIDI files in a background thread, filling the cache."""
+    def __init__(self, filenames):
+        super().__init__()
+        self._filenames = list(filenames)
+        self._errors = {}
+        self.finished.connect(self._finished)
+
+    def run(self):
+        for filename in self._filenames:
+            try:
+                load(filename)
+            except LOAD_ERRORS as e:
+                self._errors[filename] = e
+
+    def _finished(self):
+        """Called in the main thread, reports the files that failed."""
+        for filename, e in self._errors.items():
+            loadFailed(filename, e)
+
+
 class MidiFiles(plugin.DocumentPlugin):
     def __init__(self, document):
         self._files = None
         self.current = 0
         document.loaded.connect(self.invalidate, -100)
         job.manager.manager(document).finished.connect(self.invalidate, -100)
+        job.manager.manager(document).finished.connect(self.preload)
 
     def invalidate(self):
         self._files = None
 
+    def preload(self):
+        """Starts parsing the MIDI files in a background thread."""
+        files = resultfiles.results(self.document()).files('.mid*')
+        if files:
+            Loader(files).start()
+
     def update(self):
         files = resultfiles.results(self.document()).files('.mid*')
         self._files = files
@@ -56,12 +136,17 @@ class MidiFiles(plugin.DocumentPlugin):
     def __bool__(self):
         return bool(self._files)
 
+    def filename(self, index):
+        if self._files is None:
+            self.update()
+        return self._files[index]
+
     def song(self, index):
         if self._files is None:
             self.update()
         song = self._songs[index]
         if not song:
-            song = self._songs[index] = midifile.song.load(self._files[index])
+            song = self._songs[index] = load(self._files[index])
         return song
 
     def model(self):
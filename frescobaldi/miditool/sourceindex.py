@@ -0,0 +1,283 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Maps the playing time of a MIDI file to the notes in the source document.
+
+For every score with a \\midi block, a Timeline is built from the music tree
+(music.Document) that lists per voice the start and end time (in whole
+notes) and the source range of every note, chord and rest. Finding the notes
+that sound at a certain time costs a bisect per voice.
+
+Timelines are cached by the text of the score and of the toplevel
+assignments, and store positions relative to the score (or to the toplevel
+item outside the score, e.g. an assignment). So when the document changes,
+only the scores that changed are traversed again. Items with the same text
+are told apart by the number of times the text occurred before them.
+
+The MIDI files are mapped to the scores by their names, which are computed
+in the same way as LilyPond does it: per book the first score gets the name
+of the book, the others get a '-1', '-2' etc. suffix. Books are named after
+the document, unless they set \\bookOutputName or \\bookOutputSuffix.
+
+"""
+
+
+import bisect
+import collections
+import fractions
+import hashlib
+import itertools
+import os
+
+import ly.music.event
+import ly.music.items
+
+import documentinfo
+import fileinfo
+import plugin
+import resultfiles
+
+
+class Timeline:
+    """The notes of one score, per voice, sorted by time.
+
+    A voice is a tuple of the indices of the simultaneous music branches
+    leading to the notes.
+
+    """
+    def __init__(self):
+        self._voices = {}   # voice -> ([start times], [(end, anchor, pos, end_pos)])
+
+    def add(self, voice, time, end, anchor, pos, end_pos):
+        """Adds a note from time to end, at pos relative to the anchor."""
+        try:
+            times, notes = self._voices[voice]
+        except KeyError:
+            times, notes = self._voices[voice] = [], []
+        # notes in one voice mostly come in time order
+        i = len(times)
+        if i and times[-1] > time:
+            i = bisect.bisect_right(times, time)
+        times.insert(i, time)
+        notes.insert(i, (end, anchor, pos, end_pos))
+
+    def notes(self, time):
+        """Yields (anchor, pos, end_pos) for every note sounding at time."""
+        for times, notes in self._voices.values():
+            i = bisect.bisect_right(times, time) - 1
+            if i >= 0 and time < notes[i][0]:
+                yield notes[i][1:]
+
+
+class Events(ly.music.event.Events):
+    """Traverses a score and records the notes in a Timeline."""
+    def __init__(self, score, anchor, keys):
+        self.timeline = Timeline()
+        self._score = score
+        self._anchor = anchor
+        self._keys = keys
+        self._voice = ()
+
+    def traverse(self, node, time, scaling):
+        if isinstance(node, ly.music.items.MusicList) and node.simultaneous:
+            voice, end = self._voice, time
+            for i, n in enumerate(node):
+                self._voice = voice + (i,)
+                end = max(end, self.traverse(n, time, scaling))
+            self._voice = voice
+            return end
+        end = node.events(self, time, scaling)
+        if (end > time and isinstance(node, ly.music.items.Durable)
+                and not isinstance(node, ly.music.items.Skip)
+                and node.document is self._score.document):
+            anchor = self.anchor(node)
+            if anchor:
+                key, start = anchor
+                self.timeline.add(self._voice, time, end, key,
+                    node.position - start, node.end_position() - start)
+        return end
+
+    def anchor(self, node):
+        """Returns (key, position) of the score or toplevel item node is in."""
+        for parent in node.ancestors():
+            if parent is self._score:
+                return self._anchor
+            elif isinstance(parent, ly.music.items.Document):
+                return self._keys[node.position], node.position
+            node = parent
+
+    def read_score(self):
+        """Traverses the music in the score and returns the Timeline."""
+        time = 0
+        for node in self._score:
+            if isinstance(node, ly.music.items.Music):
+                time = self.traverse(node, time, 1)
+        return self.timeline
+
+
+def key(text, node):
+    """Returns a key for the node, based on its text."""
+    text = text[node.position:node.end_position()]
+    return hashlib.md5(text.encode('utf-8'), usedforsecurity=False).digest()
+
+
+def scores(node):
+    """Yields the Score nodes containing a \\midi block."""
+    for n in node:
+        if isinstance(n, (ly.music.items.Book, ly.music.items.BookPart)):
+            yield from scores(n)
+        elif isinstance(n, ly.music.items.Score):
+            if any(isinstance(c, ly.music.items.Midi) for c in n):
+                yield n
+
+
+def book_output(node):
+    """Returns (name, suffix) set by \\bookOutputName and \\bookOutputSuffix.
+
+    Both are None if not set.
+
+    """
+    output = {'\\bookOutputName': None, '\\bookOutputSuffix': None}
+    nodes = list(node)
+    for command, arg in zip(nodes, nodes[1:]):
+        if (isinstance(command, ly.music.items.Command)
+                and command.token in output
+                and isinstance(arg, ly.music.items.String)):
+            output[command.token] = arg.value()
+    return output['\\bookOutputName'], output['\\bookOutputSuffix']
+
+
+def outputs(document):
+    """Yields (name, tail, score) for every Score with a \\midi block.
+
+    name + tail is the name of the MIDI file without directory and
+    extension; name is None if it is the basename of the document.
+    Scores outside a book are in the toplevel book, which is written
+    after the other books.
+
+    """
+    counts = collections.Counter()
+    def book(node, scores):
+        name, suffix = book_output(node)
+        tail = ''
+        if suffix:
+            tail += '-' + fileinfo.replace_suffix_chars(suffix)
+        count = counts[name, suffix]
+        counts[name, suffix] += 1
+        if count:
+            tail += '-{}'.format(count)
+        for i, score in enumerate(scores):
+            yield name, tail + ('-{}'.format(i) if i else ''), score
+    toplevel = []
+    for node in document:
+        if isinstance(node, ly.music.items.Book):
+            yield from book(node, scores(node))
+        elif isinstance(node, (ly.music.items.BookPart, ly.music.items.Score)):
+            toplevel.extend(scores([node]))
+    if toplevel:
+        yield from book(document, toplevel)
+
+
+class SourceIndex(plugin.DocumentPlugin):
+    """Maps the playing time of the MIDI files to the notes in the document.
+
+    The index is brought up to date lazily, when it is used after the
+    document has changed.
+
+    """
+    def __init__(self, document):
+        self._dirty = True
+        self._timelines = []    # (name, tail, Timeline), see outputs()
+        self._starts = {}       # anchor key -> current position
+        self._cache = {}        # (score key, assignments key) -> Timeline
+        document.contentsChanged.connect(self.invalidate)
+
+    def invalidate(self):
+        """Called when the document changes."""
+        self._dirty = True
+
+    def update(self):
+        """Rebuilds the index if the document changed."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        m = documentinfo.music(self.document())
+        text = m.document.plaintext()
+        starts = {}             # anchor key -> position
+        keys = {}               # position -> anchor key
+        counts = collections.Counter()
+        assignments = hashlib.md5(usedforsecurity=False)
+        for node in itertools.chain(m, scores(m)):
+            if node.position not in keys:
+                digest = key(text, node)
+                k = keys[node.position] = (digest, counts[digest])
+                counts[digest] += 1
+                starts[k] = node.position
+                if isinstance(node, ly.music.items.Assignment):
+                    assignments.update(digest)
+        assignments = assignments.digest()
+        cache = {}
+        timelines = []
+        for name, tail, score in outputs(m):
+            k = keys[score.position]
+            timeline = self._cache.get((k, assignments))
+            if timeline is None:
+                timeline = Events(score, (k, score.position), keys).read_score()
+            cache[(k, assignments)] = timeline
+            timelines.append((name, tail, timeline))
+        self._starts = starts
+        self._cache = cache
+        self._timelines = timelines
+
+    def timeline(self, filename):
+        """Returns the Timeline of the score that created the MIDI file.
+
+        Returns None if the MIDI file can't be mapped to a score.
+
+        """
+        self.update()
+        jobfile = resultfiles.results(self.document()).jobfile()
+        if not jobfile:
+            return
+        dirname, basename = os.path.split(os.path.splitext(jobfile)[0])
+        path = os.path.splitext(os.path.normpath(filename))[0]
+        for name, tail, timeline in self._timelines:
+            if path == os.path.normpath(
+                    os.path.join(dirname, (name or basename) + tail)):
+                return timeline
+
+    def positions(self, filename, song, msec):
+        """Returns a list of (start, end) source ranges of the notes playing.
+
+        filename is the MIDI file, song the midifile Song and msec the
+        playing time.
+
+        """
+        timeline = self.timeline(filename)
+        if timeline is None or song.division & 0x8000:
+            return []
+        midi_time = song.tempo_map.midi_time(msec * 1000)
+        time = fractions.Fraction(midi_time, song.division * 4)
+        result = []
+        for anchor, pos, end_pos in timeline.notes(time):
+            start = self._starts.get(anchor)
+            if start is not None:
+                result.append((start + pos, start + end_pos))
+        return result
@@ -22,7 +22,10 @@ The MIDI tool widget.
 """
 
 
+import os
+
 from PyQt6.QtCore import Qt, QTimer, QSettings
+from PyQt6.QtGui import QTextCursor
 from PyQt6.QtWidgets import (
     QWidget, QComboBox, QToolButton, QSlider, QGridLayout, QSizePolicy, QLabel)
 
@@ -32,10 +35,12 @@ import qutil
 import listmodel
 import midihub
 import gadgets.drag
+import viewhighlighter
 
 from . import midifiles
 from . import output
 from . import player
+from . import sourceindex
 
 
 class Widget(QWidget):
@@ -94,6 +99,7 @@ class Widget(QWidget):
         midihub.settingsChanged.connect(self.clearMidiSettings, -100)
         midihub.settingsChanged.connect(self.readMidiSettings)
         app.documentClosed.connect(self.slotDocumentClosed)
+        midifiles.loadFailed.connect(self.slotLoadFailed)
         app.translateUI(self)
         self.readMidiSettings()
         d = dockwidget.mainwindow().currentDocument()
@@ -143,12 +149,28 @@ class Widget(QWidget):
         else:
             self._timeSliderTicker.stop()
             self.updateTimeSlider()
+            view = self.parentWidget().mainwindow().currentView()
+            if view:
+                viewhighlighter.highlighter(view).clear("musichighlight")
             self._stopButton.setDefaultAction(ac.midi_restart)
             self._playButton.setDefaultAction(ac.midi_play)
+            self.updateTimingInfo()
             # close the output if the preference is set
             if QSettings().value("midi/close_outputs", False, bool):
                 self._outputCloseTimer.start()
 
+    def updateTimingInfo(self):
+        """Shows the timing statistics of the last playback in the tooltip."""
+        lateness = self._player.lateness()
+        if lateness.count:
+            self._display.setToolTip(_(
+                "Timing of the last playback:\n"
+                "average lateness: {mean:.1f} ms\n"
+                "jitter: {jitter:.1f} ms\n"
+                "maximum lateness: {maximum:.1f} ms").format(
+                mean=lateness.mean(), jitter=lateness.jitter(),
+                maximum=lateness.maximum))
+
     def play(self):
         """Starts the MIDI player, opening an output if necessary."""
         if not self._player.is_playing() and not self._player.has_events():
@@ -175,8 +197,13 @@ class Widget(QWidget):
         if self._document:
             files = midifiles.MidiFiles.instance(self._document)
             index = self._fileSelector.currentIndex()
-            if files and (files.song(index) is not self._player.song()):
-                self.loadSong(index)
+            if files:
+                try:
+                    changed = files.song(index) is not self._player.song()
+                except midifiles.LOAD_ERRORS:
+                    changed = True
+                if changed:
+                    self.loadSong(index)
 
     def slotTempoChanged(self, value):
         """Called when the user drags the tempo."""
@@ -205,6 +232,29 @@ class Widget(QWidget):
     def updateDisplayBeat(self, measnum, beat, num, den):
         if not self._timeSlider.isSliderDown():
             self._display.setBeat(measnum, beat, num, den)
+        self.followPlayback()
+
+    def followPlayback(self):
+        """Highlights the notes that are playing in the current editor view."""
+        view = self.parentWidget().mainwindow().currentView()
+        song = self._player.song()
+        if not view or not song or view.document() is not self._document:
+            return
+        files = midifiles.MidiFiles.instance(self._document)
+        filename = files.filename(self._fileSelector.currentIndex())
+        index = sourceindex.SourceIndex.instance(self._document)
+        cursors = []
+        for start, end in index.positions(filename, song,
+                                          self._player.current_time()):
+            cursor = QTextCursor(self._document)
+            cursor.setPosition(start)
+            cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+            cursors.append(cursor)
+        highlighter = viewhighlighter.highlighter(view)
+        if cursors:
+            highlighter.highlight("musichighlight", cursors, 2)
+        else:
+            highlighter.clear("musichighlight")
 
     def updateDisplayTime(self, time):
         if not self._timeSlider.isSliderDown():
@@ -244,7 +294,14 @@ class Widget(QWidget):
 
     def loadSong(self, index):
         files = midifiles.MidiFiles.instance(self._document)
-        self._player.set_song(files.song(index))
+        try:
+            song = files.song(index)
+        except midifiles.LOAD_ERRORS:
+            self._player.clear()
+            self.updateTimeSlider()
+            self.showLoadError(files.filename(index))
+            return
+        self._player.set_song(song)
         m, s = divmod(self._player.total_time() // 1000, 60)
         name = self._fileSelector.currentText()
         self.updateTimeSlider()
@@ -253,6 +310,20 @@ class Widget(QWidget):
             _("midi lcd screen", "LOADED"), name,
             _("midi lcd screen", "TOTAL"), f"{m}:{s:02}")
 
+    def showLoadError(self, filename):
+        """Shows on the display that the MIDI file could not be loaded."""
+        self._display.reset()
+        self._display.statusMessage(
+            _("midi lcd screen", "ERROR"), os.path.basename(filename))
+
+    def slotLoadFailed(self, filename, exception):
+        """Called when a MIDI file could not be parsed in the background."""
+        if self._document and not self._player.is_playing():
+            files = midifiles.MidiFiles.instance(self._document)
+            index = self._fileSelector.currentIndex()
+            if files and index >= 0 and files.filename(index) == filename:
+                self.showLoadError(filename)
+
     def slotFileSelected(self, index):
         if self._document:
             self._player.stop()
@@ -32,6 +32,7 @@ import qpageview.locking
 
 import util
 import textedit
+import linkcache
 import pointandclick
 
 from PyQt6.QtCore import QPointF, QRectF
@@ -51,23 +52,43 @@ def links(document):
     except KeyError:
         l = _cache[key] = Links()
         with l:
-            with qpageview.locking.lock(document):
-                for num, page in enumerate(document.pages()):
-                    for link in page.links():
-                        t = textedit.link(link.url)
-                        if t:
-                            filename = util.normpath(t.filename)
-                            area = QRectF(QPointF(*link.area[0:2]), QPointF(*link.area[2:4]))
-                            l.add_link(filename, t.line, t.column, (num, area))
+            for filename, line, column, num, area in linkcache.links(
+                    document.filename(), lambda pages: extract(document, pages),
+                    document.pageCount()):
+                area = QRectF(QPointF(*area[0:2]), QPointF(*area[2:4]))
+                l.add_link(filename, line, column, (num, area))
         return l
 
 
-class Links(pointandclick.Links):
+def extract(document, pages=None):
+    """Return the textedit links of the document as a list of tuples.
+
+    If given, pages is a list of the page numbers to extract the links from.
+    See the linkcache module for the format.
+
+    """
+    result = []
+    with qpageview.locking.lock(document):
+        allpages = document.pages()
+        for num in range(len(allpages)) if pages is None else pages:
+            for link in allpages[num].links():
+                t = textedit.link(link.url)
+                if t:
+                    filename = util.normpath(t.filename)
+                    result.append((filename, t.line, t.column, num, tuple(link.area)))
+    return result
+
+
+class Links(pointandclick.PageLinks):
     """Stores all the links of a PDF document sorted by URL and text position.
 
     Only textedit:// urls are stored.
 
     """
+    def __init__(self):
+        super().__init__()
+        self._textLinks = {}
+
     def cursor(self, link, load=False):
         """Returns the destination of a link as a QTextCursor of the destination document.
 
@@ -83,6 +104,26 @@ class Links(pointandclick.Links):
             filename = util.normpath(t.filename)
             return super().cursor(filename, t.line, t.column, load)
 
+    def linkAt(self, num, x, y):
+        """Return a Link for the textedit link at x, y on page num, or None.
+
+        The links are found using the index of the page, x and y are in the
+        range 0.0 - 1.0. The same Link object is returned for the same link.
+
+        """
+        import qpageview.link
+        entries = self.linksAt(num, x, y)
+        if entries:
+            area, (filename, line, column) = entries[0]
+            coords = area.getCoords()
+            key = (num, coords, filename, line, column)
+            try:
+                return self._textLinks[key]
+            except KeyError:
+                link = self._textLinks[key] = qpageview.link.Link(
+                    *coords, url=textedit.url(filename, line, column))
+                return link
+
 
 positions = pointandclick.positions
 
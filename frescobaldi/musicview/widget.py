@@ -77,6 +77,7 @@ class MusicView(QWidget):
         self.view.linkLeft.connect(self.slotLinkLeft)
         #self.view.setShowUrlTips(False)
         self.view.linkHelpRequested.connect(self.slotLinkHelpRequested)
+        self.view.rubberband().selectionChanged.connect(self.slotSelectionChanged)
 
         self.view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.view.customContextMenuRequested.connect(self.showContextMenu)
@@ -96,12 +97,14 @@ class MusicView(QWidget):
         self._links = None
         self._highlightRange = None
         self._links = pointandclick.links(doc)
+        self.view.setPointAndClickLinks(self._links)
         self.view.setDocument(doc)
 
     def clear(self):
         """Empties the view."""
         self._links = None
         self._highlightRange = None
+        self.view.setPointAndClickLinks(None)
         self.view.clear()
 
     def readSettings(self):
@@ -171,6 +174,19 @@ class MusicView(QWidget):
         view = self.parent().mainwindow().currentView()
         viewhighlighter.highlighter(view).clear(self._highlightFormat)
 
+    def slotSelectionChanged(self, rect):
+        """Called when the rubberband selection changes.
+
+        The tokens of the objects inside the selection that point to the
+        current editor document are highlighted using a transparent
+        selection color, see viewhighlighter.highlight_selection().
+
+        """
+        view = self.parent().mainwindow().currentView()
+        if view:
+            viewhighlighter.highlight_selection(view, self.view,
+                self._links if rect else None, self._highlightFormat)
+
     def slotLinkHelpRequested(self, ev, page, link):
         """Called when a ToolTip wants to appear above the hovered link."""
         pos = self.view.viewport().mapToGlobal(ev.pos())
@@ -24,20 +24,32 @@ This is used throughout Frescobaldi, to obey color settings etc.
 
 """
 
+import collections
+import hashlib
 import itertools
 import os
 import platform
+import time
 
-from PyQt6.QtCore import pyqtSignal, QMargins, QSettings, Qt
+from PyQt6.QtCore import pyqtSignal, QCoreApplication, QMargins, QSettings, Qt
+from PyQt6.QtPdf import QPdfDocument
 from PyQt6.QtWidgets import QMessageBox
 from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
 
 import app
+import background
 import icons
+import pdfcontent
+import plugin
+import resultfiles
 import textformats
 import qpageview
+import qpageview.cache
+import qpageview.render
 import qpageview.view
 import qpageview.layout
+import qpageview.locking
+import qpageview.pdf
 import qpageview.printing
 import qpageview.magnifier
 import qpageview.viewactions
@@ -71,6 +83,280 @@ class Magnifier(qpageview.magnifier.Magnifier):
         QSettings().setValue("musicview/magnifier/size", ev.size().width())
 
 
+class ImageCache(qpageview.cache.ImageCache):
+    """The cache for rendered images, shared by all viewers in Frescobaldi.
+
+    The maximum size is read from the preferences. Images are marked when
+    they are used, so the least recently used images are purged first.
+    The hits and misses are counted, see stats().
+
+    """
+    def __init__(self):
+        super().__init__()
+        self.hits = 0
+        self.misses = 0
+        app.settingsChanged.connect(self.readSettings)
+        self.readSettings()
+
+    def readSettings(self):
+        # qpageview's prepare() resets maxsize to (at least) the class attribute
+        # before rendering, so the budget is set on the class as well
+        maxsize = QSettings().value("musicview/image_cache_size", 200, int) * 1048576
+        type(self).maxsize = self.maxsize = maxsize
+
+    def tileset(self, key):
+        """Reimplemented to count hits and misses and to mark the images used."""
+        tileset = super().tileset(key)
+        if tileset:
+            self.hits += 1
+            now = time.time()
+            for entry in tileset.values():
+                entry.time = now
+        else:
+            self.misses += 1
+        return tileset
+
+    def stats(self):
+        """Return a dictionary with the hits, misses, bytes and maxsize of the cache."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'bytes': self.currentsize,
+            'maxsize': self.maxsize,
+        }
+
+
+def imageCache():
+    """Return the ImageCache used by all renderers."""
+    return qpageview.render.AbstractRenderer.cache
+
+
+class PageContent:
+    """Identifies the contents of a PDF page, used as cache group for rendered images."""
+    __slots__ = ('digest', '__weakref__')
+
+    def __init__(self, digest):
+        self.digest = digest
+
+
+# keep the most recently used PageContent instances alive, as the image cache
+# only stores weak references to them
+_pageContents = collections.OrderedDict()
+_MAX_PAGE_CONTENTS = 1000
+
+
+def pageContent(page):
+    """Return a PageContent instance describing the contents of a PdfPage.
+
+    The contents are identified by the page size and the digest of the page's
+    content streams and resources (see pdfcontent), which is computed by the
+    PdfLoader. Without a digest the modification time of the file is used
+    instead, so the images are then only reused for the same file.
+    Returns None if the page was not loaded from a file.
+
+    """
+    doc, num = page.document, page.pageNumber
+    if not page.filename:
+        return None
+    contents = page.digest
+    if contents is None:
+        try:
+            contents = (page.filename, os.path.getmtime(page.filename))
+        except OSError:
+            return None
+    md = hashlib.md5(usedforsecurity=False)
+    with qpageview.locking.lock(doc):
+        size = doc.pagePointSize(num)
+    md.update(repr((size.width(), size.height(), contents)).encode('utf-8'))
+    digest = md.hexdigest()
+    try:
+        content = _pageContents[digest]
+    except KeyError:
+        content = _pageContents[digest] = PageContent(digest)
+        while len(_pageContents) > _MAX_PAGE_CONTENTS:
+            _pageContents.popitem(False)
+    else:
+        _pageContents.move_to_end(digest)
+    return content
+
+
+class PdfPage(qpageview.pdf.PdfPage):
+    """A PdfPage that caches its rendered images by page content.
+
+    When LilyPond rewrites a PDF, mostly only a few pages really change.
+    The unchanged pages then reuse the images that were rendered for the
+    previous version of the document, instead of being rendered again.
+
+    """
+    _content = False
+    filename = ""   # set by PdfDocument.createPages()
+    digest = None   # idem
+
+    def content(self):
+        """Return the PageContent for this page, or None (see pageContent())."""
+        if self._content is False:
+            self._content = pageContent(self)
+        return self._content
+
+    def group(self):
+        """Reimplemented to return the page content if available."""
+        return self.content() or self.document
+
+    def ident(self):
+        """Reimplemented to return None if the page content is the group."""
+        return None if self.content() else self.pageNumber
+
+
+class PdfDocument(qpageview.pdf.PdfDocument):
+    """A PdfDocument using our PdfPage."""
+    pageClass = PdfPage
+    _digests = None
+
+    def createPages(self):
+        """Reimplemented to tell the pages the file they are displayed from.
+
+        The pages also get the digest of their contents, if known.
+
+        """
+        pages = list(super().createPages())
+        digests = self._digests
+        if not digests or len(digests) != len(pages):
+            digests = itertools.repeat(None)
+        for page, digest in zip(pages, digests):
+            page.filename = self.filename()
+            page.digest = digest
+        return pages
+
+    def setSource(self, source, document=None, digests=None):
+        """Reimplemented to optionally set an already loaded QPdfDocument.
+
+        The document must have been loaded from the source, e.g. by the
+        PdfLoader. If None, the source is loaded lazily when needed.
+        The digests, if given, are the page digests computed by the PdfLoader
+        (see pdfcontent.page_digests()).
+
+        """
+        self._digests = digests
+        super().setSource(source)
+        self._document = document
+
+
+class PdfLoader(background.Thread):
+    """Loads PDF files in a background thread.
+
+    Connect to the finished() signal and then call documents() to get the
+    loaded QPdfDocument instances, which can be given to
+    PdfDocument.setSource() or loadPdf(), together with the page digests
+    returned by digests().
+
+    """
+    def __init__(self, filenames):
+        super().__init__()
+        self._filenames = list(filenames)
+        self._documents = {}
+        self._digests = {}
+
+    def run(self):
+        """Load the files, moving the loaded documents to the main thread.
+
+        Also computes the digests of the pages, so that this is not done
+        in the main thread.
+
+        """
+        mainthread = QCoreApplication.instance().thread()
+        for filename in self._filenames:
+            doc = QPdfDocument()
+            if doc.load(filename) == QPdfDocument.Error.None_:
+                doc.moveToThread(mainthread)
+                self._documents[filename] = doc
+                self._digests[filename] = pdfcontent.page_digests(filename)
+
+    def documents(self):
+        """Return a dictionary mapping the filenames to the loaded QPdfDocuments.
+
+        Files that could not be loaded are not in the dictionary.
+
+        """
+        return self._documents
+
+    def digests(self):
+        """Return a dictionary mapping the filenames to the page digests.
+
+        The values are lists as returned by pdfcontent.page_digests() or None.
+
+        """
+        return self._digests
+
+
+class PdfDocumentGroup(plugin.DocumentPlugin):
+    """Base class for a group of PDF documents created by a text document.
+
+    The Music View and the viewers each have their own DocumentGroup, which
+    implements update() to (re)load the PDF documents and documentsUpdated()
+    to notify the viewers.
+
+    """
+    def __init__(self, document):
+        self._documents = None
+        self._loader = None
+        document.loaded.connect(self.update, -100)
+
+    def documents(self):
+        """Returns the list of PDF Document objects created by our text document."""
+        # If the list is asked for the very first time, update
+        if self._documents is None:
+            self._documents = []
+            self.update()
+        return self._documents[:]
+
+    def load(self, job):
+        """Loads the PDF files created by the job in a background thread.
+
+        When all files are loaded, update() is called with the loaded files
+        and, if there are new documents, documentsUpdated() is called.
+        If there are no PDF files at all anymore, the documents are removed
+        and documentsUpdated() is called as well.
+
+        """
+        newer = QSettings().value("musicview/newer_files_only", True, bool)
+        results = resultfiles.results(self.document())
+        files = results.files(".pdf", newer)
+        if not files:
+            self._loader = None
+            if self._documents and not results.files(".pdf", False):
+                self._documents = []
+                self.documentsUpdated(job)
+            return
+        loader = self._loader = PdfLoader(files)
+        def finished():
+            if self._loader is loader:
+                self._loader = None
+                if self.document() and self.update(newer, loader.documents(), loader.digests()):
+                    self.documentsUpdated(job)
+        loader.finished.connect(finished)
+        loader.start()
+
+    def update(self, newer=None, loaded=None, digests=None):
+        """Queries the resultfiles of this text document for PDF files and loads them.
+
+        Returns True if new documents were loaded.
+        If newer is True, only PDF files newer than the source document are returned.
+        If newer is False, all PDF files are returned.
+        If newer is None (default), the setting from the configuration is used.
+        If given, loaded is a dictionary mapping filenames to already loaded
+        QPdfDocument instances and digests a dictionary mapping filenames to
+        the page digests (see PdfLoader).
+
+        Must be implemented.
+
+        """
+        raise NotImplementedError
+
+    def documentsUpdated(self, job):
+        """Called when load() changed the documents; the default does nothing."""
+        pass
+
+
 class PagedView(qpageview.widgetoverlay.WidgetOverlayViewMixin, qpageview.View):
     """A View based on qpageview.View.
 
@@ -83,11 +369,38 @@ class PagedView(qpageview.widgetoverlay.WidgetOverlayViewMixin, qpageview.View):
     def __init__(self, parent=None):
         super().__init__(parent)
         self._printer = None
+        self._pointAndClickLinks = None
         self.documentPropertyStore = qpageview.view.DocumentPropertyStore()
         self.setMagnifier(Magnifier())
         app.settingsChanged.connect(self.readSettings)
         self.readSettings()
 
+    def setPointAndClickLinks(self, links):
+        """Set the point and click Links of the displayed document, or None.
+
+        If set, the textedit links under the mouse are found using the
+        index of its pages, see linkAt().
+
+        """
+        self._pointAndClickLinks = links
+
+    def linkAt(self, pos):
+        """Reimplemented to find textedit links using the point and click Links.
+
+        Other links are found by qpageview.
+
+        """
+        links = self._pointAndClickLinks
+        if links:
+            layoutPos = pos - self.layoutPosition()
+            page = self.pageLayout().pageAt(layoutPos)
+            if page:
+                point = page.mapFromPage(1, 1).point(layoutPos - page.pos())
+                link = links.linkAt(self.pageLayout().index(page), point.x(), point.y())
+                if link:
+                    return page, link
+        return super().linkAt(pos)
+
     def readSettings(self):
         # strict paging with pageup/pagedown
         self.strictPagingEnabled = QSettings().value("musicview/strict_paging", False, bool)
@@ -139,8 +452,8 @@ class PagedView(qpageview.widgetoverlay.WidgetOverlayViewMixin, qpageview.View):
             self.rerender()
 
     def loadPdf(self, filename, renderer=None):
-        """Reimplemented to use a customized renderer by default."""
-        super().loadPdf(filename, renderer or getRenderer("pdf"))
+        """Reimplemented to use a customized renderer and PdfDocument by default."""
+        self.setDocument(PdfDocument(filename, renderer or getRenderer("pdf")))
 
     def loadSvgs(self, filenames, renderer=None):
         """Reimplemented to use a customized renderer by default."""
@@ -262,9 +575,17 @@ def getRenderer(rendertype):
     return r
 
 
-def loadPdf(filename):
-    """Like qpageview.loadPdf(), but uses a preconfigured renderer."""
-    return qpageview.loadPdf(filename, getRenderer("pdf"))
+def loadPdf(filename, document=None, digests=None):
+    """Like qpageview.loadPdf(), but uses a preconfigured renderer and our PdfDocument.
+
+    If given, document is the QPdfDocument already loaded from the file and
+    digests the list of page digests, e.g. by a PdfLoader.
+
+    """
+    doc = PdfDocument(filename, getRenderer("pdf"))
+    if document or digests:
+        doc.setSource(filename, document, digests)
+    return doc
 
 
 def loadSvgs(filenames):
@@ -275,3 +596,7 @@ def loadSvgs(filenames):
 def loadImages(filenames):
     """Like qpageview.loadImages(), but uses a preconfigured renderer."""
     return qpageview.loadImages(filenames, getRenderer("image"))
+
+
+# all renderers share the same image cache
+qpageview.render.AbstractRenderer.cache = ImageCache()
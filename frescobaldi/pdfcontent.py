@@ -0,0 +1,428 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2019 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Reads the content streams and resources of the pages of a PDF file.
+
+QtPdf does not give access to the page contents, so this module reads just
+enough of the PDF structure (cross-reference tables and streams, object
+streams and the page tree) to find the content streams and the resources
+(fonts, images, etc.) of every page. The streams are not decoded, their raw
+bytes are used to compute a digest. A second digest per page covers the
+annotations (links) and the size of the page.
+
+Only uses the standard library.
+
+"""
+
+
+import collections
+import hashlib
+import re
+import threading
+import zlib
+
+import filecache
+
+
+_cache = filecache.FileCache(16)
+_lock = threading.Lock()
+
+
+def page_digests(filename):
+    """Return a list with an MD5 hex digest of the contents of every page.
+
+    The digest covers the content streams and the resources of the page.
+
+    Returns None if the file can't be read or its structure is not
+    understood.
+
+    """
+    digests = _digests(filename)
+    return digests and digests[0]
+
+
+def link_digests(filename):
+    """Return a list with an MD5 hex digest of the links of every page.
+
+    The digest covers the annotations, the boxes and the rotation of the
+    page, so it changes when the links or their areas on the page change.
+
+    Returns None if the file can't be read or its structure is not
+    understood.
+
+    """
+    digests = _digests(filename)
+    return digests and digests[1]
+
+
+def _digests(filename):
+    """Return the (cached) two lists of page_digests() and link_digests()."""
+    with _lock:
+        try:
+            return _cache[filename]
+        except KeyError:
+            pass
+    try:
+        with open(filename, 'rb') as f:
+            reader = Reader(f.read())
+        contents = []
+        links = []
+        for page, inherited in reader.pages():
+            contents.append(hashlib.md5(b''.join(reader.page_contents(page))
+                + reader.serialize(inherited.get('Resources')),
+                usedforsecurity=False).hexdigest())
+            links.append(hashlib.md5(reader.serialize([page.get('Annots')]
+                + [inherited.get(key) for key in ('MediaBox', 'CropBox', 'Rotate')]),
+                usedforsecurity=False).hexdigest())
+        digests = contents, links
+    except OSError:
+        return None
+    except (LookupError, TypeError, ValueError, RecursionError, zlib.error):
+        digests = None
+    with _lock:
+        _cache[filename] = digests
+    return digests
+
+
+Ref = collections.namedtuple('Ref', 'num gen')
+
+
+class Name(str):
+    """A PDF name object (without the leading slash)."""
+    __slots__ = ()
+
+
+class Stream:
+    """A PDF stream: the dictionary and the raw (undecoded) data."""
+    __slots__ = ('dict', 'data')
+
+    def __init__(self, dict, data):
+        self.dict = dict
+        self.data = data
+
+
+_ws = rb'\x00\t\n\x0c\r '
+_delim = rb'()<>\[\]{}/%'
+_token_re = re.compile(rb'(?:[' + _ws + rb']+|%[^\r\n]*)*'
+    rb'(<<|>>|[\[\]{}(]|<[^>]*>|/[^' + _ws + _delim + rb']*|[^' + _ws + _delim + rb']+)')
+_int_re = re.compile(rb'[+-]?\d+$')
+_stream_re = re.compile(rb'[' + _ws + rb']*stream\r?\n')
+_keywords = {b'true': True, b'false': False, b'null': None}
+_inheritable = ('Resources', 'MediaBox', 'CropBox', 'Rotate')
+
+
+def token(data, pos):
+    """Return the next token and the position after it."""
+    m = _token_re.match(data, pos)
+    if not m:
+        raise ValueError("no token at {0}".format(pos))
+    return m.group(1), m.end()
+
+
+def string_end(data, pos):
+    """Return the position after the literal string that starts before pos."""
+    depth = 1
+    while depth:
+        c = data[pos]
+        if c == 0x5C:   # backslash
+            pos += 1
+        elif c == 0x28:
+            depth += 1
+        elif c == 0x29:
+            depth -= 1
+        pos += 1
+    return pos
+
+
+def parse(data, pos):
+    """Parse a PDF object at pos; return the value and the position after it.
+
+    Dictionaries and arrays become dicts and lists, names become Name
+    instances, strings bytes and indirect references Ref tuples.
+
+    """
+    tok, pos = token(data, pos)
+    if tok == b'<<':
+        d = {}
+        while True:
+            key, end = token(data, pos)
+            if key == b'>>':
+                return d, end
+            if not key.startswith(b'/'):
+                raise ValueError("name expected at {0}".format(pos))
+            d[Name(key[1:].decode('latin1'))], pos = parse(data, end)
+    elif tok == b'[':
+        l = []
+        while True:
+            tok, end = token(data, pos)
+            if tok == b']':
+                return l, end
+            value, pos = parse(data, pos)
+            l.append(value)
+    elif tok == b'(':
+        end = string_end(data, pos)
+        return data[pos:end-1], end
+    elif tok.startswith(b'<'):
+        return bytes.fromhex(tok[1:-1].decode('latin1')), pos
+    elif tok.startswith(b'/'):
+        return Name(tok[1:].decode('latin1')), pos
+    elif tok in _keywords:
+        return _keywords[tok], pos
+    elif _int_re.match(tok):
+        # an indirect reference is "num gen R"
+        try:
+            gen, end = token(data, pos)
+            r, end = token(data, end)
+        except ValueError:
+            pass
+        else:
+            if r == b'R' and _int_re.match(gen):
+                return Ref(int(tok), int(gen)), end
+        return int(tok), pos
+    return float(tok), pos
+
+
+def png_unpredict(data, columns, bpp):
+    """Undo the PNG predictors of the rows of data."""
+    result = bytearray()
+    prev = bytearray(columns)
+    rowlen = columns + 1
+    for i in range(0, len(data), rowlen):
+        kind, row = data[i], bytearray(data[i+1:i+rowlen])
+        for j in range(len(row)):
+            left = row[j-bpp] if j >= bpp else 0
+            up = prev[j]
+            if kind == 1:
+                row[j] = (row[j] + left) & 0xFF
+            elif kind == 2:
+                row[j] = (row[j] + up) & 0xFF
+            elif kind == 3:
+                row[j] = (row[j] + (left + up) // 2) & 0xFF
+            elif kind == 4:
+                upleft = prev[j-bpp] if j >= bpp else 0
+                p = left + up - upleft
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - upleft)
+                pred = left if pa <= pb and pa <= pc else up if pb <= pc else upleft
+                row[j] = (row[j] + pred) & 0xFF
+            elif kind:
+                raise ValueError("unknown PNG predictor {0}".format(kind))
+        result += row
+        prev = row
+    return bytes(result)
+
+
+class Reader:
+    """Reads the objects of a PDF document from its bytes."""
+    def __init__(self, data):
+        self.data = data
+        self.xref = {}      # num: (1, offset) or (2, objstm, index)
+        self.trailer = {}
+        self._objects = {}
+        self._objstms = {}
+        self._serialized = {}
+        pos = data.rfind(b'startxref')
+        if pos == -1:
+            raise ValueError("startxref not found")
+        offset, pos = token(data, pos + 9)
+        self._read_xref(int(offset))
+
+    def _read_xref(self, offset):
+        """Read the cross-reference sections, starting with the latest one."""
+        seen = set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            tok, pos = token(self.data, offset)
+            if tok == b'xref':
+                trailer = self._read_xref_table(pos)
+                if isinstance(trailer.get('XRefStm'), int):
+                    self._read_xref_stream(trailer['XRefStm'])
+            else:
+                trailer = self._read_xref_stream(offset)
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)
+            offset = trailer.get('Prev')
+
+    def _read_xref_table(self, pos):
+        """Read a classic cross-reference table; return the trailer."""
+        data = self.data
+        while True:
+            tok, pos = token(data, pos)
+            if tok == b'trailer':
+                return parse(data, pos)[0]
+            start = int(tok)
+            count, pos = token(data, pos)
+            for num in range(start, start + int(count)):
+                offset, pos = token(data, pos)
+                gen, pos = token(data, pos)
+                kind, pos = token(data, pos)
+                if kind == b'n':
+                    self.xref.setdefault(num, (1, int(offset)))
+
+    def _read_xref_stream(self, offset):
+        """Read a cross-reference stream; return its dictionary."""
+        stream = self._parse_indirect(offset)
+        d = stream.dict
+        w = d['W']
+        index = d.get('Index', [0, d['Size']])
+        data = self.decode(stream)
+        pos = 0
+        for start, count in zip(index[::2], index[1::2]):
+            for num in range(start, start + count):
+                fields = []
+                for size in w:
+                    fields.append(int.from_bytes(data[pos:pos+size], 'big'))
+                    pos += size
+                kind = fields[0] if w[0] else 1
+                if kind == 1:
+                    self.xref.setdefault(num, (1, fields[1]))
+                elif kind == 2:
+                    self.xref.setdefault(num, (2, fields[1], fields[2]))
+        return d
+
+    def _parse_indirect(self, offset):
+        """Parse the indirect object "num gen obj ..." at offset."""
+        data = self.data
+        num, pos = token(data, offset)
+        gen, pos = token(data, pos)
+        tok, pos = token(data, pos)
+        if tok != b'obj':
+            raise ValueError("object expected at {0}".format(offset))
+        value, pos = parse(data, pos)
+        if isinstance(value, dict):
+            m = _stream_re.match(data, pos)
+            if m:
+                start = m.end()
+                length = self.resolve(value['Length'])
+                return Stream(value, data[start:start+length])
+        return value
+
+    def resolve(self, value):
+        """Return the object if value is a reference, else the value itself."""
+        return self.get(value.num) if isinstance(value, Ref) else value
+
+    def get(self, num):
+        """Return the object with the number num."""
+        try:
+            return self._objects[num]
+        except KeyError:
+            pass
+        entry = self.xref.get(num, (0,))
+        if entry[0] == 1:
+            obj = self._parse_indirect(entry[1])
+        elif entry[0] == 2:
+            obj = self._from_objstm(entry[1], entry[2])
+        else:
+            obj = None
+        self._objects[num] = obj
+        return obj
+
+    def _from_objstm(self, num, index):
+        """Return the object at index from the object stream num."""
+        try:
+            data, offsets = self._objstms[num]
+        except KeyError:
+            stream = self.get(num)
+            data = self.decode(stream)
+            first = stream.dict['First']
+            header = data[:first].split()
+            offsets = [first + int(o) for o in header[1::2]]
+            self._objstms[num] = data, offsets
+        return parse(data, offsets[index])[0]
+
+    def decode(self, stream):
+        """Return the decoded data of the stream, only FlateDecode is supported."""
+        filters = self.resolve(stream.dict.get('Filter', []))
+        params = self.resolve(stream.dict.get('DecodeParms'))
+        if not isinstance(filters, list):
+            filters, params = [filters], [params]
+        elif not isinstance(params, list):
+            params = [params] * len(filters)
+        data = stream.data
+        for f, p in zip(filters, params):
+            if f != 'FlateDecode':
+                raise ValueError("unsupported filter: {0}".format(f))
+            data = zlib.decompress(data)
+            p = self.resolve(p) or {}
+            if p.get('Predictor', 1) >= 10:
+                colors = p.get('Colors', 1) * p.get('BitsPerComponent', 8)
+                columns = p.get('Columns', 1) * colors // 8
+                data = png_unpredict(data, columns, max(1, colors // 8))
+            elif p.get('Predictor', 1) != 1:
+                raise ValueError("unsupported predictor")
+        return data
+
+    def serialize(self, value):
+        """Return bytes representing value, with all references resolved.
+
+        The serialized form of referenced objects is kept as an MD5 digest,
+        so objects shared by many pages (e.g. fonts) are read only once.
+        Parent entries are skipped, they point back up the page tree, and so
+        are the P entries of annotations, which point to their page.
+
+        """
+        if isinstance(value, Ref):
+            try:
+                return self._serialized[value.num]
+            except KeyError:
+                # guard against reference cycles
+                self._serialized[value.num] = b'@%d' % value.num
+            result = self._serialized[value.num] = hashlib.md5(
+                self.serialize(self.get(value.num)), usedforsecurity=False).digest()
+            return result
+        elif isinstance(value, Stream):
+            return b'S' + self.serialize(value.dict) + hashlib.md5(
+                value.data, usedforsecurity=False).digest()
+        elif isinstance(value, dict):
+            return b'<<' + b''.join(repr(key).encode('utf-8') + self.serialize(value[key])
+                for key in sorted(value) if key not in ('Parent', 'P')) + b'>>'
+        elif isinstance(value, list):
+            return b'[' + b' '.join(map(self.serialize, value)) + b']'
+        return repr(value).encode('utf-8')
+
+    def pages(self):
+        """Yield the page dictionaries in document order.
+
+        Every page dictionary is yielded together with a dictionary with
+        the inheritable attributes (Resources, MediaBox, CropBox and Rotate)
+        that apply to the page, which may be set higher up in the page tree.
+
+        """
+        root = self.resolve(self.trailer['Root'])
+        stack = [(self.resolve(root['Pages']), {})]
+        seen = set()
+        while stack:
+            node, inherited = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            inherited = dict(inherited)
+            inherited.update((key, node[key]) for key in _inheritable if key in node)
+            if 'Kids' in node:
+                stack.extend((self.resolve(kid), inherited)
+                    for kid in reversed(self.resolve(node['Kids'])))
+            else:
+                yield node, inherited
+
+    def page_contents(self, page):
+        """Return the raw content streams of the page dictionary as a list."""
+        contents = self.resolve(page.get('Contents', []))
+        if not isinstance(contents, list):
+            contents = [contents]
+        return [self.resolve(c).data for c in contents]
@@ -25,7 +25,7 @@ Generic Point and Click handling.
 import os
 import collections
 
-from PyQt6.QtCore import QUrl
+from PyQt6.QtCore import QPointF, QUrl
 from PyQt6.QtGui import QTextCursor
 
 import app
@@ -240,6 +240,117 @@ class BoundLinks:
         return slice(index, index+1)
 
 
+class PageLinks(Links):
+    """Stores links whose destinations are (pageNum, area) tuples.
+
+    Besides the links grouped by filename, a spatial index is kept for every
+    page, so that the links at a point or inside a rectangle of a page can
+    be found without looking at all the links of that page.
+
+    """
+    def __init__(self):
+        super().__init__()
+        self._pages = collections.defaultdict(PageIndex)
+
+    def add_link(self, filename, line, column, destination):
+        """Add a link, destination must be a (pageNum, QRectF) tuple."""
+        super().add_link(filename, line, column, destination)
+        num, area = destination
+        self._pages[num].add(area, (filename, line, column))
+
+    def linksAt(self, num, x, y):
+        """Return a list of (area, (filename, line, column)) tuples for the links at x, y.
+
+        num is the page number, x and y are in the range 0.0 - 1.0.
+        The list is sorted with the smallest area first.
+
+        """
+        index = self._pages.get(num)
+        return index.at(x, y) if index else []
+
+    def linksIn(self, num, rect):
+        """Return a list of (filename, line, column) tuples for the links in rect.
+
+        num is the page number, rect a QRectF in the range 0.0 - 1.0.
+        Links that intersect the rectangle are also returned.
+
+        """
+        index = self._pages.get(num)
+        return index.intersecting(rect) if index else []
+
+    def boundCursors(self, doc, num, rect):
+        """Return the QTextCursors of doc for the links in rect on page num."""
+        for filename, b in self._docs.items():
+            if b.document == doc:
+                break
+        else:
+            return []
+        cursors = []
+        for f, line, column in self.linksIn(num, rect):
+            if f == filename:
+                c = b.cursor(line, column)
+                if c:
+                    cursors.append(c)
+        return cursors
+
+
+class PageIndex:
+    """A uniform grid over a page to find link areas by position.
+
+    The areas are QRectF instances in the range 0.0 - 1.0. Each area is
+    stored in every cell it overlaps, so a lookup only needs to look at the
+    areas in one cell (for a point) or in the cells a rectangle covers.
+
+    """
+    size = 32   # number of cells horizontally and vertically
+
+    def __init__(self):
+        self._cells = collections.defaultdict(list)
+
+    def _cell(self, value):
+        """Return the cell number for a coordinate."""
+        return max(0, min(self.size - 1, int(value * self.size)))
+
+    def _cells_in(self, rect):
+        """Yield the (x, y) cell keys that rect overlaps."""
+        for x in range(self._cell(rect.left()), self._cell(rect.right()) + 1):
+            for y in range(self._cell(rect.top()), self._cell(rect.bottom()) + 1):
+                yield x, y
+
+    def add(self, area, item):
+        """Add an item with the specified area."""
+        entry = (area, item)
+        for key in self._cells_in(area):
+            self._cells[key].append(entry)
+
+    def at(self, x, y):
+        """Return a list of (area, item) tuples for the areas containing x, y.
+
+        The list is sorted with the smallest area first.
+
+        """
+        cell = self._cells.get((self._cell(x), self._cell(y)))
+        if not cell:
+            return []
+        pos = QPointF(x, y)
+        entries = [entry for entry in cell if entry[0].contains(pos)]
+        entries.sort(key=lambda entry: entry[0].width() * entry[0].height())
+        return entries
+
+    def intersecting(self, rect):
+        """Return the list of items whose area intersects with rect."""
+        seen = set()
+        result = []
+        for key in self._cells_in(rect):
+            for entry in self._cells.get(key, ()):
+                if id(entry) not in seen:
+                    seen.add(id(entry))
+                    area, item = entry
+                    if area.intersects(rect) or rect.contains(area):
+                        result.append(item)
+        return result
+
+
 def positions(cursor):
     """Return a list of QTextCursors describing the grob the cursor points at.
 
@@ -306,3 +417,47 @@ def positions(cursor):
     cur.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
     return cursors
 
+
+def benchmark(count=50000, selections=100):
+    """Prints the time needed to find the links at a point and in a selection.
+
+    The PageIndex is compared with testing all the link areas of a page.
+
+    """
+    import random
+    import time
+    from PyQt6.QtCore import QRectF
+    areas = [QRectF(random.random() * 0.98, random.random() * 0.98, 0.01, 0.02)
+             for i in range(count)]
+    index = PageIndex()
+    for i, area in enumerate(areas):
+        index.add(area, i)
+    points = [QPointF(random.random(), random.random()) for i in range(selections)]
+    start = time.perf_counter()
+    for point in points:
+        index.at(point.x(), point.y())
+    t1 = time.perf_counter() - start
+    start = time.perf_counter()
+    for point in points:
+        [i for i, area in enumerate(areas) if area.contains(point)]
+    t2 = time.perf_counter() - start
+    print("{0} links, {1} points: index: {2:.3f}s, all areas: {3:.3f}s".format(
+        count, selections, t1, t2))
+    rects = [QRectF(random.random() * 0.8, random.random() * 0.8,
+                    random.random() * 0.2, random.random() * 0.2)
+             for i in range(selections)]
+    start = time.perf_counter()
+    for rect in rects:
+        index.intersecting(rect)
+    t1 = time.perf_counter() - start
+    start = time.perf_counter()
+    for rect in rects:
+        [i for i, area in enumerate(areas) if area.intersects(rect) or rect.contains(area)]
+    t2 = time.perf_counter() - start
+    print("{0} links, {1} selections: index: {2:.3f}s, all areas: {3:.3f}s".format(
+        count, selections, t1, t2))
+
+
+if __name__ == "__main__":
+    benchmark()
+
@@ -313,6 +313,20 @@ class ViewerOptions(preferences.Group):
         self.showShadow = QCheckBox(toggled=self.changed)
         layout.addWidget(self.showShadow)
 
+        hbox = QHBoxLayout()
+        self.cacheSizeLabel = QLabel()
+        self.cacheSize = QSpinBox(valueChanged=self.changed)
+        self.cacheSize.setRange(20, 4000)
+        self.cacheSize.setSingleStep(20)
+        self.cacheSizeLabel.setBuddy(self.cacheSize)
+        hbox.addWidget(self.cacheSizeLabel)
+        hbox.addWidget(self.cacheSize)
+        hbox.addStretch(1)
+        layout.addLayout(hbox)
+
+        self.cacheStats = QLabel()
+        layout.addWidget(self.cacheStats)
+
         app.translateUI(self)
 
     def translateUI(self):
@@ -321,6 +335,25 @@ class ViewerOptions(preferences.Group):
         self.showShadow.setText(_("Show shadow under pages"))
         self.showShadow.setToolTip(_(
             "If checked, Frescobaldi draws a shadow around the pages."))
+        self.cacheSizeLabel.setText(_("Image cache size:"))
+        self.cacheSizeLabel.setToolTip(_(
+            "The maximum amount of memory used by all viewers together\n"
+            "to keep rendered pages."))
+        # L10N: as in "200 MB", appended after number in spinbox, note the leading space
+        self.cacheSize.setSuffix(_(" MB"))
+        self.updateCacheStats()
+
+    def showEvent(self, ev):
+        """Reimplemented to show the current image cache statistics."""
+        super().showEvent(ev)
+        self.updateCacheStats()
+
+    def updateCacheStats(self):
+        """Show the memory used by the image cache and its hits and misses."""
+        stats = pagedview.imageCache().stats()
+        self.cacheStats.setText(_(
+            "Currently used: {size} MB ({hits} hits, {misses} misses)").format(
+            size=stats['bytes'] // 1048576, hits=stats['hits'], misses=stats['misses']))
 
     def loadSettings(self):
         s = QSettings()
@@ -329,12 +362,14 @@ class ViewerOptions(preferences.Group):
         self.showScrollbars.setChecked(showScrollbars)
         shadow = s.value("shadow", True, bool)
         self.showShadow.setChecked(shadow)
+        self.cacheSize.setValue(s.value("image_cache_size", 200, int))
 
     def saveSettings(self):
         s = QSettings()
         s.beginGroup("musicview")
         s.setValue("show_scrollbars", self.showScrollbars.isChecked())
         s.setValue("shadow", self.showShadow.isChecked())
+        s.setValue("image_cache_size", self.cacheSize.value())
 
 
 class Magnifier(preferences.Group):
@@ -0,0 +1,406 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+The Find in Project widget.
+
+The open documents are searched directly, the other files of the project
+(the files the open documents include, or all LilyPond files in a chosen
+directory) are searched in a pool of worker processes. The results are
+added to the list as they arrive.
+
+"""
+
+
+import concurrent.futures
+import os
+import re
+
+from PyQt6.QtCore import Qt, QTimer, QUrl
+from PyQt6.QtGui import QTextCursor
+from PyQt6.QtWidgets import (
+    QCheckBox, QComboBox, QGridLayout, QLabel, QLineEdit, QMessageBox,
+    QPushButton, QTreeWidget, QTreeWidgetItem, QWidget)
+
+import app
+import cursortools
+import documentinfo
+import filesearch
+import widgets.urlrequester
+
+
+# below this number of files, search in the main process
+LOCAL_SEARCH_LIMIT = 16
+
+# the extensions of the files searched in a directory
+EXTENSIONS = ('.ly', '.ily', '.lyi')
+
+
+app.aboutToQuit.connect(filesearch.shutdown)
+
+
+class Widget(QWidget):
+    def __init__(self, panel):
+        super().__init__(panel)
+        self._futures = []      # list of (Future, callback) tuples
+        self._finished = None   # called when all futures are done
+        self._pattern = None
+        self._documents = {}    # name -> open Document
+        self._results = {}      # name -> list of Matches
+        self._searched = 0
+        self._total = 0
+        self._replaced = 0
+        self._replacedFiles = 0
+        self._errors = []
+        self._timer = QTimer(interval=50, timeout=self.checkFutures)
+
+        layout = QGridLayout(spacing=2)
+        layout.setContentsMargins(4, 4, 4, 4)
+        self.setLayout(layout)
+
+        self.searchLabel = QLabel()
+        self.searchEntry = QLineEdit(returnPressed=self.startSearch)
+        self.caseCheck = QCheckBox(checked=True)
+        self.regexCheck = QCheckBox()
+        self.findButton = QPushButton(clicked=self.startSearch)
+        self.replaceLabel = QLabel()
+        self.replaceEntry = QLineEdit()
+        self.replaceAllButton = QPushButton(clicked=self.replaceAll)
+        self.scopeCombo = QComboBox()
+        self.scopeCombo.addItems([''] * 2)
+        self.scopeCombo.currentIndexChanged.connect(self.slotScopeChanged)
+        self.directory = widgets.urlrequester.UrlRequester()
+        self.stopButton = QPushButton(clicked=self.stop)
+        self.tree = QTreeWidget(headerHidden=True)
+        self.tree.itemExpanded.connect(self.slotItemExpanded)
+        self.tree.itemActivated.connect(self.slotItemActivated)
+        self.status = QLabel()
+
+        layout.addWidget(self.searchLabel, 0, 0)
+        layout.addWidget(self.searchEntry, 0, 1)
+        layout.addWidget(self.caseCheck, 0, 2)
+        layout.addWidget(self.regexCheck, 0, 3)
+        layout.addWidget(self.findButton, 0, 4)
+        layout.addWidget(self.replaceLabel, 1, 0)
+        layout.addWidget(self.replaceEntry, 1, 1)
+        layout.addWidget(self.replaceAllButton, 1, 4)
+        layout.addWidget(self.scopeCombo, 2, 0)
+        layout.addWidget(self.directory, 2, 1, 1, 3)
+        layout.addWidget(self.stopButton, 2, 4)
+        layout.addWidget(self.tree, 3, 0, 1, 5)
+        layout.addWidget(self.status, 4, 0, 1, 5)
+
+        self.slotScopeChanged()
+        self.updateButtons()
+        app.translateUI(self)
+
+    def translateUI(self):
+        self.searchLabel.setText(_("Search:"))
+        self.caseCheck.setText(_("&Case"))
+        self.caseCheck.setToolTip(_("Case Sensitive"))
+        self.regexCheck.setText(_("&Regex"))
+        self.regexCheck.setToolTip(_("Regular Expression"))
+        self.findButton.setText(_("&Find"))
+        self.replaceLabel.setText(_("Replace:"))
+        self.replaceAllButton.setText(_("Replace &All"))
+        self.replaceAllButton.setToolTip(_(
+            "Replaces all occurrences of the search term in the found files."))
+        self.scopeCombo.setItemText(0, _("Open and Included Files"))
+        self.scopeCombo.setItemText(1, _("Directory:"))
+        self.scopeCombo.setToolTip(_(
+            "Search the open documents and the files they include, "
+            "or the open documents and all LilyPond files in a directory."))
+        self.stopButton.setText(_("&Stop"))
+
+    def showEvent(self, ev):
+        """Reimplemented to put the selected text in the search entry."""
+        super().showEvent(ev)
+        view = self.parent().mainwindow().currentView()
+        if view:
+            text = view.textCursor().selection().toPlainText()
+            if text and '\n' not in text:
+                self.searchEntry.setText(text)
+            if not self.directory.path():
+                filename = view.document().url().toLocalFile()
+                if filename:
+                    self.directory.setPath(os.path.dirname(filename))
+        self.searchEntry.setFocus()
+        self.searchEntry.selectAll()
+
+    def slotScopeChanged(self):
+        """Called when the user selects another scope."""
+        self.directory.setEnabled(self.scopeCombo.currentIndex() == 1)
+
+    def updateButtons(self):
+        """Enable or disable the buttons, depending on whether a job runs."""
+        running = bool(self._futures)
+        self.findButton.setEnabled(not running)
+        self.replaceAllButton.setEnabled(not running and bool(self._results))
+        self.stopButton.setEnabled(running)
+
+    def openDocuments(self):
+        """Return a dict mapping a name to every open Document.
+
+        The name is the real path for a local document, otherwise the
+        document's name.
+
+        """
+        documents = {}
+        for doc in app.documents:
+            filename = doc.url().toLocalFile()
+            name = os.path.realpath(filename) if filename else doc.documentName()
+            documents[name] = doc
+        return documents
+
+    def projectFiles(self):
+        """Return the set of files to search, besides the open documents."""
+        files = set()
+        if self.scopeCombo.currentIndex() == 1:
+            for root, dirs, names in os.walk(self.directory.path()):
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+                files.update(os.path.realpath(os.path.join(root, name))
+                    for name in names
+                    if os.path.splitext(name)[1].lower() in EXTENSIONS)
+        else:
+            for doc in app.documents:
+                if doc.url().toLocalFile():
+                    files.update(documentinfo.info(doc).includefiles())
+        return files
+
+    def startSearch(self):
+        """Start searching the project."""
+        self.stop()
+        self.tree.clear()
+        self._results = {}
+        search = self.searchEntry.text()
+        if not search:
+            return self.updateButtons()
+        try:
+            self._pattern = filesearch.compile_search(search,
+                self.regexCheck.isChecked(), self.caseCheck.isChecked())
+        except re.error as e:
+            self.status.setText(_("Invalid regular expression: {message}").format(message=e))
+            return self.updateButtons()
+        self._documents = self.openDocuments()
+        files = sorted(self.projectFiles() - set(self._documents))
+        self._searched = 0
+        self._total = len(self._documents) + len(files)
+
+        # open documents are searched in their current state
+        self.addResults(filesearch.search_files(self._pattern,
+            [(name, doc.toPlainText()) for name, doc in self._documents.items()]))
+        if len(files) < LOCAL_SEARCH_LIMIT:
+            self.addResults(filesearch.search_files(self._pattern, [(f, None) for f in files]))
+            self.searchFinished()
+        else:
+            executor = filesearch.executor()
+            for chunk in filesearch.chunks([(f, None) for f in files]):
+                future = executor.submit(filesearch.search_files, self._pattern, chunk)
+                self._futures.append((future, self.addResults))
+            self._finished = self.searchFinished
+            self._timer.start()
+            self.updateStatus()
+        self.updateButtons()
+
+    def checkFutures(self):
+        """Called by the timer, handles the results that have arrived."""
+        pending = []
+        for future, callback in self._futures:
+            if future.done():
+                try:
+                    callback(future.result())
+                except (concurrent.futures.CancelledError, concurrent.futures.BrokenExecutor):
+                    pass
+            else:
+                pending.append((future, callback))
+        self._futures = pending
+        if not pending:
+            self._timer.stop()
+            finished, self._finished = self._finished, None
+            if finished:
+                finished()
+            self.updateButtons()
+        else:
+            self.updateStatus()
+
+    def stop(self):
+        """Cancel the running search or replace."""
+        for future, callback in self._futures:
+            future.cancel()
+        self._futures = []
+        self._finished = None
+        self._timer.stop()
+        self.updateButtons()
+
+    def addResults(self, results):
+        """Add the results of search_files() to the list."""
+        for name, matches, error in results:
+            self._searched += 1
+            if matches:
+                self._results[name] = matches
+                item = QTreeWidgetItem(self.tree)
+                doc = self._documents.get(name)
+                title = doc.documentName() if doc else os.path.basename(name)
+                item.setText(0, f"{title} ({len(matches)})")
+                item.setToolTip(0, name)
+                item.setData(0, Qt.ItemDataRole.UserRole, name)
+                item.setChildIndicatorPolicy(QTreeWidgetItem.ChildIndicatorPolicy.ShowIndicator)
+            elif error:
+                item = QTreeWidgetItem(self.tree)
+                item.setText(0, f"{os.path.basename(name)}: {error}")
+                item.setToolTip(0, name)
+
+    def slotItemExpanded(self, item):
+        """Create the child items for the matches in a file when expanded."""
+        name = item.data(0, Qt.ItemDataRole.UserRole)
+        if name and not item.childCount():
+            for index, m in enumerate(self._results.get(name, ())):
+                child = QTreeWidgetItem(item)
+                child.setText(0, f"{m.line + 1}:{m.column + 1}: {m.text.strip()}")
+                child.setData(0, Qt.ItemDataRole.UserRole, index)
+
+    def slotItemActivated(self, item):
+        """Show the match (or the first match of a file) in the editor."""
+        parent = item.parent()
+        if parent:
+            name = parent.data(0, Qt.ItemDataRole.UserRole)
+            index = item.data(0, Qt.ItemDataRole.UserRole)
+        else:
+            name = item.data(0, Qt.ItemDataRole.UserRole)
+            index = 0
+        if name not in self._results:
+            return
+        doc = self._documents.get(name)
+        if doc is None:
+            try:
+                doc = self._documents[name] = app.openUrl(QUrl.fromLocalFile(name))
+            except OSError:
+                return
+        m = self._results[name][index]
+        block = doc.findBlockByNumber(m.line)
+        if not block.isValid():
+            return
+        cursor = QTextCursor(block)
+        cursor.setPosition(min(block.position() + m.column, block.position() + block.length() - 1))
+        cursor.setPosition(min(cursor.position() + m.end - m.start, doc.characterCount() - 1),
+                           QTextCursor.MoveMode.KeepAnchor)
+        self.parent().mainwindow().setTextCursor(cursor)
+
+    def updateStatus(self):
+        """Show the progress of the search."""
+        count = sum(map(len, self._results.values()))
+        self.status.setText(_("Searched {num} of {total} files, {count} matches.").format(
+            num=self._searched, total=self._total, count=count))
+
+    def searchFinished(self):
+        """Called when all files have been searched."""
+        self.updateStatus()
+
+    def replaceAll(self):
+        """Replace all occurrences in the found files.
+
+        Open documents are changed as one undoable edit each, the other
+        files are rewritten on disk in the worker processes.
+
+        """
+        if not self._results or not self._pattern:
+            return
+        replacement = self.replaceEntry.text()
+        regex = self.regexCheck.isChecked()
+        if regex:
+            try:
+                self.checkReplacement(replacement)
+            except re.error as e:
+                self.status.setText(_("Invalid replacement: {message}").format(message=e))
+                return
+        documents = [self._documents[name] for name in self._results if name in self._documents]
+        files = [name for name in self._results if name not in self._documents]
+        if files:
+            count = sum(len(self._results[name]) for name in files)
+            answer = QMessageBox.question(self, app.caption(_("Replace All")),
+                _("Replace {count} occurrences in {num} files that are not open?\n\n"
+                  "This can't be undone.").format(count=count, num=len(files)))
+            if answer != QMessageBox.StandardButton.Yes:
+                return
+        self._replaced = 0
+        self._replacedFiles = 0
+        self._errors = []
+        for doc in documents:
+            self.replaceInDocument(doc, replacement, regex)
+        executor = filesearch.executor()
+        for chunk in filesearch.chunks(files):
+            future = executor.submit(filesearch.replace_files, self._pattern, replacement, chunk, regex)
+            self._futures.append((future, self.addReplaced))
+        self._results = {}
+        self.tree.clear()
+        self._finished = self.replaceFinished
+        if self._futures:
+            self._timer.start()
+            self.updateButtons()
+        else:
+            self.checkFutures()
+
+    def checkReplacement(self, replacement):
+        """Raise re.error if the replacement template can't be expanded.
+
+        The template is expanded against the first match that can be found,
+        so nothing is changed when it is invalid.
+
+        """
+        for name in self._results:
+            document = self._documents.get(name)
+            try:
+                text = document.toPlainText() if document else filesearch.read(name)
+            except OSError:
+                continue
+            m = self._pattern.search(text)
+            if m:
+                m.expand(replacement)
+                return
+
+    def replaceInDocument(self, document, replacement, regex):
+        """Replace all occurrences in the open Document as one undoable edit."""
+        matches = list(self._pattern.finditer(document.toPlainText()))
+        if not matches:
+            return
+        texts = [m.expand(replacement) for m in matches] if regex else None
+        cursor = QTextCursor(document)
+        with cursortools.compress_undo(cursor):
+            for i in range(len(matches) - 1, -1, -1):
+                cursor.setPosition(matches[i].start())
+                cursor.setPosition(matches[i].end(), QTextCursor.MoveMode.KeepAnchor)
+                cursor.insertText(texts[i] if regex else replacement)
+        self._replaced += len(matches)
+        self._replacedFiles += 1
+
+    def addReplaced(self, results):
+        """Add the results of replace_files()."""
+        for filename, count, error in results:
+            if error:
+                self._errors.append(f"{filename}: {error}")
+            elif count:
+                self._replaced += count
+                self._replacedFiles += 1
+
+    def replaceFinished(self):
+        """Called when all replacements have been done."""
+        self.status.setText(_("Replaced {count} occurrences in {num} files.").format(
+            count=self._replaced, num=self._replacedFiles))
+        for error in self._errors:
+            QTreeWidgetItem(self.tree).setText(0, error)
@@ -89,12 +89,12 @@ class Player(QThread, midifile.player.Player):
             self.exit(1)
             self.wait()
 
-    def set_position(self, position, offset=0):
+    def set_position(self, time):
         """Overridden because we can't start/stop the timer from the gui thread."""
         playing = self.isRunning()
         if playing:
             self.stop()
-        super().set_position(position, offset)
+        super().set_position(time)
         if playing:
             self.start()
 
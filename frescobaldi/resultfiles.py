@@ -30,7 +30,7 @@ import app
 import documentinfo
 import job.manager
 import plugin
-import util
+import resultindex
 
 
 def results(document):
@@ -51,6 +51,8 @@ class Results(plugin.DocumentPlugin):
         self._basenames = None
         self._start_time = 0.0
         document.saved.connect(self.forgetDocumentInfo)
+        # before all others look for the created files
+        job.manager.manager(document).finished.connect(self.invalidateIndex, -1000)
 
     def saveDocumentInfo(self, start_time):
         """Takes over some vital information from a DocumentInfo instance.
@@ -82,6 +84,15 @@ class Results(plugin.DocumentPlugin):
             self._jobfile = None
             self._basenames = None
 
+    def invalidateIndex(self):
+        """Makes the resultindex read the directories of the basenames again.
+
+        This is called when a job finishes.
+
+        """
+        for directory in {os.path.dirname(name) for name in self.basenames()}:
+            resultindex.invalidate(directory)
+
     def jobfile(self):
         """Returns the file that is currently being, or will be, engraved."""
         if self._jobfile is None:
@@ -106,10 +117,10 @@ class Results(plugin.DocumentPlugin):
         """
         jobfile = self.jobfile()
         if jobfile:
-            files = util.files(self.basenames(), extension)
+            files = resultindex.files(self.basenames(), extension)
             if newer:
                 try:
-                    return util.newer_files(files, os.path.getmtime(jobfile))
+                    return resultindex.newer_files(files, os.path.getmtime(jobfile))
                 except OSError:
                     pass
             return list(files)
@@ -123,9 +134,9 @@ class Results(plugin.DocumentPlugin):
 
         """
         if self._start_time:
-            files = util.files(self.basenames(), extension)
+            files = resultindex.files(self.basenames(), extension)
             try:
-                files = util.newer_files(files, self._start_time)
+                files = resultindex.newer_files(files, self._start_time)
             except OSError:
                 pass
             return files
@@ -141,7 +152,7 @@ class Results(plugin.DocumentPlugin):
         jobfile = self.jobfile()
         if jobfile:
             try:
-                return os.path.getmtime(filename) > os.path.getmtime(jobfile)
+                return resultindex.mtime(filename) > os.path.getmtime(jobfile)
             except OSError:
                 pass
         return True
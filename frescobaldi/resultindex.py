@@ -0,0 +1,196 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Keeps an index of the files in the directories LilyPond writes to.
+
+For every directory the names and modification times of the files are read
+once, so finding the files created for some basenames and checking whether
+they are newer than the source needs no globbing and stat-ing. An entry is
+read again after its directory changed (the directory is watched) or a job
+that wrote to it finished (see resultfiles). At most MAX_DIRECTORIES are
+kept, the least recently used ones are removed (and not watched anymore).
+
+"""
+
+
+import bisect
+import collections
+import fnmatch
+import itertools
+import os
+import re
+import unicodedata
+
+import background
+import util
+
+
+MAX_DIRECTORIES = 100
+
+_entries = collections.OrderedDict()    # directory -> Entry
+_wildcard_re = re.compile(r'[^*?[]*')   # the text before the first wildcard
+
+
+class Entry:
+    """The files in a directory.
+
+    mtimes maps every filename to its modification time, keys is a sorted
+    list of the (case-normalized) filenames, and names the filenames in the
+    same order, so the names starting with some text can be found by bisecting.
+
+    """
+    def __init__(self, mtimes):
+        self.mtimes = mtimes
+        pairs = sorted((os.path.normcase(name), name) for name in mtimes)
+        self.keys = [key for key, name in pairs]
+        self.names = [name for key, name in pairs]
+
+    def startingwith(self, prefix):
+        """Returns the list of filenames starting with prefix."""
+        prefix = os.path.normcase(prefix)
+        i = bisect.bisect_left(self.keys, prefix)
+        j = bisect.bisect_left(self.keys, prefix + '\U0010ffff', i)
+        return self.names[i:j]
+
+
+def scan(directory):
+    """Returns an Entry with the names and mtimes of the files in directory."""
+    mtimes = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_file():
+                        mtimes[entry.name] = entry.stat().st_mtime
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return Entry(mtimes)
+
+
+def entry(directory):
+    """Returns the (cached) Entry for the directory."""
+    try:
+        result = _entries[directory]
+    except KeyError:
+        pass
+    else:
+        _entries.move_to_end(directory)
+        return result
+    result = scan(directory)
+    # only remember existing directories, a missing one may be created later
+    if os.path.isdir(directory):
+        _entries[directory] = result
+        _watcher.addPath(directory)
+        while len(_entries) > MAX_DIRECTORIES:
+            old = next(iter(_entries))
+            del _entries[old]
+            _watcher.removePath(old)
+    return result
+
+
+def invalidate(directory=None):
+    """Removes the directory from the index, or all directories if None."""
+    if directory is None:
+        _entries.clear()
+        _watcher.removePaths(_watcher.paths())
+    else:
+        _entries.pop(directory, None)
+        _watcher.removePath(directory)
+
+
+def _matches(directory, name):
+    """Yields the filenames in the index matching the glob pattern name.
+
+    Wildcards in the directory are not expanded.
+
+    """
+    prefix = _wildcard_re.match(name).group()
+    names = entry(directory or os.curdir).startingwith(prefix)
+    if not name.startswith('.'):
+        # like glob, do not return hidden files for a pattern without a dot
+        names = (n for n in names if not n.startswith('.'))
+    for n in fnmatch.filter(names, name):
+        yield os.path.join(directory, n)
+
+
+def files(basenames, extension='.*'):
+    """Returns filenames with the given basenames matching the extension.
+
+    This is the same as util.files(), but uses the index instead of globbing.
+
+    """
+    def source():
+        for basename in basenames:
+            # macOS's HFS+ filesystem stores file names in NFD
+            # other file systems do not, so check both name and nfd_name
+            nfd_basename = unicodedata.normalize('NFD', basename)
+            for n in (basename,) if basename == nfd_basename else (basename, nfd_basename):
+                directory, name = os.path.split(n)
+                name = name.replace('[', '[[]').replace('?', '[?]').replace('*', '[*]')
+                if not name:
+                    yield _matches(directory, '*' + extension)
+                else:
+                    yield _matches(directory, name + extension)
+                    yield _matches(directory, name + '-*[0-9]' + extension)
+    return sorted(util.uniq(itertools.chain.from_iterable(source())), key=util.filenamesort)
+
+
+def mtime(filename):
+    """Returns the modification time of the file, from the index if possible.
+
+    Raises OSError if the file does not exist.
+
+    """
+    directory, name = os.path.split(filename)
+    try:
+        return entry(directory or os.curdir).mtimes[name]
+    except KeyError:
+        return os.path.getmtime(filename)
+
+
+def newer_files(files, time):
+    """Returns a list of the files that have their mtime >= time."""
+    return [f for f in files if mtime(f) >= time]
+
+
+_watcher = background.Watcher(invalidate)
+
+
+if __name__ == '__main__':
+    """Compare globbing a directory of 5,000 files with querying the index."""
+    import tempfile
+    import time
+    with tempfile.TemporaryDirectory() as root:
+        for i in range(1000):
+            for ext in ('.pdf', '.midi', '.svg', '.ly', '.log'):
+                open(os.path.join(root, f"part{i}{ext}"), 'w').close()
+        basenames = [os.path.join(root, f"part{i}") for i in range(0, 1000, 10)]
+        t0 = time.perf_counter()
+        a = util.newer_files(util.files(basenames, '.pdf'), 0)
+        t1 = time.perf_counter()
+        b = newer_files(files(basenames, '.pdf'), 0)
+        t2 = time.perf_counter()
+        c = newer_files(files(basenames, '.pdf'), 0)
+        t3 = time.perf_counter()
+        assert a == b == c
+        print('{0} files, glob: {1:.4f}s, first query: {2:.4f}s, cached query: {3:.4f}s'.format(
+            len(a), t1 - t0, t2 - t1, t3 - t2))
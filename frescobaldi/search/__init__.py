@@ -22,14 +22,13 @@ Widget for search and replace.
 """
 
 
-import bisect
 import re
 import weakref
 
-from PyQt6.QtCore import QEvent, Qt
+from PyQt6.QtCore import QEvent, Qt, QTimer
 from PyQt6.QtGui import QAction, QKeySequence, QPalette, QTextCursor
 from PyQt6.QtWidgets import (
-    QApplication, QCheckBox, QGridLayout, QLabel, QLineEdit,
+    QApplication, QCheckBox, QComboBox, QGridLayout, QLabel, QLineEdit,
     QPushButton, QStyle, QToolButton, QWidget)
 
 import app
@@ -43,15 +42,25 @@ import wordboundary
 import viewhighlighter
 import gadgets.borderlayout
 
+from . import matches
+from . import scopes
+
 
 class Search(plugin.MainWindowPlugin, QWidget):
     def __init__(self, mainwindow):
         QWidget.__init__(self, mainwindow)
         self._currentView = None
-        self._positions = []
+        self._matches = matches.Matches()
         self._positionsDirty = True
+        self._pattern = None        # the compiled search
+        self._scope = None          # the search scope, if any
+        self._incremental = False   # can matches be updated per changed block?
+        self._revision = None       # the document revision searched
+        self._scanner = None        # the running Scanner, if any
+        self._gotoNearest = False   # go to the nearest match when found?
         self._replace = False  # are we in replace mode?
         self._going = False    # are we moving the text cursor?
+        self._countTimer = QTimer(self, interval=100, timeout=self.updateCount)
 
         mainwindow.currentViewChanged.connect(self.viewChanged)
         mainwindow.actionCollection.edit_find_next.triggered.connect(self.findNext)
@@ -74,6 +83,8 @@ class Search(plugin.MainWindowPlugin, QWidget):
         self.nextButton.setIcon(icons.get('go-next'))
         self.caseCheck = QCheckBox(checked=True, focusPolicy=Qt.FocusPolicy.NoFocus)
         self.regexCheck = QCheckBox(focusPolicy=Qt.FocusPolicy.NoFocus)
+        self.scopeCombo = QComboBox(focusPolicy=Qt.FocusPolicy.NoFocus)
+        self.scopeCombo.addItems([''] * len(scopes.SCOPES))
         self.countLabel = QLabel(alignment=Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
         self.countLabel.setMinimumWidth(self.countLabel.fontMetrics().horizontalAdvance("9999"))
         self.closeButton = QToolButton(autoRaise=True, focusPolicy=Qt.FocusPolicy.NoFocus)
@@ -88,11 +99,13 @@ class Search(plugin.MainWindowPlugin, QWidget):
         grid.addWidget(self.nextButton, 0, 3)
         grid.addWidget(self.caseCheck, 0, 4)
         grid.addWidget(self.regexCheck, 0, 5)
-        grid.addWidget(self.countLabel, 0, 6)
-        grid.addWidget(self.closeButton, 0, 7)
+        grid.addWidget(self.scopeCombo, 0, 6)
+        grid.addWidget(self.countLabel, 0, 7)
+        grid.addWidget(self.closeButton, 0, 8)
 
         self.caseCheck.toggled.connect(self.slotSearchChanged)
         self.regexCheck.toggled.connect(self.slotSearchChanged)
+        self.scopeCombo.currentIndexChanged.connect(self.slotSearchChanged)
 
         self.replaceEntry = QLineEdit()
         self.replaceLabel = QLabel()
@@ -116,6 +129,9 @@ class Search(plugin.MainWindowPlugin, QWidget):
         self.caseCheck.setToolTip(_("Case Sensitive"))
         self.regexCheck.setText(_("&Regex"))
         self.regexCheck.setToolTip(_("Regular Expression"))
+        for i, title in enumerate(scopes.titles()):
+            self.scopeCombo.setItemText(i, title)
+        self.scopeCombo.setToolTip(_("Only find text in music, notes, lyrics, comments or strings"))
         self.countLabel.setToolTip(_("The total number of matches"))
         self.hideAction.setToolTip(_("Close"))
         self.replaceLabel.setText(_("Replace:"))
@@ -141,10 +157,14 @@ class Search(plugin.MainWindowPlugin, QWidget):
         cur = self.currentView()
         if cur:
             cur.selectionChanged.disconnect(self.slotSelectionChanged)
-            cur.document().contentsChanged.disconnect(self.slotDocumentContentsChanged)
+            cur.document().contentsChange.disconnect(self.slotDocumentContentsChange)
+            cur.verticalScrollBar().valueChanged.disconnect(self.slotViewScrolled)
+            cur.viewport().removeEventFilter(self)
         if view:
             view.selectionChanged.connect(self.slotSelectionChanged)
-            view.document().contentsChanged.connect(self.slotDocumentContentsChanged)
+            view.document().contentsChange.connect(self.slotDocumentContentsChange)
+            view.verticalScrollBar().valueChanged.connect(self.slotViewScrolled)
+            view.viewport().installEventFilter(self)
         self._currentView = weakref.ref(view) if view else None
 
     def showWidget(self):
@@ -178,16 +198,39 @@ class Search(plugin.MainWindowPlugin, QWidget):
         if not self._going:
             self.markPositionsDirty()
             if self.isVisible():
-                self.updatePositions()
-                self.highlightingOn()
+                self.updatePositions(False)
+
+    def slotDocumentContentsChange(self, position, removed, added):
+        """Called when the current document changes.
+
+        If possible, only the changed blocks are searched again.
+
+        """
+        document = self.currentView().document()
+        if document.revision() == self._revision:
+            return  # only the formatting changed
+        if (self.isVisible() and self._incremental
+                and not self._positionsDirty and not self._scanner):
+            self._matches.update(document, self._pattern, position, removed, added)
+            self._revision = document.revision()
+            self.updateCount()
+            self.highlightingOn()
+        else:
+            self.markPositionsDirty()
+            if self.isVisible():
+                self.updatePositions(False)
 
-    def slotDocumentContentsChanged(self):
-        """Called when the current document changes."""
-        self.markPositionsDirty()
+    def slotViewScrolled(self):
+        """Called when the View scrolls, highlights the visible matches."""
         if self.isVisible():
-            self.updatePositions()
             self.highlightingOn()
 
+    def eventFilter(self, obj, ev):
+        """Reimplemented to highlight the visible matches when the View is resized."""
+        if ev.type() == QEvent.Type.Resize and self.isVisible():
+            self.highlightingOn()
+        return False
+
     def slotHide(self):
         """Called when the close button is clicked."""
         view = self.currentView()
@@ -238,38 +281,52 @@ class Search(plugin.MainWindowPlugin, QWidget):
         else:
             self.showWidget()
             self.markPositionsDirty()
-            self.updatePositions()
-            self.highlightingOn()
+            self.updatePositions(False)
         focus.setFocus()
 
     def slotSearchChanged(self):
         """Called on every change in the search text entry."""
         self._going = True
         self.markPositionsDirty()
-        self.updatePositions()
-        self.highlightingOn()
-        if not self._replace and self._positions:
-            positions = [c.position() for c in self._positions]
-            cursor = self.currentView().textCursor()
-            index = bisect.bisect_left(positions, cursor.selectionStart())
-            if index == len(positions):
+        self._gotoNearest = not self._replace
+        self.updatePositions(False)
+        self._going = False
+
+    def gotoNearest(self):
+        """Go to the match at or after the text cursor."""
+        view = self.currentView()
+        if not view or not self._matches:
+            return
+        self._going = True
+        cursor = view.textCursor()
+        index = self._matches.index(cursor.selectionStart())
+        if index == len(self._matches):
+            index -= 1
+        elif index > 0:
+            # it might be possible that the text cursor currently already
+            # is in a search result. This happens when the search is pop up
+            # with an empty text and the current word is then set as search
+            # text.
+            if cursortools.contains(self._matches.cursor(view.document(), index-1), cursor):
                 index -= 1
-            elif index > 0:
-                # it might be possible that the text cursor currently already
-                # is in a search result. This happens when the search is pop up
-                # with an empty text and the current word is then set as search
-                # text.
-                if cursortools.contains(self._positions[index-1], cursor):
-                    index -= 1
-            self.gotoPosition(index)
+        self.gotoPosition(index)
         self._going = False
 
+    def visibleRange(self, view):
+        """Return the (start, end) positions of the text visible in the View."""
+        rect = view.viewport().rect()
+        start = view.cursorForPosition(rect.topLeft()).block().position()
+        block = view.cursorForPosition(rect.bottomRight()).block()
+        return start, block.position() + block.length()
+
     def highlightingOn(self, view=None):
-        """Show the current search result positions."""
+        """Show the current search result positions that are visible."""
         if view is None:
             view = self.currentView()
         if view:
-            viewhighlighter.highlighter(view).highlight("search", self._positions, 1)
+            indices = self._matches.overlapping(*self.visibleRange(view))
+            cursors = self._matches.cursors(view.document(), indices)
+            viewhighlighter.highlighter(view).highlight("search", cursors, 1)
 
     def highlightingOff(self, view=None):
         """Hide the current search result positions."""
@@ -280,57 +337,110 @@ class Search(plugin.MainWindowPlugin, QWidget):
 
     def markPositionsDirty(self):
         """Delete positions and mark them dirty, i.e. they need updating."""
-        self._positions = []
+        if self._scanner:
+            self._scanner.cancel()
+            self._scanner = None
+            self._countTimer.stop()
+        self._matches = matches.Matches()
         self._positionsDirty = True
 
-    def updatePositions(self):
-        """Update the search result positions if necessary."""
+    def updatePositions(self, wait=True):
+        """Update the search result positions if necessary.
+
+        The search runs in a background thread. If wait is True (the
+        default), waits for it to finish; otherwise the results are shown
+        when the search has finished.
+
+        """
         view = self.currentView()
-        if not view or not self._positionsDirty:
+        if not view:
             return
+        if self._positionsDirty:
+            self.startSearch(view)
+        scanner = self._scanner
+        if wait and scanner:
+            scanner.wait()
+            self.slotSearchFinished(scanner)
+
+    def startSearch(self, view):
+        """Start searching the document of the View."""
         search = self.searchEntry.text()
         cursor = view.textCursor()
         document = view.document()
-        self._positions = []
+        self._positionsDirty = False
+        self._revision = document.revision()
+        self._pattern = None
+        self._scope = scopes.SCOPES[self.scopeCombo.currentIndex()]
+        self._incremental = False
         if search:
-            text = document.toPlainText()
-            start = 0
-            if (self._replace or not self._going) and cursor.hasSelection():
-                # don't search outside the selection
-                start = cursor.selectionStart()
-                text = text[start:cursor.selectionEnd()]
             flags = re.MULTILINE | re.DOTALL
             if not self.caseCheck.isChecked():
                 flags |= re.IGNORECASE
             if not self.regexCheck.isChecked():
                 search = re.escape(search)
             try:
-                matches = re.finditer(search, text, flags)
+                self._pattern = re.compile(search, flags)
             except re.error:
                 pass
-            else:
-                for m in matches:
-                    c = QTextCursor(document)
-                    c.setPosition(start + m.end())
-                    c.setPosition(start + m.start(), QTextCursor.MoveMode.KeepAnchor)
-                    self._positions.append(c)
-        self.countLabel.setText(format(len(self._positions)))
-        enabled = len(self._positions) > 0
+        if self._pattern:
+            text = document.toPlainText()
+            start = 0
+            # a plain search can't find a newline, so matches can be updated
+            # per block, but not when searching inside the selection, or in a
+            # scope, because a change can alter the tokens of following blocks
+            self._incremental = not self.regexCheck.isChecked() and not self._scope
+            if (self._replace or not self._going) and cursor.hasSelection():
+                # don't search outside the selection
+                start = cursor.selectionStart()
+                text = text[start:cursor.selectionEnd()]
+                self._incremental = False
+            scanner = self._scanner = matches.Scanner(self._pattern, text, start)
+            scanner.finished.connect(lambda: self.slotSearchFinished(scanner))
+            scanner.start()
+            self._countTimer.start()
+        elif self.isVisible():
+            self.highlightingOn()
+        self.updateCount()
+
+    def slotSearchFinished(self, scanner):
+        """Called when the Scanner has finished, shows the results."""
+        if scanner is not self._scanner:
+            return  # cancelled or already handled
+        self._scanner = None
+        self._countTimer.stop()
+        self._matches = scanner.matches
+        view = self.currentView()
+        if self._scope and view:
+            self._matches = scopes.select(self._scope, view.document(), self._matches)
+        self.updateCount()
+        if self.isVisible():
+            self.highlightingOn()
+        if self._gotoNearest:
+            self._gotoNearest = False
+            self.gotoNearest()
+
+    def updateCount(self):
+        """Show the number of matches, while searching the number found so far."""
+        if self._scanner:
+            self.countLabel.setText(format(self._scanner.count) + "\u2026")
+            count = 0
+        else:
+            count = len(self._matches)
+            self.countLabel.setText(format(count))
+        enabled = count > 0
         self.replaceButton.setEnabled(enabled)
         self.replaceAllButton.setEnabled(enabled)
         self.prevButton.setEnabled(enabled)
         self.nextButton.setEnabled(enabled)
-        self._positionsDirty = False
 
     def findNext(self):
         """Called on menu Find Next."""
         self._going = True
         self.updatePositions()
         view = self.currentView()
-        if view and self._positions:
-            positions = [c.position() for c in self._positions]
-            index = bisect.bisect_right(positions, view.textCursor().position())
-            if index < len(positions):
+        if view and self._matches:
+            index = self._matches.index_after(view.textCursor().position())
+            if index < len(self._matches):
                 self.gotoPosition(index)
             else:
                 self.gotoPosition(0)
@@ -342,15 +452,14 @@ class Search(plugin.MainWindowPlugin, QWidget):
         self._going = True
         self.updatePositions()
         view = self.currentView()
-        positions = [c.position() for c in self._positions]
-        if view and positions:
-            index = bisect.bisect_left(positions, view.textCursor().position()) - 1
+        if view and self._matches:
+            index = self._matches.index(view.textCursor().position()) - 1
             self.gotoPosition(index)
         self._going = False
 
     def gotoPosition(self, index):
-        """Scrolls the current View to the position in the _positions list at index."""
-        c = QTextCursor(self._positions[index])
+        """Scrolls the current View to the match at index."""
+        c = self._matches.cursor(self.currentView().document(), index)
         #c.clearSelection()
         self.currentView().gotoTextCursor(c)
         self.currentView().ensureCursorVisible()
@@ -381,7 +490,7 @@ class Search(plugin.MainWindowPlugin, QWidget):
     def keyPressEvent(self, ev):
         """Catches Up and Down to jump between search results."""
         # if in search mode, Up and Down jump between search results
-        if not self._replace and self._positions and self.searchEntry.text() and not ev.modifiers():
+        if not self._replace and self._matches and self.searchEntry.text() and not ev.modifiers():
             if ev.key() == Qt.Key.Key_Up:
                 self.findPrevious()
                 return
@@ -418,22 +527,29 @@ class Search(plugin.MainWindowPlugin, QWidget):
     def slotReplace(self):
         """Called when the user clicks Replace."""
         view = self.currentView()
-        if view and self._positions:
-            positions = [c.position() for c in self._positions]
-            index = bisect.bisect_left(positions, view.textCursor().position())
-            if index >= len(positions):
+        self.updatePositions()
+        if view and self._matches:
+            index = self._matches.index(view.textCursor().position())
+            if index >= len(self._matches):
                 index = 0
-            if self.doReplace(self._positions[index]):
+            if self.doReplace(self._matches.cursor(view.document(), index)):
                 self.findNext()
 
     def slotReplaceAll(self):
         """Called when the user clicks Replace All."""
         view = self.currentView()
         if view:
+            self.updatePositions()
             replaced = False
-            cursors = self._positions
-            if view.textCursor().hasSelection():
-                cursors = [cursor for cursor in cursors if cursortools.contains(view.textCursor(), cursor)]
+            document = view.document()
+            selection = view.textCursor()
+            if selection.hasSelection():
+                indices = self._matches.overlapping(
+                    selection.selectionStart(), selection.selectionEnd())
+                cursors = [cursor for cursor in self._matches.cursors(document, indices)
+                           if cursortools.contains(selection, cursor)]
+            else:
+                cursors = self._matches.cursors(document)
             with cursortools.compress_undo(view.textCursor()):
                 for cursor in cursors:
                     if self.doReplace(cursor):
@@ -0,0 +1,163 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Stores search results as offsets in the text.
+
+A Matches instance keeps the start and end position of every match in two
+arrays. QTextCursors are only created for the matches that are needed, e.g.
+the current one and the ones that are visible in the View.
+
+The Scanner runs the regular expression over a snapshot of the text in a
+background thread. When the document changes, update() searches the changed
+blocks again, as long as the search can not find a match that spans more
+than one line.
+
+"""
+
+
+import array
+import bisect
+
+from PyQt6.QtGui import QTextCursor
+
+import background
+
+
+class Matches:
+    """The start and end positions of the matches of a search, in order."""
+    def __init__(self):
+        self.starts = array.array('q')
+        self.ends = array.array('q')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, end):
+        """Appends a match, which must come after the previous ones."""
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def index(self, position):
+        """Returns the index of the first match starting at or after position."""
+        return bisect.bisect_left(self.starts, position)
+
+    def index_after(self, position):
+        """Returns the index of the first match starting after position."""
+        return bisect.bisect_right(self.starts, position)
+
+    def overlapping(self, start, end):
+        """Returns the range of indices of the matches touching start - end."""
+        return range(bisect.bisect_left(self.ends, start),
+                     bisect.bisect_right(self.starts, end))
+
+    def cursor(self, document, index):
+        """Returns a QTextCursor selecting the match at index.
+
+        Like the cursors of a search, the position is at the start and the
+        anchor at the end of the match.
+
+        """
+        c = QTextCursor(document)
+        c.setPosition(self.ends[index])
+        c.setPosition(self.starts[index], QTextCursor.MoveMode.KeepAnchor)
+        return c
+
+    def cursors(self, document, indices=None):
+        """Returns a list of QTextCursors for the indices (default all matches)."""
+        if indices is None:
+            indices = range(len(self))
+        return [self.cursor(document, i) for i in indices]
+
+    def update(self, document, pattern, position, removed, added):
+        """Adjusts the matches after a change in the document.
+
+        The matches in the changed blocks are searched again using the
+        compiled regular expression pattern, and the matches after the
+        change are shifted. Only use this when a match can not contain a
+        newline.
+
+        """
+        end = min(position + added, document.characterCount() - 1)
+        first = document.findBlock(position)
+        last = document.findBlock(end)
+        start = first.position()
+        end = last.position() + last.length() - 1
+        # the same range in the old text
+        old_end = end - added + removed
+        i = bisect.bisect_left(self.starts, start)
+        j = bisect.bisect_right(self.starts, old_end)
+
+        block = first
+        texts = [block.text()]
+        while block != last:
+            block = block.next()
+            texts.append(block.text())
+        found = scan(pattern, '\n'.join(texts), start)
+
+        delta = added - removed
+        if delta:
+            self.starts[j:] = array.array('q', (s + delta for s in self.starts[j:]))
+            self.ends[j:] = array.array('q', (e + delta for e in self.ends[j:]))
+        self.starts[i:j] = found.starts
+        self.ends[i:j] = found.ends
+
+
+def scan(pattern, text, offset=0, scanner=None):
+    """Returns the Matches of the compiled pattern in text.
+
+    The offset is added to the positions. If a Scanner is given, stops
+    when it is cancelled and keeps its count up to date.
+
+    """
+    matches = Matches()
+    add = matches.add
+    for m in pattern.finditer(text):
+        start, end = m.span()
+        add(start + offset, end + offset)
+        if scanner is not None:
+            scanner.count += 1
+            if scanner.cancelled:
+                break
+    return matches
+
+
+class Scanner(background.Thread):
+    """Searches a text in a background thread.
+
+    While running, the count attribute holds the number of matches found
+    so far. When finished, the matches attribute holds the Matches.
+
+    """
+    def __init__(self, pattern, text, offset=0):
+        super().__init__()
+        self.pattern = pattern
+        self.text = text
+        self.offset = offset
+        self.count = 0
+        self.cancelled = False
+        self.matches = None
+
+    def cancel(self):
+        """Stops searching as soon as possible."""
+        self.cancelled = True
+
+    def run(self):
+        self.matches = scan(self.pattern, self.text, self.offset, self)
+        self.text = None
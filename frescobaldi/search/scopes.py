@@ -0,0 +1,105 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Search scopes, restricting the matches to certain kinds of tokens.
+
+A match is in a scope if the token it starts in is. The tokens are the ones
+the highlighter stored for every block (see tokeniter), so the text is not
+tokenized again.
+
+"""
+
+
+import bisect
+
+import ly.lex
+import ly.lex.lilypond
+
+import tokeniter
+
+from . import matches
+
+
+class Scope:
+    """Accepts tokens that are an instance of one of the include classes.
+
+    If include is empty, accepts all tokens that are not an instance of one
+    of the exclude classes, and text that is not in a token (whitespace).
+
+    """
+    def __init__(self, include=(), exclude=()):
+        self.include = include
+        self.exclude = exclude
+
+    def accepts(self, token):
+        """Return True if a match starting in the token is in this scope."""
+        if self.include:
+            return isinstance(token, self.include)
+        return not isinstance(token, self.exclude)
+
+
+MUSIC = Scope(exclude=(ly.lex.Comment, ly.lex.String,
+                       ly.lex.lilypond.Markup, ly.lex.lilypond.MarkupWord))
+NOTES = Scope(include=(ly.lex.lilypond.Note,))
+LYRICS = Scope(include=(ly.lex.lilypond.Lyric,))
+COMMENTS = Scope(include=(ly.lex.Comment,))
+STRINGS = Scope(include=(ly.lex.String,))
+
+# the scopes in the order they are shown, the first searches everywhere
+SCOPES = (None, MUSIC, NOTES, LYRICS, COMMENTS, STRINGS)
+
+
+def titles():
+    """Return the translated titles of the scopes."""
+    return (
+        _("Everywhere"),
+        _("Music"),
+        _("Notes"),
+        _("Lyrics"),
+        _("Comments"),
+        _("Strings"),
+    )
+
+
+def token(tokens, positions, column):
+    """Return the token at column, or None if column is between tokens.
+
+    positions is the list of the positions of the tokens in their block.
+
+    """
+    i = bisect.bisect_right(positions, column) - 1
+    if i >= 0 and column < positions[i] + len(tokens[i]):
+        return tokens[i]
+
+
+def select(scope, document, found):
+    """Return the Matches of found that start in a token in the scope."""
+    result = matches.Matches()
+    end = -1
+    for start, stop in zip(found.starts, found.ends):
+        if start >= end:
+            block = document.findBlock(start)
+            position = block.position()
+            end = position + block.length()
+            tokens = tokeniter.tokens(block)
+            positions = [t.pos for t in tokens]
+        if scope.accepts(token(tokens, positions, start - position)):
+            result.add(start, stop)
+    return result
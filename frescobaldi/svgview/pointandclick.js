@@ -19,30 +19,65 @@
 * See http://www.gnu.org/licenses/ for more information.
 */
 
-function hover(){
-    var url = this.getAttribute('xlink:href');
-    pyLinks.hover(url);	
-};
+// The links are found via event delegation, so the document does not need
+// to be scanned for <a> elements when it is loaded.
 
-function leave(){
-    var url = this.getAttribute('xlink:href');
-    pyLinks.leave(url);	
+function linkOf(node){
+    while (node && node.nodeName != 'a') {
+        node = node.parentNode;
+    }
+    return node;
 };
 
-function click(){
-    var url = this.getAttribute('xlink:href');
-    pyLinks.click(url);
-    return false    // cancel further navigation
-};
+document.addEventListener('mouseover', function(ev){
+    var a = linkOf(ev.target);
+    if (a && !a.contains(ev.relatedTarget)) {
+        pyLinks.hover(a.getAttribute('xlink:href'));
+    }
+});
 
-var a = document.getElementsByTagName('a');
-//loop through all links
-for (var i= 0; i < a.length; ++i){
+document.addEventListener('mouseout', function(ev){
+    var a = linkOf(ev.target);
+    if (a && !a.contains(ev.relatedTarget)) {
+        pyLinks.leave(a.getAttribute('xlink:href'));
+    }
+});
 
-	a[i].onmouseover = hover;
-    a[i].onmouseout = leave;
-	a[i].onclick = click;
-}
-	
+document.addEventListener('click', function(ev){
+    var a = linkOf(ev.target);
+    if (a) {
+        pyLinks.click(a.getAttribute('xlink:href'));
+        ev.preventDefault();    // cancel further navigation
+    }
+});
 
+// Highlight the <a> elements with the given indices (called from Python,
+// the indices come from the link index built by svgfiles.links()).
+var highlights = [];
 
+function highlightLinks(indices, color){
+    for (var i = 0; i < highlights.length; ++i) {
+        highlights[i].remove();
+    }
+    highlights = [];
+    var a = document.getElementsByTagName('a');
+    for (var i = 0; i < indices.length; ++i) {
+        var link = a[indices[i]];
+        if (!link) {
+            continue;
+        }
+        var box = link.getBBox();
+        var rect = document.createElementNS('http://www.w3.org/2000/svg', 'rect');
+        rect.setAttribute('x', box.x);
+        rect.setAttribute('y', box.y);
+        rect.setAttribute('width', box.width);
+        rect.setAttribute('height', box.height);
+        rect.setAttribute('fill', color);
+        rect.setAttribute('pointer-events', 'none');
+        link.parentNode.insertBefore(rect, link);
+        highlights.push(rect);
+    }
+    if (highlights.length) {
+        highlights[0].scrollIntoView({block: 'nearest', inline: 'nearest'});
+    }
+};
@@ -23,8 +23,9 @@ Handles SVG files.
 
 
 import os
+import xml.etree.ElementTree as ET
 
-from PyQt6.QtCore import Qt, QUrl
+from PyQt6.QtCore import Qt, QTimer, QUrl
 
 import icons
 import plugin
@@ -32,6 +33,49 @@ import signals
 import job.manager
 import resultfiles
 import listmodel
+import filecache
+import pointandclick
+import textedit
+import util
+
+
+# cache the point and click links of SVG files
+_links_cache = filecache.FileCache()
+
+_SVG_A = '{http://www.w3.org/2000/svg}a'
+_XLINK_HREF = '{http://www.w3.org/1999/xlink}href'
+
+
+def links(filename):
+    """Return a pointandclick.Links instance for the SVG file.
+
+    The file is parsed incrementally; only the <a> elements are looked at.
+    The destination of every textedit link is the index of its <a> element
+    in the document, which is the same as its index in the list returned
+    by document.getElementsByTagName('a') in JavaScript.
+
+    """
+    try:
+        return _links_cache[filename]
+    except KeyError:
+        links = pointandclick.Links()
+        with links:
+            index = 0
+            try:
+                for event, elem in ET.iterparse(filename, ('start', 'end')):
+                    if event == 'end':
+                        elem.clear()
+                    elif elem.tag == _SVG_A:
+                        url = elem.get(_XLINK_HREF) or elem.get('href')
+                        t = textedit.link(url) if url else None
+                        if t:
+                            source = util.normpath(t.filename)
+                            links.add_link(source, t.line, t.column, index)
+                        index += 1
+            except (OSError, ET.ParseError):
+                pass
+        _links_cache[filename] = links
+        return links
 
 
 class SvgFiles(plugin.DocumentPlugin):
@@ -74,3 +118,16 @@ class SvgFiles(plugin.DocumentPlugin):
         if self._files is None:
             self.update()
         return self._files[index]
+
+    def links(self, index):
+        """Return the pointandclick.Links for the file at index (see links())."""
+        return links(self.filename(index))
+
+    def prefetch(self, index):
+        """Index the links of the pages next to index in the background."""
+        def load():
+            if self._files:
+                for i in (index + 1, index - 1):
+                    if 0 <= i < len(self._files):
+                        links(self._files[i])
+        QTimer.singleShot(0, load)
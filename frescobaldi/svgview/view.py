@@ -28,6 +28,7 @@ that runs inside the displayed SVG file.
 
 
 
+import json
 import os
 import sys
 
@@ -70,6 +71,7 @@ class View(QWebEngineView):
     def __init__(self, parent):
         super().__init__(parent)
         self._highlightFormat = QTextCharFormat()
+        self._highlightMusicColor = None
         self.jslink = JSLink(self)
         channel = QWebChannel(self)
         channel.registerObject("pyLinks", self.jslink)
@@ -204,9 +206,24 @@ class View(QWebEngineView):
 
     def readSettings(self):
         """Reads the settings from the user's preferences."""
-        color = textformats.formatData('editor').baseColors['selectionbackground']
+        colors = textformats.formatData('editor').baseColors
+        color = colors['selectionbackground']
         color.setAlpha(128)
         self._highlightFormat.setBackground(color)
+        color = colors['musichighlight']
+        self._highlightMusicColor = "rgba({}, {}, {}, 0.5)".format(
+            color.red(), color.green(), color.blue())
+
+    def highlightLinks(self, indices):
+        """Highlight the link elements with the specified indices.
+
+        The indices are the destinations in the Links of the current SVG
+        file (see svgfiles.links()). An empty list clears the highlighting.
+
+        """
+        if not self.url().isEmpty() and not self.url().path().endswith(".html"):
+            self.page().runJavaScript("highlightLinks({}, {});".format(
+                json.dumps(list(indices)), json.dumps(self._highlightMusicColor)))
 
     def saveSVG(self, svg_string):
         """Pass string from JavaScript and save to current SVG page."""
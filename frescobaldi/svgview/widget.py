@@ -88,10 +88,15 @@ class SvgView(QWidget):
         self.zoomNumber.valueChanged.connect(self.slotZoomNumberChanged)
         self.view.zoomFactorChanged.connect(self.slotViewZoomChanged)
         dockwidget.mainwindow().currentDocumentChanged.connect(self.initSvg)
+        dockwidget.mainwindow().currentViewChanged.connect(self.slotCurrentViewChanged)
+        self.view.loadFinished.connect(self.showCurrentLinks)
         self.zoomNumber.setValue(100)
         doc = dockwidget.mainwindow().currentDocument()
         if doc:
             self.initSvg(doc)
+        editor = dockwidget.mainwindow().currentView()
+        if editor:
+            self.slotCurrentViewChanged(editor)
         app.translateUI(self)
 
     def translateUI(self):
@@ -111,6 +116,7 @@ class SvgView(QWidget):
                     self.pageCombo.setModel(model)
                     self.pageCombo.setCurrentIndex(files.current)
                 self.view.load(files.url(files.current))
+                files.prefetch(files.current)
 
     def reLoadDoc(self):
         """Reloads current document."""
@@ -143,6 +149,7 @@ class SvgView(QWidget):
                 files.current = page_index
                 svg = files.url(page_index)
                 self.view.load(svg)
+                files.prefetch(page_index)
 
     def slotDocumentClosed(self, doc):
         if doc == self._document:
@@ -153,3 +160,25 @@ class SvgView(QWidget):
             self.pageCombo.update() # otherwise it doesn't redraw
             self.view.clear()
 
+    def slotCurrentViewChanged(self, view, old=None):
+        if old:
+            old.cursorPositionChanged.disconnect(self.showCurrentLinks)
+        view.cursorPositionChanged.connect(self.showCurrentLinks)
+
+    def showCurrentLinks(self):
+        """Highlight the objects at the current text cursor in the current page."""
+        if not self.isVisible() or not self._document:
+            return
+        files = svgfiles.SvgFiles.instance(self._document)
+        if not files:
+            return
+        view = self.mainwindow().currentView()
+        links = files.links(files.current).boundLinks(view.document())
+        if not links:
+            return # the page contains no references to the current text document
+        s = links.indices(view.textCursor())
+        if not s:
+            if s is False:
+                self.view.highlightLinks([])
+            return
+        self.view.highlightLinks(i for dest in links.destinations()[s] for i in dest)
@@ -0,0 +1,233 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+An index of the definitions in a document and the files it includes.
+
+The variables, music functions and markup commands a file defines are read
+once from its cached DocInfo (see fileinfo). For a document and an include
+path, the included files and the merged table of their definitions are
+cached. The files are watched (see background.Watcher), and an index is
+removed as soon as one of its files changes on disk, or when an included
+file that was not found is created. The fileChanged signal is then emitted.
+
+"""
+
+
+import bisect
+import collections
+import os
+
+import ly.lex.lilypond
+import ly.lex.scheme
+
+import background
+import filecache
+import fileinfo
+import signals
+
+
+# kinds of definitions
+VARIABLE = "variable"
+FUNCTION = "function"
+MARKUP = "markup"
+
+# number of include graphs to keep
+MAX_INDICES = 32
+
+_functions = (
+    'define-music-function',
+    'define-scheme-function',
+    'define-void-function',
+    'define-event-function',
+)
+
+Symbol = collections.namedtuple('Symbol', 'name kind filename position')
+
+_file_symbols = filecache.FileCache()
+_indices = collections.OrderedDict()
+
+# emitted with the filename when an included file of an index changed on disk
+# or was created
+fileChanged = signals.Signal()
+
+
+def symbols(dinfo, filename=None):
+    """Returns two dicts (definitions, markup) for the DocInfo's document.
+
+    Both map a name to a Symbol. The first contains the identifiers that
+    are assigned to, the second the markup commands (defined as a variable
+    or using define-markup-command). Later definitions override earlier ones.
+
+    """
+    definitions = {}
+    markup = {}
+    tokens = dinfo.tokens
+    for i in dinfo.find_all(None, ly.lex.lilypond.Name):
+        if i == 0 or tokens[i-1] == '\n':
+            kind = VARIABLE
+            for t in tokens[i+1:i+8]:
+                if isinstance(t, ly.lex.scheme.Function) and t in _functions:
+                    kind = FUNCTION
+                    break
+            name = str(tokens[i])
+            definitions[name] = Symbol(name, kind, filename, tokens[i].pos)
+    for t in dinfo.markup_definitions():
+        name = str(t)
+        markup[name] = Symbol(name, MARKUP, filename, t.pos)
+    return definitions, markup
+
+
+def file_symbols(filename):
+    """Returns the (cached) symbols() of the file."""
+    try:
+        return _file_symbols[filename]
+    except KeyError:
+        result = _file_symbols[filename] = symbols(fileinfo.docinfo(filename), filename)
+        return result
+
+
+class Index:
+    """The definitions in a list of (included) files.
+
+    The definitions and markup attributes are dicts mapping a name to a
+    Symbol, like the ones returned by symbols(). The files are in the order
+    they are included (see fileinfo.include_order()), a definition in a
+    later file overrides one in an earlier file.
+
+    missing are the paths where included files that were not found have
+    been looked for.
+
+    """
+    def __init__(self, files, missing=()):
+        self._files = []
+        self._missing = frozenset(missing)
+        self.definitions = {}
+        self.markup = {}
+        for filename in files:
+            try:
+                definitions, markup = file_symbols(filename)
+            except OSError:
+                continue
+            self._files.append(filename)
+            self.definitions.update(definitions)
+            self.markup.update(markup)
+
+    def files(self):
+        """Returns the included files."""
+        return self._files
+
+    def missing(self):
+        """Returns the paths of the included files that were not found."""
+        return self._missing
+
+    def lookup(self, name):
+        """Returns the Symbol for the name, or None."""
+        return self.definitions.get(name) or self.markup.get(name)
+
+
+def index(dinfo, include_path=()):
+    """Returns the Index of the files included by the DocInfo's document.
+
+    The document itself is not part of the index.
+
+    """
+    key = (dinfo.document.filename, tuple(dinfo.include_args()), tuple(include_path))
+    try:
+        idx = _indices[key]
+    except KeyError:
+        missing = set()
+        files = fileinfo.include_order(dinfo, include_path, missing)
+        idx = _indices[key] = Index(files, missing)
+        _watch(idx.files(), idx.missing())
+        if len(_indices) > MAX_INDICES:
+            while len(_indices) > MAX_INDICES:
+                _indices.popitem(False)
+            _unwatch()
+    else:
+        _indices.move_to_end(key)
+    return idx
+
+
+def _directory(path):
+    """Returns the nearest existing directory the path would be created in."""
+    path = os.path.dirname(path)
+    while not os.path.isdir(path) and path != os.path.dirname(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def _watch(files, missing=()):
+    """Starts watching the files, and the directories of missing files."""
+    _file_watcher.addPaths(files)
+    _directory_watcher.addPaths(set(map(_directory, missing)))
+
+
+def _unwatch():
+    """Stops watching the files and directories that are not in any index."""
+    files = set()
+    directories = set()
+    for idx in _indices.values():
+        files.update(idx.files())
+        directories.update(map(_directory, idx.missing()))
+    _file_watcher.removePaths(_file_watcher.paths() - files)
+    _directory_watcher.removePaths(_directory_watcher.paths() - directories)
+
+
+def _file_changed(filename):
+    """Called when a file changed on disk, removes the indices containing it."""
+    changed = False
+    for key, idx in list(_indices.items()):
+        if filename in idx.files():
+            del _indices[key]
+            changed = True
+    _unwatch()
+    if changed:
+        fileChanged(filename)
+
+
+def _directory_changed(path):
+    """Called when a directory changed, removes the indices of which a
+    missing included file has been created."""
+    created = None
+    missing = set()
+    for key, idx in list(_indices.items()):
+        for filename in idx.missing():
+            if os.path.isfile(filename):
+                del _indices[key]
+                created = filename
+                break
+        else:
+            missing.update(idx.missing())
+    # a directory of a missing file could have been created
+    _watch((), missing)
+    _unwatch()
+    if created:
+        fileChanged(created)
+
+
+_file_watcher = background.Watcher(_file_changed)
+_directory_watcher = background.Watcher(_directory_changed)
+
+
+def toplevel_item(node, position):
+    """Returns the toplevel item of the music Document node at position."""
+    i = bisect.bisect_right([item.position for item in node], position) - 1
+    if i >= 0:
+        return node[i]
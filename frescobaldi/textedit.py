@@ -27,7 +27,7 @@ import sys
 import collections
 import urllib.parse
 
-__all__ = ['link']
+__all__ = ['link', 'url']
 
 
 textedit_match = re.compile(r"^textedit://(.*?):(\d+):(\d+)(?::\d+)$").match
@@ -50,6 +50,14 @@ def link(url):
     if m:
         return readurl(m)
 
+def url(filename, line, column):
+    """Return a `textedit:` url for the filename, line and column.
+
+    This is the inverse of link(); the filename is percent-encoded.
+
+    """
+    return f"textedit://{urllib.parse.quote(filename)}:{line}:{column}:{column}"
+
 def readurl(match):
     """Return Link(filename, line, col) for the match object resulting from textedit_match.
 
@@ -27,7 +27,6 @@ import os
 from PyQt6.QtCore import QSettings
 
 import app
-import plugin
 import resultfiles
 import signals
 import pagedview
@@ -39,8 +38,7 @@ documentUpdated = signals.Signal() # Document
 
 @app.jobFinished.connect
 def _on_job_finished(document, job):
-    if group(document).update():
-        documentUpdated(document, job)
+    group(document).load(job)
 
 
 def group(document):
@@ -48,7 +46,7 @@ def group(document):
     return DocumentGroup.instance(document)
 
 
-class DocumentGroup(plugin.DocumentPlugin):
+class DocumentGroup(pagedview.PdfDocumentGroup):
     """Represents a group of PDF documents, created by the text document it belongs to.
 
     Multiple MusicView instances can use this group, they can store the positions
@@ -56,32 +54,27 @@ class DocumentGroup(plugin.DocumentPlugin):
     instances returned by documents(). On update() these Document instances will be reused.
 
     The global documentUpdated(Document) signal will be emitted when the global
-    app.jobFinished() signal causes a reload of documents in a group.
+    app.jobFinished() signal causes a reload of documents in a group. The PDF
+    files are then loaded in a background thread, and the previous documents
+    are kept until the signal is emitted.
 
     """
-    def __init__(self, document):
-        self._documents = None
-        document.loaded.connect(self.update, -100)
-
-    def documents(self):
-        """Returns the list of PDF Document objects created by our text document."""
-        # If the list is asked for the very first time, update
-        if self._documents is None:
-            self._documents = []
-            self.update()
-        return self._documents[:]
-
-    def update(self, newer=None):
+    def documentsUpdated(self, job):
+        """Emits the documentUpdated signal."""
+        documentUpdated(self.document(), job)
+
+    def update(self, newer=None, loaded=None, digests=None):
         """Queries the resultfiles of this text document for PDF files and loads them.
 
-        Returns True if new documents were loaded.
-        If newer is True, only PDF files newer than the source document are returned.
-        If newer is False, all PDF files are returned.
-        If newer is None (default), the setting from the configuration is used.
+        See pagedview.PdfDocumentGroup.update().
 
         """
         if newer is None:
             newer = QSettings().value("musicview/newer_files_only", True, bool)
+        if loaded is None:
+            loaded = {}
+        if digests is None:
+            digests = {}
 
         results = resultfiles.results(self.document())
         files = results.files(".pdf", newer)
@@ -97,9 +90,9 @@ class DocumentGroup(plugin.DocumentPlugin):
             for filename in files:
                 doc = d.get(filename)
                 if doc:
-                    doc.invalidate()
+                    doc.setSource(filename, loaded.get(filename), digests.get(filename))
                 else:
-                    doc = pagedview.loadPdf(filename)
+                    doc = pagedview.loadPdf(filename, loaded.get(filename), digests.get(filename))
                     doc.ispresent = os.path.isfile(filename)
                 doc.updated = newer or results.is_newer(filename)
                 documents.append(doc)
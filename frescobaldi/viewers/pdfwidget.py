@@ -138,6 +138,7 @@ class AbstractPdfWidget(abstractviewwidget.AbstractViewWidget):
         self.view.linkHovered.connect(self.slotLinkHovered)
         self.view.linkLeft.connect(self.slotLinkLeft)
         self.view.linkHelpRequested.connect(self.slotLinkHelpRequested)
+        self.view.rubberband().selectionChanged.connect(self.slotSelectionChanged)
 
     def viewerName(self):
         """Return the viewerName() attribute of the panel."""
@@ -159,6 +160,7 @@ class AbstractPdfWidget(abstractviewwidget.AbstractViewWidget):
             self.view.setDocument(doc)
             doc.ispresent = True
             self._links = pointandclick.links(doc)
+            self.view.setPointAndClickLinks(self._links)
         except OSError:
             # the file is not found on the given path
             dlg = widgets.dialog.Dialog(buttons=('yes', 'no'))
@@ -180,6 +182,7 @@ class AbstractPdfWidget(abstractviewwidget.AbstractViewWidget):
         """Empties the view."""
         self._links = None
         self._highlightRange = None
+        self.view.setPointAndClickLinks(None)
         self.view.clear()
 
     def readSettings(self):
@@ -245,6 +248,19 @@ class AbstractPdfWidget(abstractviewwidget.AbstractViewWidget):
         view = self.parent().mainwindow().currentView()
         viewhighlighter.highlighter(view).clear(self._highlightFormat)
 
+    def slotSelectionChanged(self, rect):
+        """Called when the rubberband selection changes.
+
+        The tokens of the objects inside the selection that point to the
+        current editor document are highlighted using a transparent
+        selection color, see viewhighlighter.highlight_selection().
+
+        """
+        view = self.parent().mainwindow().currentView()
+        if view:
+            viewhighlighter.highlight_selection(view, self.view,
+                self._links if rect else None, self._highlightFormat)
+
     def slotLinkHelpRequested(self, ev, page, link):
         """Called when a ToolTip wants to appear above the hovered link."""
         pos = self.view.viewport().mapToGlobal(ev.pos())
@@ -29,6 +29,7 @@ from PyQt6.QtGui import QColor, QTextCharFormat, QTextFormat
 import app
 import plugin
 import bookmarks
+import pointandclick
 import textformats
 import gadgets.arbitraryhighlighter
 
@@ -104,3 +105,25 @@ class ViewHighlighter(plugin.Plugin, gadgets.arbitraryhighlighter.ArbitraryHighl
         if name in ('current', 'mark', 'error'):
             f.setProperty(QTextFormat.Property.FullWidthSelection, True)
         return f
+
+
+def highlight_selection(view, pageview, links, textformat):
+    """Highlight the objects in the rubberband selection of a page view.
+
+    view is the editor View, pageview the qpageview.View with the rubberband
+    and links its pointandclick.PageLinks (or None). The tokens of the objects
+    that point to the editor's document are highlighted using textformat.
+    If there are none, the highlighting is cleared.
+
+    """
+    page, rect = pageview.rubberband().selectedPage()
+    if page and links:
+        num = pageview.pageLayout().index(page)
+        area = page.mapFromPage(1, 1).rect(rect)
+        cursors = []
+        for cursor in links.boundCursors(view.document(), num, area):
+            cursors.extend(pointandclick.positions(cursor))
+        if cursors:
+            highlighter(view).highlight(textformat, cursors, 2)
+            return
+    highlighter(view).clear(textformat)
@@ -43,6 +43,7 @@ information.
 
 
 import collections
+import random
 
 from PyQt6.QtCore import QEvent, QObject, QPoint, QRect, QSize, Qt, QTimer
 from PyQt6.QtGui import QPainter, QPalette
@@ -60,6 +61,246 @@ Region = collections.namedtuple('Region', 'start end')
 Level = collections.namedtuple('Level', 'stop start')
 
 
+class _Node:
+    """A node of a LevelTree, holding the fold level of one block.
+
+    The other attributes describe the subtree of the node: size is the number
+    of blocks, total the change in depth, low the lowest depth inside a block
+    (relative to the depth before the first block) and low_start the same, but
+    only for the blocks where a region starts.
+
+    """
+    __slots__ = (
+        'left', 'right', 'priority', 'stop', 'start', 'state',
+        'size', 'total', 'low', 'low_start')
+
+    def __init__(self, stop, start, state):
+        self.left = self.right = None
+        self.priority = random.random()
+        self.stop = stop
+        self.start = start
+        self.state = state
+
+    def update(self):
+        """Recompute the attributes describing the subtree."""
+        left, right = self.left, self.right
+        size, total, low, low_start = 1, 0, _INF, _INF
+        if left:
+            size += left.size
+            total, low, low_start = left.total, left.low, left.low_start
+        bottom = total + self.stop
+        low = min(low, bottom)
+        if self.start:
+            low_start = min(low_start, bottom)
+        total = bottom + self.start
+        if right:
+            size += right.size
+            low = min(low, total + right.low)
+            low_start = min(low_start, total + right.low_start)
+            total += right.total
+        self.size, self.total, self.low, self.low_start = size, total, low, low_start
+
+
+_INF = float('inf')
+
+
+def _size(node):
+    return node.size if node else 0
+
+
+def _total(node):
+    return node.total if node else 0
+
+
+def _split(node, index):
+    """Split the subtree in the blocks before index and the rest."""
+    if not node:
+        return None, None
+    count = _size(node.left)
+    if index <= count:
+        before, node.left = _split(node.left, index)
+        node.update()
+        return before, node
+    node.right, after = _split(node.right, index - count - 1)
+    node.update()
+    return node, after
+
+
+def _merge(before, after):
+    """Return a subtree with the blocks of after following those of before."""
+    if not before:
+        return after
+    if not after:
+        return before
+    if before.priority > after.priority:
+        before.right = _merge(before.right, after)
+        before.update()
+        return before
+    after.left = _merge(before, after.left)
+    after.update()
+    return after
+
+
+def _build(levels):
+    """Return a subtree for the (stop, start, state) tuples, in linear time."""
+    stack = []
+    for stop, start, state in levels:
+        node = _Node(stop, start, state)
+        child = None
+        while stack and stack[-1].priority < node.priority:
+            child = stack.pop()
+            child.update()
+        node.left = child
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+    for node in reversed(stack):
+        node.update()
+    return stack[0] if stack else None
+
+
+def _find_start(node, end, depth, threshold):
+    """Return the index of the last block before end where a region starts
+    and the depth goes below threshold, or -1.
+
+    depth is the depth before the first block of the subtree.
+
+    """
+    if not node or end <= 0 or depth + node.low_start >= threshold:
+        return -1
+    count = _size(node.left)
+    bottom = depth + _total(node.left) + node.stop
+    if end > count + 1:
+        index = _find_start(node.right, end - count - 1, bottom + node.start, threshold)
+        if index != -1:
+            return count + 1 + index
+    if end > count and node.start and bottom < threshold:
+        return count
+    return _find_start(node.left, end, depth, threshold)
+
+
+def _find_end(node, begin, depth, threshold):
+    """Return the index of the first block from begin where the depth goes
+    down to threshold or lower, or -1.
+
+    depth is the depth before the first block of the subtree.
+
+    """
+    if not node or begin >= node.size or depth + node.low > threshold:
+        return -1
+    count = _size(node.left)
+    if begin < count:
+        index = _find_end(node.left, begin, depth, threshold)
+        if index != -1:
+            return index
+    bottom = depth + _total(node.left) + node.stop
+    if begin <= count and bottom <= threshold:
+        return count
+    index = _find_end(node.right, max(0, begin - count - 1), bottom + node.start, threshold)
+    return count + 1 + index if index != -1 else -1
+
+
+class LevelTree:
+    """Stores the fold level of every block in a balanced tree.
+
+    Every block is stored as a (stop, start, state) tuple, where stop and
+    start are the fold level and state may be anything. All methods that
+    look up the depth or search for blocks are O(log n), replacing blocks
+    is O(log n) plus the number of new blocks.
+
+    The bottom of a block is the depth after the regions that stop in it
+    have ended, i.e. the depth before the block plus its stop value.
+
+    """
+    def __init__(self, levels=()):
+        self._root = _build(levels)
+
+    def __len__(self):
+        return _size(self._root)
+
+    def replace(self, index, count, levels):
+        """Replace count blocks from index with the list of new levels."""
+        before, rest = _split(self._root, index)
+        after = _split(rest, count)[1]
+        self._root = _merge(_merge(before, _build(levels)), after)
+
+    def levels(self, index=0):
+        """Yield the (stop, start, state) tuples from the block at index."""
+        stack = []
+        node = self._root
+        while node:
+            count = _size(node.left)
+            if index <= count:
+                stack.append(node)
+                node = node.left
+            else:
+                index -= count + 1
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node.stop, node.start, node.state
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+
+    def depth(self, index):
+        """Return the depth before the block at index."""
+        depth = 0
+        node = self._root
+        while node:
+            count = _size(node.left)
+            if index <= count:
+                node = node.left
+            else:
+                depth += _total(node.left) + node.stop + node.start
+                index -= count + 1
+                node = node.right
+        return depth
+
+    def bottom(self, index):
+        """Return the bottom of the block at index."""
+        return self.depth(index) + next(self.levels(index))[0]
+
+    def lowest_start(self, end):
+        """Return the lowest bottom of a block before end where a region starts.
+
+        Returns infinity if no region starts before end.
+
+        """
+        depth, low = 0, _INF
+        node = self._root
+        while node:
+            count = _size(node.left)
+            if end <= count:
+                node = node.left
+                continue
+            if node.left:
+                low = min(low, depth + node.left.low_start)
+            bottom = depth + _total(node.left) + node.stop
+            if node.start:
+                low = min(low, bottom)
+            depth = bottom + node.start
+            end -= count + 1
+            node = node.right
+        return low
+
+    def find_start(self, end, threshold):
+        """Return the index of the last block before end where a region starts
+        and the bottom is lower than threshold, or -1 if there is none.
+
+        """
+        return _find_start(self._root, end, 0, threshold)
+
+    def find_end(self, begin, threshold):
+        """Return the index of the first block from begin that has its
+        bottom at threshold or lower, or -1 if there is none.
+
+        """
+        return _find_end(self._root, begin, 0, threshold)
+
+
+
 class LinePainter(QObject):
     """Paints a line below a block if the next block is invisible.
 
@@ -100,25 +341,28 @@ class Folder(QObject):
     You should inherit from this class to provide folding events.
     It is enough to implement the fold_events() method.
 
-    By default, simple caching is used to store the nesting depth every
-    20 lines. This makes the depth() method faster, which would otherwise count
-    the fold_events() for every block from the beginning of the document.
+    By default, the fold level of every block is stored in a LevelTree, so
+    depth() and region() need not count the fold_events() of all the blocks
+    before (or after) a block. The levels of the changed blocks are computed
+    again when needed, and of the blocks following them as long as their
+    userState() has changed (i.e. the syntax highlighter changed the state
+    they start with).
 
-    The depth() caching expects that the fold_events that a text block
-    generates do not depend on the contents of a text block later in the
-    document.
+    This expects that the fold_events that a text block generates only depend
+    on the block's text and the userState() of the previous block.
 
     If your fold_events() method generates events for a text block that depend
-    on a later block, you should disable caching by setting the
-    cache_depth_lines instance (or class) attribute to zero.
+    on other blocks, you should disable storing the levels by setting the
+    store_levels instance (or class) attribute to False.
 
     """
-    # cache depth() for every n lines (0=disable)
-    cache_depth_lines = 20
+    # store the fold level of every block in a LevelTree
+    store_levels = True
 
     def __init__(self, doc):
         QObject.__init__(self, doc)
-        self._depth_cache = []      # cache result of depth()
+        self._levels = LevelTree([(0, 0, None)] * doc.blockCount())
+        self._dirty = [(0, doc.blockCount() - 1)]  # ranges of blocks that need a new level
         self._all_visible = None    # True when all are certainly visible
         doc.contentsChange.connect(self.slot_contents_change)
         self._timer = QTimer(singleShot=True, timeout=self.check_consistency)
@@ -137,13 +381,23 @@ class Folder(QObject):
         """Called when the document changes.
 
         Provides limited support for unhiding regions when the user types
-        text in it, and deletes the depth() cache for lines from position.
+        text in it, and marks the changed blocks for storing their level again.
 
         """
-        block = self.document().findBlock(position)
-        if self.cache_depth_lines:
-            chunk = block.blockNumber() // self.cache_depth_lines
-            del self._depth_cache[chunk:]
+        doc = self.document()
+        block = doc.findBlock(position)
+        first = block.blockNumber()
+        last = doc.findBlock(min(position + added, doc.characterCount() - 1)).blockNumber()
+        delta = doc.blockCount() - len(self._levels)
+        count = last - first + 1
+        if 0 <= count - delta <= len(self._levels) - first:
+            self._levels.replace(first, count - delta, [(0, 0, None)] * count)
+            # the dirty blocks after the change have moved
+            self._dirty = [tuple(n if n < first else max(first, n + delta) for n in d)
+                           for d in self._dirty]
+            self._add_dirty(first, last)
+        else:
+            self._reset_levels()
 
         if self._all_visible:
             return
@@ -170,10 +424,58 @@ class Folder(QObject):
         self._timer.start(250 + self.document().blockCount())
 
     def invalidate_depth_cache(self, block):
-        """Makes sure the depth is recomputed from the specified block."""
-        if self.cache_depth_lines:
-            chunk = block.blockNumber() // self.cache_depth_lines
-            del self._depth_cache[chunk:]
+        """Makes sure the levels are computed again from the specified block."""
+        self._add_dirty(block.blockNumber(), len(self._levels) - 1)
+
+    def _reset_levels(self):
+        """Called when we missed a change, stores all levels again."""
+        count = self.document().blockCount()
+        self._levels = LevelTree([(0, 0, None)] * count)
+        self._dirty = [(0, count - 1)]
+
+    def _add_dirty(self, first, last):
+        """Marks the blocks first through last as needing a new level."""
+        dirty = []
+        for begin, end in self._dirty:
+            if end + 1 < first or begin > last + 1:
+                dirty.append((begin, end))
+            else:
+                first, last = min(first, begin), max(last, end)
+        dirty.append((first, last))
+        dirty.sort()
+        self._dirty = dirty
+
+    def update_levels(self, number):
+        """Stores the level of the changed blocks up to the block number.
+
+        Returns the number of blocks (from the beginning of the document) that
+        have their level stored.
+
+        """
+        if len(self._levels) != self.document().blockCount():
+            self._reset_levels()
+        while self._dirty and self._dirty[0][0] <= number:
+            first, last = self._dirty.pop(0)
+            old = self._levels.levels(first)
+            levels = []
+            block = self.document().findBlockByNumber(first)
+            while True:
+                state = next(old)[2]
+                stop, start = self.fold_level(block)
+                new_state = block.userState()
+                levels.append((stop, start, new_state))
+                index = first + len(levels)
+                block = block.next()
+                if self._dirty and index == self._dirty[0][0]:
+                    # we ran into the next dirty range
+                    last = max(last, self._dirty.pop(0)[1])
+                if not block.isValid() or (index > last and state == new_state):
+                    break
+                elif index > number:
+                    self._dirty.insert(0, (index, max(index, last)))
+                    break
+            self._levels.replace(first, len(levels), levels)
+        return self._dirty[0][0] if self._dirty else len(self._levels)
 
     def check_consistency(self):
         """Called some time after the last document change.
@@ -284,30 +586,17 @@ class Folder(QObject):
     def depth(self, block):
         """Return the number of active regions at the start of this block.
 
-        The default implementation simply counts all the fold_events from
-        the beginning of the document, using caching if the cache_depth_lines
-        instance attribute is set to a value > 0.
+        The default implementation looks up the depth in the stored levels,
+        or, if the store_levels instance attribute is False, simply counts all
+        the fold_events from the beginning of the document.
 
         """
+        if self.store_levels:
+            number = block.blockNumber()
+            self.update_levels(number - 1)
+            return self._levels.depth(number)
         depth = 0
         last = block.document().firstBlock()
-        if self.cache_depth_lines:
-            chunk = block.blockNumber() // self.cache_depth_lines
-            if chunk:
-                target = block.document().findBlockByNumber(chunk * self.cache_depth_lines)
-                if chunk <= len(self._depth_cache):
-                    depth = self._depth_cache[chunk - 1]
-                    last = target
-                else:
-                    # some values need to be computed first
-                    if self._depth_cache:
-                        depth = self._depth_cache[-1]
-                        last = block.document().findBlockByNumber(len(self._depth_cache) * self.cache_depth_lines)
-                    while last < target:
-                        depth += sum(self.fold_events(last))
-                        last = last.next()
-                        if last.blockNumber() % self.cache_depth_lines == 0:
-                            self._depth_cache.append(depth)
         while last < block:
             depth += sum(self.fold_events(last))
             last = last.next()
@@ -325,6 +614,8 @@ class Folder(QObject):
         find one more above that, etc. Use -1 to get the top-most region.
 
         """
+        if self.store_levels:
+            return self._stored_region(block, depth)
         start = None
         start_depth = 0
         count = 0
@@ -349,6 +640,39 @@ class Folder(QObject):
             if end:
                 return Region(start, end)
 
+    def _stored_region(self, block, depth):
+        """Implementation of region() using the stored levels."""
+        number = block.blockNumber()
+        self.update_levels(number)
+        levels = self._levels
+        # the region starts at the last block before where the depth drops
+        # below the depth after this block minus depth, or, if there is no
+        # such block, at the last block where the depth is lowest
+        after = levels.depth(number + 1)
+        start = levels.find_start(number + 1, after - depth) if depth > -1 else -1
+        if start == -1:
+            low = levels.lowest_start(number + 1)
+            if low >= after:
+                return
+            start = levels.find_start(number + 1, low + 1)
+        low = levels.bottom(start)
+        # the region ends at the first block where the depth drops to that
+        # of the start block, store the levels in growing chunks to find it
+        count = number + 1
+        while True:
+            valid = self.update_levels(count)
+            end = levels.find_end(number + 1, low)
+            if end != -1 and end < valid:
+                break
+            elif valid == len(levels):
+                if number + 1 == valid:
+                    return
+                end = valid - 1
+                break
+            count *= 2
+        doc = self.document()
+        return Region(doc.findBlockByNumber(start), doc.findBlockByNumber(end))
+
     def fold(self, block, depth=0):
         """Fold the region the block is in.
 